@@ -4,18 +4,30 @@ import { NextRequest, NextResponse } from 'next/server'
 const PI_SERVER_IP = process.env.PI_SERVER_IP || '192.168.1.152'
 const PI_SERVER_PORT = process.env.PI_SERVER_PORT || '5000'
 
+// Last Pi response, reused when the Pi answers 304 Not Modified
+let cachedEtag: string | null = null
+let cachedSensorData: any = null
+
 export async function GET(request: NextRequest) {
   try {
     // Try to fetch from Raspberry Pi (which receives ESP32 data)
     try {
       const piResponse = await fetch(`http://${PI_SERVER_IP}:${PI_SERVER_PORT}/sensor-data`, {
         method: 'GET',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          ...(cachedEtag ? { 'If-None-Match': cachedEtag } : {})
+        },
+        cache: 'no-store',
         signal: AbortSignal.timeout(2000) // 2 second timeout for Pi
       })
       
-      if (piResponse.ok) {
-        const sensorData = await piResponse.json()
+      if (piResponse.ok || (piResponse.status === 304 && cachedSensorData)) {
+        if (piResponse.status !== 304) {
+          cachedSensorData = await piResponse.json()
+          cachedEtag = piResponse.headers.get('ETag')
+        }
+        const sensorData = cachedSensorData
         return NextResponse.json({
           success: true,
           source: 'esp32_via_pi',
@@ -27,7 +39,9 @@ export async function GET(request: NextRequest) {
             phosphorus: parseFloat(sensorData.phosphorus) || 30,
             potassium: parseFloat(sensorData.potassium) || 80,
             humidity: parseFloat(sensorData.humidity) || 65,
-            timestamp: sensorData.timestamp || new Date().toISOString(),
+            timestamp: typeof sensorData.timestamp === 'number'
+              ? new Date(sensorData.timestamp * 1000).toISOString()
+              : sensorData.timestamp || new Date().toISOString(),
             last_heartbeat: sensorData.last_heartbeat || null
           }
         })
@@ -0,0 +1,36 @@
+import { NextRequest } from 'next/server'
+
+// Pi server connection settings (receives data from ESP32)
+const PI_SERVER_IP = process.env.PI_SERVER_IP || '192.168.1.152'
+const PI_SERVER_PORT = process.env.PI_SERVER_PORT || '5000'
+
+export const dynamic = 'force-dynamic'
+
+// Relay the Pi's Server-Sent Events stream so the browser gets readings as they arrive
+export async function GET(request: NextRequest) {
+  const device = request.nextUrl.searchParams.get('device')
+  const query = device ? `?device=${encodeURIComponent(device)}` : ''
+
+  try {
+    const piResponse = await fetch(`http://${PI_SERVER_IP}:${PI_SERVER_PORT}/sensor-data/stream${query}`, {
+      headers: { Accept: 'text/event-stream' },
+      cache: 'no-store',
+      signal: request.signal
+    })
+
+    if (!piResponse.ok || !piResponse.body) {
+      return new Response('Pi stream unavailable', { status: 502 })
+    }
+
+    return new Response(piResponse.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache, no-transform',
+        Connection: 'keep-alive'
+      }
+    })
+  } catch (error) {
+    console.log('Raspberry Pi stream failed:', error instanceof Error ? error.message : 'Unknown error')
+    return new Response('Pi stream unavailable', { status: 502 })
+  }
+}
@@ -126,6 +126,8 @@ export default function Dashboard() {
   const [data, setData] = useState(generateInitialMockData())
   const [currentSensorData, setCurrentSensorData] = useState<any>(null)
   const [alerts, setAlerts] = useState<string[]>([])
+  // True while the SSE stream is open; polling only runs when it is not
+  const [streamConnected, setStreamConnected] = useState(false)
   const [weatherCondition, setWeatherCondition] = useState("sunny")
   const [tractorPosition, setTractorPosition] = useState(0)
   const [activeSensor, setActiveSensor] = useState<string | null>(null)
@@ -288,32 +290,82 @@ export default function Dashboard() {
         sensorData
       ])
       
+      return sensorData
     } catch (error) {
       console.error('Failed to fetch real sensor data:', error)
       setSensorConnectionStatus('disconnected')
+      return null
     }
   }
 
-  // Update data every 5 seconds to match ESP32 transmission frequency
-  useEffect(() => {
-    const interval = setInterval(async () => {
-      // Fetch real sensor data
-      await fetchRealSensorData()
+  // Threshold alerts for one reading (streamed or polled)
+  const checkAlerts = (reading: any) => {
+    const newAlerts: string[] = []
+    if (reading.moisture < 35) {
+      newAlerts.push(`Low soil moisture detected: ${reading.moisture}%`)
+    }
+    if (reading.temperature > 25) {
+      newAlerts.push(`High temperature detected: ${reading.temperature}°C`)
+    }
+    if (reading.pH && parseFloat(String(reading.pH)) < 6.0) {
+      newAlerts.push(`Low soil pH detected: ${reading.pH}`)
+    }
+    if (newAlerts.length > 0) {
+      // Limit alerts to last 5
+      setAlerts(prev => [...prev, ...newAlerts].slice(-5))
+    }
+  }
 
-      // Check for alerts using current values
-      const latest = currentValues
-      if (latest.moisture < 35) {
-        setAlerts((prev) => [...prev, `Low soil moisture detected: ${latest.moisture}%`])
-      }
-      if (latest.temperature > 25) {
-        setAlerts((prev) => [...prev, `High temperature detected: ${latest.temperature}°C`])
-      }
-      if (latest.pH && parseFloat(latest.pH) < 6.0) {
-        setAlerts((prev) => [...prev, `Low soil pH detected: ${latest.pH}`])
+  // Push updates: apply each reading the Pi streams as soon as it is ingested
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return
+
+    const source = new EventSource('/api/sensor-stream')
+    // The browser reconnects on its own; polling covers the gap meanwhile
+    source.onopen = () => setStreamConnected(true)
+    source.onerror = () => setStreamConnected(false)
+    source.addEventListener('reading', (event) => {
+      const reading = JSON.parse((event as MessageEvent).data)
+      const update = {
+        time: new Date().toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" }),
+        moisture: reading.moisture,
+        temperature: reading.temperature,
+        pH: reading.pH?.toString(),
+        nitrogen: reading.nitrogen,
+        phosphorus: reading.phosphorus,
+        potassium: reading.potassium,
+        source: 'esp32_stream'
       }
+      setCurrentSensorData((prev: any) => ({ ...prev, ...update }))
+      setData(prevData => [...prevData.slice(1), { ...prevData[prevData.length - 1], ...update }])
+      setSensorConnectionStatus('connected')
+      setLastDataReceived(new Date())
+      checkAlerts(reading)
+    })
 
-      // Limit alerts to last 5
-      setAlerts(prev => prev.slice(-5))
+    return () => {
+      source.close()
+      setStreamConnected(false)
+    }
+  }, [])
+
+  // While streaming, readings arrive by push; only liveness is still checked, and rarely
+  useEffect(() => {
+    if (!streamConnected) return
+    const interval = setInterval(checkESP32Simple, 30000)
+    return () => clearInterval(interval)
+  }, [streamConnected])
+
+  // Every 5 seconds (the ESP32 transmission period): poll for readings only as a
+  // fallback when the stream is unavailable, and animate the farm scene
+  useEffect(() => {
+    const interval = setInterval(async () => {
+      if (!streamConnected) {
+        const reading = await fetchRealSensorData()
+        if (reading) {
+          checkAlerts(reading)
+        }
+      }
 
       // Update weather data periodically (every 5 minutes)
       if (Math.random() > 0.98 && userLocation) { // Very low chance to avoid too many API calls
@@ -329,7 +381,7 @@ export default function Dashboard() {
     }, 5000) // 5 seconds to match ESP32 transmission
 
     return () => clearInterval(interval)
-  }, [currentValues])
+  }, [streamConnected, userLocation, weatherData])
 
 
 
@@ -442,20 +494,23 @@ export default function Dashboard() {
         irrigation_type: farmerDetails.irrigationType
       }
 
-      const response = await fetch('/api/generate-health-card', {
+      // raw=1: the PNG comes back as the response body instead of base64 inside JSON
+      const response = await fetch('/api/generate-health-card?raw=1', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ sensorData, farmerData })
+        body: JSON.stringify({ sensorData, farmerData, format: 'png' })
       })
 
-      const result = await response.json()
+      const result = response.ok ? { success: true, blob: await response.blob() } : await response.json()
 
       if (result.success) {
         // Create download link for the image
+        const url = URL.createObjectURL(result.blob)
         const link = document.createElement('a')
-        link.href = `data:image/png;base64,${result.image}`
+        link.href = url
         link.download = `soil_health_card_${farmerDetails.name.replace(/\s+/g, '_')}_${new Date().toISOString().split('T')[0]}.png`
         link.click()
+        setTimeout(() => URL.revokeObjectURL(url), 1000)
         
         toast.success("Soil Health Card generated and downloaded successfully!")
         setShowHealthCardDialog(false)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Crash- and reader-safe file replacement
+
+atomic_write() writes to a temp file in the target's directory and renames
+it over the target, so anyone opening the path sees either the complete old
+file or the complete new one - never a truncated or half-written file.
+"""
+
+import os
+import tempfile
+
+
+def atomic_write(path, data, mode=0o644, fsync=True):
+    """Replace `path` with `data` (bytes or str) in one rename
+
+    fsync=True also flushes the data (and the rename) to disk before
+    returning, so the file survives a power cut; caches can skip it.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp, mode)  # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_directory(directory)
+    return len(data)
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Render benchmark and profiler for generate_health_card.py
+
+Times every phase of a card render separately, for each output format and dpi:
+  * per card: card text, cache key, template lookup, drawing the card text
+    on the template, image encoding (PNG/JPEG/WebP), base64; SVG is timed as
+    one string render, PDF as figure / patches / static text / card text / savefig
+  * template build (once per dpi): figure creation, static patches, static
+    text, rasterizing the layer, tight bbox
+The template and vector phases come from the `timer` hooks of
+generate_health_card.CardTemplate and render_vector_card, so the production
+code paths are what gets measured.
+Warm runs repeat the render in this process (card cache off) and report
+mean/p50/p95 per phase plus the tracemalloc peak of one render. Cold runs
+start a fresh python per case and time the imports and the first render,
+with the child's peak RSS. Results print as tables and can be saved as JSON,
+compared against an earlier run or profiled with cProfile.
+
+Usage:
+    python bench_health_card.py --output render.json
+    python bench_health_card.py --formats png,webp --dpis 72,150,300 --iterations 50
+    python bench_health_card.py --compare render.json --max-regression 15   # exit 1 on a slowdown
+    python bench_health_card.py --formats png --dpis 300 --no-cold --profile render.prof
+"""
+
+import argparse
+import base64
+import cProfile
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Everything heavy (numpy, PIL, matplotlib, the card module) is imported inside
+# the functions, so a cold child process can time those imports itself.
+
+VECTOR_FORMATS = ('svg', 'pdf')
+SAMPLE_DATE = '2026-01-15'
+SAMPLE_FARMER = {
+    'name': 'Ramesh Kumar',
+    'address': 'Plot 14, Canal Road',
+    'village': 'Khedi',
+    'sub_district': 'Sehore',
+    'district': 'Sehore',
+    'pin': '466001',
+    'mobile': '+91-9876543210',
+    'crop': 'wheat',
+}
+SAMPLE_SOIL = {
+    'temperature': 24.6,
+    'ph_level': 6.8,
+    'soil_moisture': 41.5,
+    'nitrogen': 38,
+    'phosphorus': 22,
+    'potassium': 95,
+    'timestamp': '2026-01-15T09:30:00Z',
+}
+
+
+class PhaseTimer:
+    """Seconds spent per named phase"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def __call__(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+
+def case_label(fmt, dpi):
+    return fmt if fmt in VECTOR_FORMATS else f"{fmt}@{dpi}"
+
+
+def build_template(dpi, timer):
+    """A fresh CardTemplate (bypassing the cache), its build steps timed; the result is thrown away"""
+    import generate_health_card as card
+    card.CardTemplate(card.FIGSIZE, dpi, timer=timer)
+
+
+def render_card(fmt, dpi, timer):
+    """What create_soil_health_card(..., cache=None) does, one timed phase at a time; returns the base64 text"""
+    import generate_health_card as card
+    with timer('card_text'):
+        items = card.card_text(SAMPLE_FARMER, SAMPLE_SOIL, SAMPLE_DATE)
+    with timer('cache_key'):
+        card.card_cache_key(items, dpi, card.FIGSIZE, fmt)
+    if fmt in VECTOR_FORMATS:
+        data = card.render_vector_card(items, fmt, card.FIGSIZE, timer=timer)
+    else:
+        with timer('template'):
+            template = card.get_static_template(card.FIGSIZE, dpi)
+        with timer('draw_text'):
+            pixels = template.render(items)
+        with timer('encode'):
+            data = card.encode_image(pixels, fmt, dpi)
+    with timer('base64'):
+        return base64.b64encode(data).decode()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = (len(ordered) - 1) * q / 100.0
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+def summarize_ms(samples):
+    ms = [s * 1000.0 for s in samples]
+    return {
+        'mean': round(sum(ms) / len(ms), 3),
+        'p50': round(percentile(ms, 50), 3),
+        'p95': round(percentile(ms, 95), 3),
+        'max': round(max(ms), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None
+
+    Linux keeps ru_maxrss across fork + exec, so a child started from a big
+    parent would report the parent's peak; VmHWM belongs to this process only.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0, 1)
+
+
+def traced_peak_mb(func, *args):
+    """Peak Python-heap growth (tracemalloc, numpy buffers included) while func runs"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024.0 * 1024.0), 2)
+
+
+def run_warm(fmt, dpi, iterations, warmup):
+    """Repeated renders in this process, after `warmup` untimed ones (which also build the template)"""
+    for _ in range(warmup):
+        encoded = render_card(fmt, dpi, PhaseTimer())
+    runs = []
+    for _ in range(iterations):
+        timer = PhaseTimer()
+        encoded = render_card(fmt, dpi, timer)
+        runs.append(timer.seconds)
+    phases = {name: summarize_ms([run[name] for run in runs]) for name in runs[0]}
+    return {
+        'iterations': iterations,
+        'total_ms': summarize_ms([sum(run.values()) for run in runs]),
+        'phases_ms': phases,
+        'base64_chars': len(encoded),
+        'tracemalloc_peak_mb': traced_peak_mb(render_card, fmt, dpi, PhaseTimer()),
+    }
+
+
+def run_template_build(dpi, runs):
+    """Template build phases at one dpi (median of `runs` builds) and the memory one build takes"""
+    timers = []
+    for _ in range(runs):
+        timer = PhaseTimer()
+        build_template(dpi, timer)
+        timers.append(timer.seconds)
+    phases = {name: round(percentile([t[name] for t in timers], 50) * 1000.0, 3) for name in timers[0]}
+    return {
+        'runs': runs,
+        'total_ms': round(percentile([sum(t.values()) for t in timers], 50) * 1000.0, 3),
+        'phases_ms': phases,
+        'tracemalloc_peak_mb': traced_peak_mb(build_template, dpi, PhaseTimer()),
+    }
+
+
+def cold_child(fmt, dpi):
+    """Runs in a fresh interpreter: time the imports and the first render, print JSON"""
+    timer = PhaseTimer()
+    with timer('import'):
+        import generate_health_card  # noqa: F401 - numpy, PIL, card_layout, soil_rating, ...
+    if fmt != 'svg':
+        with timer('import_matplotlib'):
+            import matplotlib.backends.backend_agg  # noqa: F401
+            import matplotlib.figure  # noqa: F401
+            import matplotlib.patches  # noqa: F401
+    encoded = render_card(fmt, dpi, timer)
+    print(json.dumps({'phases': timer.seconds, 'base64_chars': len(encoded), 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_cold(fmt, dpi, runs):
+    """`runs` fresh processes for one case; medians of their phases, wall time and peak RSS"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--cold-child', fmt, str(dpi or 0)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        process_seconds = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"cold run of {case_label(fmt, dpi)} failed:\n{completed.stderr.strip()}")
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample['process'] = process_seconds
+        samples.append(sample)
+    phases = {name: round(percentile([s['phases'][name] for s in samples], 50) * 1000.0, 3)
+              for name in samples[0]['phases']}
+    rss = [s['peak_rss_mb'] for s in samples if s['peak_rss_mb'] is not None]
+    return {
+        'runs': runs,
+        'total_ms': round(percentile([sum(s['phases'].values()) for s in samples], 50) * 1000.0, 3),
+        'process_ms': round(percentile([s['process'] for s in samples], 50) * 1000.0, 3),
+        'phases_ms': phases,
+        'peak_rss_mb': round(percentile(rss, 50), 1) if rss else None,
+    }
+
+
+def benchmark_cases(formats, dpis):
+    """(format, dpi) pairs to run; vector formats ignore dpi and run once"""
+    cases = []
+    for fmt in formats:
+        for dpi in ([None] if fmt in VECTOR_FORMATS else dpis):
+            cases.append((fmt, dpi))
+    return cases
+
+
+def run_benchmark(args):
+    import generate_health_card as card
+    formats = [f.strip().lower() for f in args.formats.split(',') if f.strip()]
+    dpis = [int(d) for d in args.dpis.split(',') if d.strip()]
+    for fmt in formats:  # fail early on a bad format or dpi
+        card.normalize_options(fmt, dpis[0] if dpis else card.DPI)
+    cases = benchmark_cases(formats, dpis)
+
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'figsize': list(card.FIGSIZE),
+        'warm': {},
+        'template_build': {},
+        'cold': {},
+    }
+
+    profiler = cProfile.Profile() if args.profile else None
+    for fmt, dpi in cases:
+        label = case_label(fmt, dpi)
+        print(f"🔥 warm {label}: {args.warmup} warmup + {args.iterations} renders")
+        if profiler:
+            profiler.enable()
+        result['warm'][label] = run_warm(fmt, dpi, args.iterations, args.warmup)
+        if profiler:
+            profiler.disable()
+
+    raster_dpis = sorted({dpi for fmt, dpi in cases if dpi is not None})
+    for dpi in raster_dpis:
+        if args.template_runs:
+            print(f"🧱 template build @{dpi} dpi x {args.template_runs}")
+            result['template_build'][str(dpi)] = run_template_build(dpi, args.template_runs)
+
+    if args.cold_runs:
+        for fmt, dpi in cases:
+            label = case_label(fmt, dpi)
+            print(f"🧊 cold {label}: {args.cold_runs} fresh processes")
+            result['cold'][label] = run_cold(fmt, dpi, args.cold_runs)
+
+    from bench_server import rss_mb
+    rss = rss_mb(os.getpid())
+    result['process'] = {'rss_mb': round(rss, 1) if rss is not None else None, 'peak_rss_mb': peak_rss_mb()}
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+        print(f"\n🔬 cProfile of the warm renders written to {args.profile} (top 20 by cumulative time):")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    return result
+
+
+def phase_line(phases, key=None):
+    return ', '.join(f"{name} {value[key] if key else value:.2f}" for name, value in phases.items())
+
+
+def print_report(result, baseline=None):
+    print(f"\n{'warm':<12}{'renders':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'b64 KB':>10}{'heap MB':>9}  (ms)")
+    for label, w in result['warm'].items():
+        total = w['total_ms']
+        print(f"{label:<12}{w['iterations']:>8}{total['mean']:>10.2f}{total['p50']:>10.2f}{total['p95']:>10.2f}"
+              f"{w['base64_chars'] / 1024:>10.1f}{w['tracemalloc_peak_mb']:>9.2f}")
+        print(f"{'':<12}p50: {phase_line(w['phases_ms'], 'p50')}")
+
+    if result['template_build']:
+        print(f"\n{'template':<12}{'total':>10}{'heap MB':>9}  (ms, median)")
+        for dpi, t in result['template_build'].items():
+            print(f"{dpi + ' dpi':<12}{t['total_ms']:>10.2f}{t['tracemalloc_peak_mb']:>9.2f}  {phase_line(t['phases_ms'])}")
+
+    if result['cold']:
+        print(f"\n{'cold':<12}{'render':>10}{'process':>10}{'RSS MB':>9}  (ms, median)")
+        for label, c in result['cold'].items():
+            rss = f"{c['peak_rss_mb']:>9.1f}" if c['peak_rss_mb'] is not None else f"{'-':>9}"
+            print(f"{label:<12}{c['total_ms']:>10.2f}{c['process_ms']:>10.2f}{rss}  {phase_line(c['phases_ms'])}")
+
+    process = result['process']
+    if process['peak_rss_mb'] is not None:
+        print(f"\n🧠 Benchmark process RSS: {process['rss_mb']} MB now, {process['peak_rss_mb']} MB peak")
+
+    if baseline:
+        print("\n📊 Compared to baseline (the numbers --max-regression checks):")
+        before = dict(gated_metrics(baseline))
+        for name, value in gated_metrics(result):
+            if name not in before:
+                print(f"  {name:<24} (not in baseline)")
+                continue
+            print(f"  {name:<24} {before[name]:>10.2f} -> {value:>10.2f} ms "
+                  f"({percent_change(before[name], value):+.1f}%)")
+
+
+def percent_change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def gated_metrics(result):
+    """(name, ms) for every number the regression gate checks: warm p50 and
+    p95 per case, the median template build per dpi and the median cold
+    render per case (imports plus first render; process start-up is left
+    out as too noisy)"""
+    for label, w in result.get('warm', {}).items():
+        yield f"{label} warm p50", w['total_ms']['p50']
+        yield f"{label} warm p95", w['total_ms']['p95']
+    for dpi, t in result.get('template_build', {}).items():
+        yield f"template@{dpi}", t['total_ms']
+    for label, c in result.get('cold', {}).items():
+        yield f"{label} cold", c['total_ms']
+
+
+def regressions(result, baseline, max_regression):
+    """Gated metrics that got slower than the baseline by more than max_regression percent"""
+    before = dict(gated_metrics(baseline))
+    return [name for name, value in gated_metrics(result)
+            if name in before and percent_change(before[name], value) > max_regression]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark and profile soil health card rendering')
+    parser.add_argument('--formats', default='png,jpeg,webp,svg,pdf', help='comma separated output formats')
+    parser.add_argument('--dpis', default='150,300', help='comma separated dpis for the raster formats')
+    parser.add_argument('--iterations', type=int, default=20, help='timed warm renders per case')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed renders before the timed ones')
+    parser.add_argument('--template-runs', type=int, default=3, help='template builds timed per dpi (0: skip)')
+    parser.add_argument('--cold-runs', type=int, default=3, help='fresh processes per case (0: skip)')
+    parser.add_argument('--no-cold', dest='cold_runs', action='store_const', const=0, help='skip the cold runs')
+    parser.add_argument('--profile', help='write a cProfile dump of the warm renders to this file')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float,
+                        help='with --compare: exit 1 if a warm p50/p95, template build or cold render '
+                             'is this many percent slower than the baseline')
+    parser.add_argument('--cold-child', nargs=2, metavar=('FORMAT', 'DPI'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_child:
+        fmt, dpi = args.cold_child
+        cold_child(fmt, int(dpi) or None)
+        sys.exit(0)
+    if args.iterations < 1:
+        parser.error('--iterations must be at least 1')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run_benchmark(args)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if baseline and args.max_regression is not None:
+        slower = regressions(result, baseline, args.max_regression)
+        if slower:
+            print(f"\n❌ Slower than baseline by more than {args.max_regression:g}%: {', '.join(slower)}")
+            sys.exit(1)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Load generator and latency benchmark for server.py
+
+Starts server.py --serve on a free local port (in a scratch directory, so the
+sensor log and heartbeat snapshot do not touch the real ones), then runs at
+the same time:
+  * N virtual ESP32 devices posting readings and heartbeats at fixed rates
+  * M dashboard pollers cycling through the GET endpoints the dashboard uses
+and reports throughput, p50/p95/p99 latency and error rate per endpoint plus
+the server's resident memory, as a table and as JSON.
+
+Usage:
+    python bench_server.py --devices 50 --duration 30 --output bench.json
+    python bench_server.py --devices 200 --post-rate 2 --pollers 8 --compare bench.json
+    python bench_server.py --url http://192.168.1.152:5000 --devices 5   # existing server
+    python bench_server.py --check --url http://192.168.1.152:5000        # connection test only
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+POLL_ENDPOINTS = ['/sensor-data', '/heartbeat-status', '/sensor-data', '/heartbeat-status?all=1', '/sensor-history']
+OK_STATUSES = (200, 304)
+
+
+class Recorder:
+    """Latencies and failures per endpoint label"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, label, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for label, samples in sorted(self.latencies.items()):
+            ms = np.asarray(samples) * 1000.0
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            errors = self.errors.get(label, 0)
+            endpoints[label] = {
+                'requests': len(ms),
+                'errors': errors,
+                'error_rate': round(errors / len(ms), 4),
+                'throughput_rps': round(len(ms) / duration, 2),
+                'latency_ms': {
+                    'mean': round(float(ms.mean()), 3),
+                    'p50': round(float(p50), 3),
+                    'p95': round(float(p95), 3),
+                    'p99': round(float(p99), 3),
+                    'max': round(float(ms.max()), 3)
+                }
+            }
+        requests_total = sum(e['requests'] for e in endpoints.values())
+        errors_total = sum(e['errors'] for e in endpoints.values())
+        totals = {
+            'requests': requests_total,
+            'errors': errors_total,
+            'error_rate': round(errors_total / requests_total, 4) if requests_total else 0.0,
+            'throughput_rps': round(requests_total / duration, 2)
+        }
+        return endpoints, totals
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after any failure"""
+
+    def __init__(self, base_url, recorder, timeout=10):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, label=None, body=None, headers=None):
+        label = label or f"{method} {path}"
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+            ok = response.status in OK_STATUSES
+            self.recorder.add(label, time.perf_counter() - started, ok)
+            return response
+        except (OSError, http.client.HTTPException):
+            self.recorder.add(label, time.perf_counter() - started, False)
+            self.close()
+            return None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def fake_reading(device_id, rng):
+    return {
+        'device_id': device_id,
+        'temperature': round(rng.uniform(18, 34), 1),
+        'pH': round(rng.uniform(5.5, 7.8), 2),
+        'moisture': round(rng.uniform(25, 75), 1),
+        'nitrogen': rng.randint(10, 80),
+        'phosphorus': rng.randint(10, 60),
+        'potassium': rng.randint(30, 120)
+    }
+
+
+def run_device(base_url, recorder, device_id, post_rate, heartbeat_rate, batch_size, stop):
+    """One virtual ESP32: readings every 1/post_rate s, heartbeats every 1/heartbeat_rate s"""
+    rng = random.Random(device_id)
+    client = Client(base_url, recorder)
+    now = time.monotonic()
+    # Stagger start times so devices do not fire in lockstep
+    next_post = now + rng.uniform(0, 1 / post_rate) if post_rate else None
+    next_beat = now + rng.uniform(0, 1 / heartbeat_rate) if heartbeat_rate else None
+    buffered = []
+    if next_post is None and next_beat is None:
+        return
+    while not stop.is_set():
+        due = min(t for t in (next_post, next_beat) if t is not None)
+        if stop.wait(max(0.0, due - time.monotonic())):
+            break
+        now = time.monotonic()
+        if next_post is not None and now >= next_post:
+            if batch_size > 1:
+                buffered.append(dict(fake_reading(device_id, rng), timestamp=time.time()))
+                if len(buffered) >= batch_size:
+                    client.request('POST', '/sensor-data/batch', body=buffered)
+                    buffered = []
+            else:
+                client.request('POST', '/sensor-data', body=fake_reading(device_id, rng))
+            next_post += 1 / post_rate
+        if next_beat is not None and now >= next_beat:
+            client.request('POST', '/esp32-heartbeat', body={'device_id': device_id, 'status': 'alive'})
+            next_beat += 1 / heartbeat_rate
+    client.close()
+
+
+def run_poller(base_url, recorder, rate, stop, seed):
+    """One dashboard tab: cycles through POLL_ENDPOINTS, sending If-None-Match like the Next.js route"""
+    client = Client(base_url, recorder)
+    etags = {}
+    index = seed
+    next_poll = time.monotonic() + random.Random(seed).uniform(0, 1 / rate)
+    while not stop.wait(max(0.0, next_poll - time.monotonic())):
+        path = POLL_ENDPOINTS[index % len(POLL_ENDPOINTS)]
+        headers = {'If-None-Match': etags[path]} if path in etags else None
+        response = client.request('GET', path, headers=headers)
+        if response is not None and response.getheader('ETag'):
+            etags[path] = response.getheader('ETag')
+        index += 1
+        next_poll += 1 / rate
+    client.close()
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MB (Linux /proc), or None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, workdir):
+    """server.py --serve on a free port; returns (process, base_url)"""
+    port = free_port()
+    log_path = os.path.join(workdir, 'server.out')
+    with open(log_path, 'wb') as log:  # the child keeps its own copy of the descriptor
+        process = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, '--serve', '--host', '127.0.0.1', '--port', str(port),
+             '--workers', str(workers)],
+            cwd=workdir, stdout=log, stderr=subprocess.STDOUT
+        )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode} (see {log_path})")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server.py did not start within 30s')
+
+
+def stop_server(process):
+    process.terminate()  # SIGTERM: server.py flushes the log and exits
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_benchmark(args):
+    workdir = None
+    process = None
+    pid = args.pid
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        workdir = tempfile.mkdtemp(prefix='bench-server-')
+        process, base_url = start_server(args.workers, workdir)
+        pid = process.pid
+        print(f"🚀 server.py --serve --workers {args.workers} at {base_url} (pid {pid}, data in {workdir})")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=run_device, daemon=True,
+                         args=(base_url, recorder, f'bench-{i:04d}', args.post_rate,
+                               args.heartbeat_rate, args.batch_size, stop))
+        for i in range(args.devices)
+    ]
+    threads += [
+        threading.Thread(target=run_poller, daemon=True, args=(base_url, recorder, args.poll_rate, stop, i))
+        for i in range(args.pollers)
+    ]
+
+    rss = {'start': rss_mb(pid) if pid else None, 'peak': None, 'end': None}
+    print(f"📈 {args.devices} devices x {args.post_rate}/s readings + {args.heartbeat_rate}/s heartbeats, "
+          f"{args.pollers} pollers x {args.poll_rate}/s, for {args.duration:g}s")
+    started = time.monotonic()
+    try:
+        for thread in threads:
+            thread.start()
+        while time.monotonic() - started < args.duration:
+            time.sleep(0.5)
+            current = rss_mb(pid) if pid else None
+            if current is not None:
+                rss['peak'] = max(rss['peak'] or 0.0, current)
+    except KeyboardInterrupt:
+        print("⏹️ Interrupted - reporting what was collected")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=15)
+        duration = time.monotonic() - started
+        rss['end'] = rss_mb(pid) if pid else None
+        if process is not None:
+            stop_server(process)
+        if workdir and not args.keep_data:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints, totals = recorder.summary(duration)
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'url': args.url, 'devices': args.devices, 'post_rate': args.post_rate,
+            'heartbeat_rate': args.heartbeat_rate, 'batch_size': args.batch_size,
+            'pollers': args.pollers, 'poll_rate': args.poll_rate,
+            'workers': None if args.url else args.workers, 'duration_s': args.duration
+        },
+        'duration_s': round(duration, 2),
+        'endpoints': endpoints,
+        'totals': totals,
+        'server': {'pid': pid, 'rss_mb': {k: round(v, 1) if v is not None else None for k, v in rss.items()}}
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"\n{'endpoint':<28}{'req':>8}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for label, e in result['endpoints'].items():
+        lat = e['latency_ms']
+        print(f"{label:<28}{e['requests']:>8}{e['throughput_rps']:>9.1f}{e['error_rate'] * 100:>7.2f}"
+              f"{lat['p50']:>9.2f}{lat['p95']:>9.2f}{lat['p99']:>9.2f}{lat['max']:>9.2f}")
+    totals = result['totals']
+    print(f"{'total':<28}{totals['requests']:>8}{totals['throughput_rps']:>9.1f}{totals['error_rate'] * 100:>7.2f}")
+    rss = result['server']['rss_mb']
+    if rss['peak'] is not None:
+        print(f"\n🧠 Server RSS: start {rss['start']} MB, peak {rss['peak']} MB, end {rss['end']} MB")
+
+    if baseline:
+        print("\n📊 Compared to baseline (p95 latency, throughput):")
+        for label, e in result['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(label)
+            if not before:
+                print(f"  {label:<28} (not in baseline)")
+                continue
+            p95, p95_before = e['latency_ms']['p95'], before['latency_ms']['p95']
+            change = (p95 - p95_before) / p95_before * 100 if p95_before else 0.0
+            print(f"  {label:<28} p95 {p95_before:.2f} -> {p95:.2f} ms ({change:+.1f}%), "
+                  f"{before['throughput_rps']:.1f} -> {e['throughput_rps']:.1f} rps")
+
+
+def check_connection(base_url):
+    """Quick reachability test of the endpoints the dashboard depends on"""
+    print("=== TESTING CONNECTION TO YOUR SERVER ===")
+    print(f"Server: {base_url}")
+    client = Client(base_url, Recorder(), timeout=5)
+    all_ok = True
+    for endpoint in ['/', '/sensor-data', '/heartbeat-status']:
+        response = client.request('GET', endpoint)
+        if response is not None and response.status == 200:
+            print(f"✅ GET {endpoint}")
+        else:
+            all_ok = False
+            print(f"❌ GET {endpoint} ({response.status if response is not None else 'no response'})")
+    client.close()
+    if not all_ok:
+        print(f"\nIf any fail, check that server.py is running at {base_url}")
+    return all_ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test server.py with simulated ESP32 devices and dashboards')
+    parser.add_argument('--url', help='benchmark an already running server instead of starting one')
+    parser.add_argument('--pid', type=int, help='pid of the --url server, to sample its RSS')
+    parser.add_argument('--check', action='store_true', help='only check that the main endpoints respond')
+    parser.add_argument('--workers', type=int, default=8, help='server.py --workers for the local server')
+    parser.add_argument('--devices', type=int, default=20, help='virtual ESP32 devices')
+    parser.add_argument('--post-rate', type=float, default=1.0, help='readings per second per device')
+    parser.add_argument('--heartbeat-rate', type=float, default=0.2, help='heartbeats per second per device')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='buffer this many readings per POST /sensor-data/batch (1: single posts)')
+    parser.add_argument('--pollers', type=int, default=4, help='simulated dashboard tabs')
+    parser.add_argument('--poll-rate', type=float, default=2.0, help='GET requests per second per poller')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run')
+    parser.add_argument('--keep-data', action='store_true',
+                        help="keep the local server's scratch directory (sensor log, server.out)")
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_connection((args.url or 'http://192.168.1.152:5000').rstrip('/')) else 1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run_benchmark(args)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
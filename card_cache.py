@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for rendered soil health cards
+
+Keys are hashes of everything that ends up on the card, so identical inputs
+map to the same entry regardless of how they were spelled in the request.
+Entries live in a byte-bounded in-memory LRU, backed by an optional
+size-capped directory that several worker processes can share.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from atomic_file import atomic_write
+
+
+def cache_key(*parts):
+    """sha256 over a JSON encoding of the parts (must be JSON-serializable)"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class CardCache:
+    """In-memory LRU of encoded image bytes with an optional on-disk tier"""
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None,
+                 max_disk_bytes=512 * 1024 * 1024, suffix='.card'):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.suffix = suffix
+
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                         'memory_evictions': 0, 'disk_evictions': 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def get(self, key):
+        """Image bytes for key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+        data = self._disk_read(key)
+        with self._lock:
+            if data is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store encoded image bytes"""
+        self._remember(key, data)
+        if self.disk_dir:
+            self._disk_write(key, data)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats.update({
+                'hit_ratio': (lookups - stats['misses']) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes
+            })
+        return stats
+
+    # -- memory tier -----------------------------------------------------
+
+    def _remember(self, key, data):
+        size = len(data)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.counters['memory_evictions'] += 1
+
+    # -- disk tier -------------------------------------------------------
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + self.suffix)
+
+    def _disk_entries(self):
+        """(mtime, path, size) for every cached file"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def _disk_read(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as the LRU clock for eviction
+            return data
+        except OSError:
+            return None
+
+    def _disk_write(self, key, data):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        # Write then rename so concurrent readers never see a partial image
+        try:
+            atomic_write(path, data, fsync=False)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Drop least recently used files until the tier is ~90% of its cap"""
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        target = self.max_disk_bytes * 0.9
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.counters['disk_evictions'] += 1
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Declarative Soil Health Card layout and a dependency-free SVG renderer
+
+CARD_LAYOUT describes the card as data on a 0-100 x 0-100 grid: titled
+boxes, tables (column widths, row heights, header cells, static cells and
+named slots that are filled per card) and free text, with shared STYLES.
+
+    layout_shapes()        -> static rectangles and text runs
+    place_values(values)   -> [(x, y, text, ha, fontsize), ...] for the slots
+    render_svg(items)      -> the whole card as SVG bytes
+
+Any backend only has to draw rectangles and text: render_svg() does it with
+string formatting (standard library only, a few milliseconds per card) and
+generate_health_card draws the same shapes with matplotlib for raster and
+PDF output.
+"""
+
+from xml.sax.saxutils import escape
+
+GREEN_HEADER = '#4CAF50'
+ORANGE_HEADER = '#FF9800'
+LIGHT_GREEN = '#E8F5E8'
+LIGHT_ORANGE = '#FFF3E0'
+
+STYLES = {
+    'title': {'fontsize': 16, 'weight': 'bold', 'color': 'white'},
+    'section': {'fontsize': 12, 'weight': 'bold', 'color': 'white'},
+    'subsection': {'fontsize': 10, 'weight': 'bold', 'color': 'white'},
+    'column_header': {'fontsize': 7, 'weight': 'bold'},
+    'cell': {'fontsize': 7},
+    'label': {'fontsize': 8},
+    'footer': {'fontsize': 11, 'weight': 'bold'},
+}
+SECTION_LINEWIDTH = 1
+CELL_LINEWIDTH = 0.5
+LINE_SPACING = 1.2  # multi-line text, as a multiple of the font size
+FONT_FAMILY = "'DejaVu Sans', 'Bitstream Vera Sans', Verdana, Arial, sans-serif"
+
+
+def slot(name):
+    """Table cell filled per card from values[name]"""
+    return {'slot': name}
+
+
+def box(x, y, width, height, fill, text=None, style='section', **overrides):
+    return {'type': 'box', 'rect': (x, y, width, height), 'fill': fill, 'text': text,
+            'style': dict(STYLES[style], **overrides)}
+
+
+FARMER_FIELDS = [
+    ('Name', 'name'), ('Address', 'address'), ('Village', 'village'), ('Sub-District', 'sub_district'),
+    ('District', 'district'), ('PIN', 'pin'), ('Mobile Number', 'mobile'),
+]
+
+TEST_HEADERS = ['S.\nNo.', 'Parameter', 'Test\nValue', 'Unit', 'Rating']
+TEST_ROWS = [
+    ('1', 'Temperature', '°C', 'temperature'),
+    ('2', 'pH Level', '', 'pH'),
+    ('3', 'Soil Moisture', '%', 'moisture'),
+    ('4', 'Nitrogen', 'ppm', 'nitrogen'),
+    ('5', 'Phosphorus', 'ppm', 'phosphorus'),
+    ('6', 'Potassium', 'ppm', 'potassium'),
+]
+
+SAMPLE_FIELDS = [
+    ('Soil Sample Number', slot('sample.number')),
+    ('Sample Collected on', slot('sample.date')),
+    ('Survey No.', 'SMART-001'),
+    ('Farm Size', '1.0 acres'),
+    ('Geo Position (GPS)', 'IoT Sensor Location'),
+    ('Irrigated / Rainfed', 'Smart Irrigation'),
+]
+
+FERT_HEADERS = ['Sl.\nNo.', 'Crop & Variety', 'Ref.\nYield', 'Fertilizer Combination-1\nfor N P K',
+                'Fertilizer Combination-2\nfor N P K']
+
+MICRO_PARAMS = [
+    ('1', 'Sulphur (S)', '20 kg/ha'),
+    ('2', 'Zinc (Zn)', '5 kg/ha'),
+    ('3', 'Boron (B)', '1 kg/ha'),
+    ('4', 'Iron (Fe)', '10 kg/ha'),
+    ('5', 'Manganese (Mn)', '5 kg/ha'),
+    ('6', 'Copper (Cu)', '2 kg/ha'),
+]
+
+GENERAL_RECS = [
+    ('1', 'Organic Manure', '5 tons/ha'),
+    ('2', 'Biofertilizer', 'Azotobacter + PSB'),
+    ('3', 'Lime / Gypsum', 'Gypsum 250 kg/ha'),
+]
+
+# Tables: `top` is the upper edge of the header (or of the first row without
+# one). Each column has a width and optionally an alignment ('left' texts sit
+# `indent` in from the cell edge), a font size and a cell height shorter than
+# the row pitch. Cells are strings, None (empty) or slot(name).
+CARD_LAYOUT = {
+    'grid': (100, 100),
+    'axes': (0.125, 0.11, 0.775, 0.77),  # grid placement on the page: left, bottom, width, height
+    'pad_inches': 0.1,                   # margin kept around the drawn content
+    'sections': [
+        box(2, 85, 96, 12, GREEN_HEADER, 'SOIL HEALTH CARD', 'title'),
+
+        box(2, 75, 48, 8, ORANGE_HEADER, "Farmer's Details"),
+        {
+            'type': 'table', 'x': 2, 'top': 73, 'row_height': 2, 'indent': 1,
+            'columns': [{'width': 24, 'align': 'left', 'style': 'label'},
+                        {'width': 24, 'align': 'left', 'style': 'label'}],
+            'rows': [[label, slot(f'farmer.{key}')] for label, key in FARMER_FIELDS],
+        },
+
+        box(52, 75, 46, 8, GREEN_HEADER, 'SOIL TEST RESULTS'),
+        {
+            'type': 'table', 'x': 52, 'top': 77, 'row_height': 2,
+            'header': {'cells': TEST_HEADERS, 'height': 4, 'fill': LIGHT_GREEN, 'style': 'column_header'},
+            'columns': [{'width': 4}, {'width': 18}, {'width': 8}, {'width': 8}, {'width': 8}],
+            'rows': [[sno, parameter, slot(f'test.{key}.value'), unit, slot(f'test.{key}.rating')]
+                     for sno, parameter, unit, key in TEST_ROWS]
+                    + [['7', 'Timestamp', slot('test.timestamp.value'), '', 'Current']],
+        },
+
+        box(2, 52, 48, 3, ORANGE_HEADER, 'Soil Sample Details', 'subsection'),
+        {
+            'type': 'table', 'x': 2, 'top': 51, 'row_height': 2, 'indent': 1,
+            'columns': [{'width': 24, 'align': 'left', 'style': 'label'},
+                        {'width': 24, 'align': 'left'}],
+            'rows': [[label, value] for label, value in SAMPLE_FIELDS],
+        },
+
+        box(52, 45, 46, 3, GREEN_HEADER, 'Fertilizer Recommendations for Reference Yield', fontsize=9),
+        {
+            'type': 'table', 'x': 52, 'top': 45, 'row_height': 4,
+            'header': {'cells': FERT_HEADERS, 'height': 3, 'fill': LIGHT_GREEN, 'style': 'column_header',
+                       'fontsize': 6},
+            'columns': [{'width': 3, 'height': 3, 'fontsize': 6}, {'width': 12, 'height': 3, 'fontsize': 6},
+                        {'width': 6, 'height': 3, 'fontsize': 6}, {'width': 12.5, 'fontsize': 5},
+                        {'width': 12.5, 'fontsize': 5}],
+            'rows': [['1', slot('fert.crop'), slot('fert.yield'), slot('fert.combo1'), slot('fert.combo2')],
+                     ['2', None, None, None, None],
+                     ['3', None, None, None, None]],
+        },
+
+        box(2, 32, 32, 3, GREEN_HEADER, 'Secondary & Micro Nutrients Recommendations', fontsize=8),
+        {
+            'type': 'table', 'x': 2, 'top': 32, 'row_height': 2.5,
+            'header': {'cells': ['S.\nNo.', 'Parameter', 'Recommendations for\nSoil Applications'],
+                       'height': 3, 'fill': LIGHT_GREEN, 'style': 'column_header'},
+            'columns': [{'width': 3}, {'width': 10}, {'width': 19}],
+            'rows': [list(row) for row in MICRO_PARAMS],
+        },
+
+        box(2, 11, 32, 2, ORANGE_HEADER, 'General Recommendations', fontsize=9),
+        {
+            'type': 'table', 'x': 2, 'top': 10, 'row_height': 3,
+            'columns': [{'width': 3}, {'width': 10}, {'width': 19}],
+            'rows': [list(row) for row in GENERAL_RECS],
+        },
+
+        {'type': 'text', 'x': 50, 'y': 5, 'text': 'Healthy Soil\nfor\na Healthy Farm', 'style': 'footer'},
+    ],
+}
+
+
+def _style(style, **overrides):
+    style = dict(STYLES[style] if isinstance(style, str) else style or {}, **overrides)
+    return style.get('fontsize', 7), style.get('weight', 'normal'), style.get('color', 'black')
+
+
+def _walk(layout):
+    """Yield ('rect', x, y, w, h, fill, linewidth), ('text', x, y, text, ha, fontsize, weight, color)
+    and ('slot', name, x, y, ha, fontsize) in drawing order"""
+    for section in layout['sections']:
+        kind = section['type']
+        if kind == 'box':
+            x, y, width, height = section['rect']
+            yield ('rect', x, y, width, height, section['fill'], SECTION_LINEWIDTH)
+            if section.get('text'):
+                yield ('text', x + width/2, y + height/2, section['text'], 'center') + _style(section['style'])
+        elif kind == 'text':
+            yield ('text', section['x'], section['y'], section['text'], section.get('ha', 'center')) + \
+                _style(section.get('style'))
+        elif kind == 'table':
+            yield from _walk_table(section)
+        else:
+            raise ValueError(f"unknown layout section type {kind!r}")
+
+
+def _walk_table(table):
+    columns, indent = table['columns'], table.get('indent', 1)
+    top = table['top']
+    header = table.get('header')
+    if header:
+        height = header['height']
+        x = table['x']
+        overrides = {'fontsize': header['fontsize']} if 'fontsize' in header else {}
+        for text, column in zip(header['cells'], columns):
+            yield ('rect', x, top - height, column['width'], height, header.get('fill', 'white'), CELL_LINEWIDTH)
+            yield ('text', x + column['width']/2, top - height/2, text, 'center') + \
+                _style(header.get('style', 'column_header'), **overrides)
+            x += column['width']
+        top -= height
+
+    pitch = table['row_height']
+    for row in table['rows']:
+        x = table['x']
+        for cell, column in zip(row, columns):
+            width, height = column['width'], column.get('height', pitch)
+            yield ('rect', x, top - height, width, height, 'white', CELL_LINEWIDTH)
+            if column.get('align', 'center') == 'left':
+                text_x, ha = x + indent, 'left'
+            else:
+                text_x, ha = x + width/2, 'center'
+            overrides = {'fontsize': column['fontsize']} if 'fontsize' in column else {}
+            fontsize, weight, color = _style(column.get('style', 'cell'), **overrides)
+            if isinstance(cell, dict):
+                yield ('slot', cell['slot'], text_x, top - height/2, ha, fontsize)
+            elif cell is not None:
+                yield ('text', text_x, top - height/2, cell, ha, fontsize, weight, color)
+            x += width
+        top -= pitch
+
+
+_compiled = {}
+
+
+def _compile(layout):
+    """(rects, texts, slots) for a layout, computed once per layout object"""
+    compiled = _compiled.get(id(layout))
+    if compiled is None or compiled[0] is not layout:
+        rects, texts, slots = [], [], {}
+        for shape in _walk(layout):
+            if shape[0] == 'rect':
+                rects.append(shape[1:])
+            elif shape[0] == 'text':
+                texts.append(shape[1:])
+            else:
+                slots[shape[1]] = shape[2:]
+        compiled = _compiled[id(layout)] = (layout, (rects, texts, slots))
+    return compiled[1]
+
+
+def layout_shapes(layout=CARD_LAYOUT):
+    """Static layer: ([(x, y, w, h, fill, linewidth)], [(x, y, text, ha, fontsize, weight, color)])"""
+    rects, texts, _ = _compile(layout)
+    return rects, texts
+
+
+def slot_names(layout=CARD_LAYOUT):
+    return list(_compile(layout)[2])
+
+
+def place_values(values, layout=CARD_LAYOUT):
+    """Slot values as positioned text items [(x, y, text, ha, fontsize)], in layout order
+
+    Slots without a value (or with None) are left empty.
+    """
+    items = []
+    for name, (x, y, ha, fontsize) in _compile(layout)[2].items():
+        value = values.get(name)
+        if value is not None:
+            items.append((x, y, str(value), ha, fontsize))
+    return items
+
+
+# -- SVG backend -------------------------------------------------------------
+
+def _number(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+class _Page:
+    """Maps grid coordinates to SVG user units (points) the way the matplotlib axes do"""
+
+    def __init__(self, layout, figsize):
+        left, bottom, width, height = layout['axes']
+        grid_width, grid_height = layout['grid']
+        page_width, page_height = figsize[0] * 72, figsize[1] * 72
+        self.x0, self.y0 = left * page_width, (1 - bottom) * page_height
+        self.sx, self.sy = width * page_width / grid_width, height * page_height / grid_height
+
+    def point(self, x, y):
+        return self.x0 + x * self.sx, self.y0 - y * self.sy
+
+
+def _text_extent(page, x, y, text, ha, fontsize):
+    """Approximate (x0, y0, x1, y1) of a text run in points, for the page bounds"""
+    lines = text.split('\n')
+    width = max(len(line) for line in lines) * fontsize * 0.6
+    height = len(lines) * fontsize * LINE_SPACING
+    px, py = page.point(x, y)
+    x0 = px if ha == 'left' else px - width if ha == 'right' else px - width/2
+    return x0, py - height/2, x0 + width, py + height/2
+
+
+def _svg_text(page, x, y, text, ha, fontsize, weight='normal', color='black'):
+    px, py = page.point(x, y)
+    anchor = {'left': 'start', 'right': 'end'}.get(ha, 'middle')
+    attrs = f'x="{_number(px)}" font-size="{_number(fontsize)}" text-anchor="{anchor}" dominant-baseline="central"'
+    if weight != 'normal':
+        attrs += f' font-weight="{weight}"'
+    if color != 'black':
+        attrs += f' fill="{color}"'
+    lines = text.split('\n')
+    if len(lines) == 1:
+        return f'<text {attrs} y="{_number(py)}">{escape(text)}</text>'
+    first = py - (len(lines) - 1) / 2 * fontsize * LINE_SPACING
+    spans = ''.join(
+        f'<tspan x="{_number(px)}" y="{_number(first + i * fontsize * LINE_SPACING)}">{escape(line)}</tspan>'
+        for i, line in enumerate(lines)
+    )
+    return f'<text {attrs}>{spans}</text>'
+
+
+_svg_static = {}
+
+
+def _static_svg(layout, figsize):
+    """(body, bounds) of the static layer, built once per layout and page size"""
+    key = (id(layout), tuple(figsize))
+    cached = _svg_static.get(key)
+    if cached is None or cached[0] is not layout:
+        page = _Page(layout, figsize)
+        rects, texts = layout_shapes(layout)
+        parts, extents = [], []
+        for x, y, width, height, fill, linewidth in rects:
+            px, py = page.point(x, y + height)
+            w, h = width * page.sx, height * page.sy
+            parts.append(f'<rect x="{_number(px)}" y="{_number(py)}" width="{_number(w)}" height="{_number(h)}" '
+                         f'fill="{fill}" stroke="black" stroke-width="{_number(linewidth)}"/>')
+            extents.append((px - linewidth/2, py - linewidth/2, px + w + linewidth/2, py + h + linewidth/2))
+        for x, y, text, ha, fontsize, weight, color in texts:
+            parts.append(_svg_text(page, x, y, text, ha, fontsize, weight, color))
+            extents.append(_text_extent(page, x, y, text, ha, fontsize))
+        # Like savefig(bbox_inches='tight'): the grid area plus anything drawn outside it, padded
+        grid_width, grid_height = layout['grid']
+        extents.append(page.point(0, grid_height) + page.point(grid_width, 0))
+        pad = layout.get('pad_inches', 0) * 72
+        bounds = (min(e[0] for e in extents) - pad, min(e[1] for e in extents) - pad,
+                  max(e[2] for e in extents) + pad, max(e[3] for e in extents) + pad)
+        cached = _svg_static[key] = (layout, page, '\n'.join(parts), bounds)
+    return cached[1:]
+
+
+def render_svg(items, figsize=(11.7, 8.3), layout=CARD_LAYOUT):
+    """The card as SVG bytes: the static layer plus place_values() items"""
+    page, static, (x0, y0, x1, y1) = _static_svg(layout, figsize)
+    width, height = x1 - x0, y1 - y0
+    dynamic = '\n'.join(_svg_text(page, x, y, text, ha, fontsize) for x, y, text, ha, fontsize in items)
+    svg = (
+        f'<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_number(width)}pt" height="{_number(height)}pt" '
+        f'viewBox="{_number(x0)} {_number(y0)} {_number(width)} {_number(height)}">\n'
+        f'<rect x="{_number(x0)}" y="{_number(y0)}" width="{_number(width)}" height="{_number(height)}" fill="white"/>\n'
+        f'<g font-family="{FONT_FAMILY}">\n'
+        f'{static}\n{dynamic}\n</g>\n</svg>\n'
+    )
+    return svg.encode('utf-8')
@@ -1,282 +1,645 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.patches import Rectangle
 import numpy as np
-from datetime import datetime
+from PIL import Image
+from datetime import date, datetime
+import multiprocessing
+import threading
+import argparse
+import queue
+import json
+import sys
+import os
+import time
 import io
+import tempfile
 import base64
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from atomic_file import atomic_write
+from card_cache import CardCache, cache_key
+from card_layout import CARD_LAYOUT, layout_shapes, place_values, render_svg
+from soil_rating import rate, recommend
+from server_metrics import MetricsRegistry
+
+# Card geometry (A4 landscape); the layout itself is card_layout.CARD_LAYOUT
+FIGSIZE = (11.7, 8.3)
+DPI = 300
+PAD_INCHES = CARD_LAYOUT['pad_inches']  # same padding savefig(bbox_inches='tight') uses
+
+# Output formats: raster ones are encoded from the cached template pixels,
+# SVG comes from the string renderer in card_layout, PDF from a full figure draw
+FORMATS = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+VECTOR_FORMATS = ('svg', 'pdf')
+JPEG_QUALITY = 90
+MIN_DPI = 36
+MAX_DPI = 600
+
+# Bump whenever the layout or drawing code changes, so cached cards from older layouts are not reused
+CARD_LAYOUT_VERSION = 2
+
+# Rendered cards by content hash (a disk tier can be added with --cache-dir in worker mode)
+card_cache = CardCache(max_memory_bytes=64 * 1024 * 1024)
+
+# Worker-mode instrumentation ({"command": "metrics"} / --metrics-file, Prometheus text format)
+render_metrics = MetricsRegistry()
+render_latency = render_metrics.histogram(
+    'health_card_render_seconds', 'Render time inside a worker process, by format', ('format',))
+render_requests = render_metrics.counter(
+    'health_card_requests_total', 'Card requests by outcome (rendered, cached, coalesced, error)', ('result',))
+
+# Static layers, one per (figsize, dpi), least recently used first. Each holds a
+# full-page RGBA background (about 70 MB at 300 dpi), so only a few are kept.
+MAX_TEMPLATES = 4
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+_extents = {}  # figsize -> cropped card (width, height) in inches, for thumbnail_dpi
+
+
+def _untimed(phase):
+    """Default phase hook: `timer(phase)` wraps each build step; this one measures nothing"""
+    return nullcontext()
+
+
+def _new_card_axes(figsize, dpi, layout=CARD_LAYOUT):
+    """Figure + axes spanning the layout grid, without pyplot's global state"""
+    # matplotlib is only needed for raster/PDF output, so it is imported on first use
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize, dpi=dpi, facecolor='white')
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes(layout['axes'])
+    grid_width, grid_height = layout['grid']
+    ax.set_xlim(0, grid_width)
+    ax.set_ylim(0, grid_height)
+    ax.axis('off')
+    return fig, ax
+
+
+def _draw_static_layout(ax, layout=CARD_LAYOUT, timer=_untimed):
+    """Everything that is identical on every card: boxes, grids, labels, fixed tables"""
+    from matplotlib.patches import Rectangle
+    rects, texts = layout_shapes(layout)
+    with timer('patches'):
+        for x, y, width, height, fill, linewidth in rects:
+            ax.add_patch(Rectangle((x, y), width, height, facecolor=fill, edgecolor='black', linewidth=linewidth))
+    with timer('static_text'):
+        for x, y, text, ha, fontsize, weight, color in texts:
+            ax.text(x, y, text, ha=ha, va='center', fontsize=fontsize, weight=weight, color=color)
+
+
+def _tight_bbox(fig, figsize):
+    """Area savefig(bbox_inches='tight') keeps, in figure inches"""
+    from matplotlib.transforms import Bbox
+    tight = fig.get_tightbbox(fig.canvas.get_renderer()).padded(PAD_INCHES)
+    return Bbox.intersection(tight, Bbox.from_bounds(0, 0, *figsize))
 
-def create_soil_health_card(farmer_data, soil_test_results, recommendations):
+
+class CardTemplate:
+    """A card figure whose static layout has been rasterized once
+
+    Each render restores the saved background pixels (Agg blitting) and draws
+    only the per-card text artists on top, then removes them again. Renders
+    share the figure, so they are serialized on `lock`. The build steps run
+    under `timer` (figure, patches, static_text, draw, tight_bbox).
+    """
+
+    def __init__(self, figsize=FIGSIZE, dpi=DPI, timer=_untimed):
+        self.figsize = tuple(figsize)
+        self.dpi = dpi
+        self.lock = threading.Lock()
+        with timer('figure'):
+            self.fig, self.ax = _new_card_axes(self.figsize, dpi)
+        _draw_static_layout(self.ax, timer=timer)
+
+        canvas = self.fig.canvas
+        with timer('draw'):
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+
+        # Same crop savefig(bbox_inches='tight') would apply, as pixel rows/columns
+        with timer('tight_bbox'):
+            tight = _tight_bbox(self.fig, self.figsize)
+        height = int(canvas.get_renderer().height)
+        self.crop = (
+            int(np.floor(tight.x0 * dpi)), int(np.floor(height - tight.y1 * dpi)),
+            int(np.ceil(tight.x1 * dpi)), int(np.ceil(height - tight.y0 * dpi))
+        )
+
+    def render(self, items):
+        """RGB pixels of the cropped card with the card_text() items drawn on top"""
+        left, top, right, bottom = self.crop
+        with self.lock:
+            canvas = self.fig.canvas
+            canvas.restore_region(self.background)
+            artists = [
+                self.ax.text(x, y, text, ha=ha, va='center', fontsize=fontsize)
+                for x, y, text, ha, fontsize in items
+            ]
+            try:
+                for artist in artists:
+                    self.ax.draw_artist(artist)
+                pixels = np.asarray(canvas.buffer_rgba())[top:bottom, left:right, :3].copy()
+            finally:
+                for artist in artists:
+                    artist.remove()
+        return pixels
+
+
+def get_static_template(figsize=FIGSIZE, dpi=DPI):
+    """Cached CardTemplate for this size and dpi (built on first use)
+
+    At most MAX_TEMPLATES are kept; the least recently used one is dropped.
+    """
+    key = (tuple(figsize), dpi)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = CardTemplate(figsize, dpi)
+            while len(_templates) > MAX_TEMPLATES:
+                _templates.popitem(last=False)
+        else:
+            _templates.move_to_end(key)
+    return template
+
+
+def resolve_card_date(card_date=None):
+    """Card date as a date (accepts date/datetime, 'dd/mm/YYYY' or ISO strings; default today)"""
+    if card_date is None:
+        return date.today()
+    if isinstance(card_date, datetime):
+        return card_date.date()
+    if isinstance(card_date, date):
+        return card_date
+    try:
+        return datetime.strptime(card_date, '%d/%m/%Y').date()
+    except ValueError:
+        return date.fromisoformat(card_date[:10])
+
+
+# Printed when farmer_data lacks a field
+FARMER_DEFAULTS = {
+    'name': 'Smart Farm User',
+    'address': 'Smart Farm Location',
+    'village': 'Digital Farm',
+    'sub_district': 'IoT District',
+    'district': 'Smart Agriculture',
+    'pin': '000000',
+    'mobile': '+91-XXXXXXXXXX',
+}
+
+
+def card_values(farmer_data, soil_test_results, card_date=None, sample_number=None):
+    """Per-card text keyed by card_layout slot name ('farmer.name', 'test.pH.rating', ...)
+
+    Ratings and the recommendation use the thresholds of farmer_data['crop']
+    (see soil_rating).
+    """
+    crop = farmer_data.get('crop')
+    card_date = resolve_card_date(card_date)
+    if sample_number is None:
+        sample_number = f"SHC{card_date.strftime('%Y%m%d')}001"
+
+    values = {f'farmer.{key}': str(farmer_data.get(key, default)) for key, default in FARMER_DEFAULTS.items()}
+
+    # Test results: Test Value and Rating for each row of the static table
+    measured = {
+        'temperature': soil_test_results.get('temperature', '0'),
+        'pH': soil_test_results.get('ph_level', soil_test_results.get('pH', '0')),
+        'moisture': soil_test_results.get('soil_moisture', soil_test_results.get('moisture', '0')),
+        'nitrogen': soil_test_results.get('nitrogen', '0'),
+        'phosphorus': soil_test_results.get('phosphorus', '0'),
+        'potassium': soil_test_results.get('potassium', '0'),
+    }
+    measured['timestamp'] = soil_test_results.get('timestamp', soil_test_results.get('datetime', 'Current'))
+    for key, value in measured.items():
+        # Truncate long (timestamp) values
+        display_data = str(value)
+        if len(display_data) > 10:
+            display_data = display_data[:10] + '...'
+        values[f'test.{key}.value'] = display_data
+        if key != 'timestamp':
+            values[f'test.{key}.rating'] = rate(key, value, crop)
+
+    values['sample.number'] = str(sample_number)
+    values['sample.date'] = card_date.strftime('%d/%m/%Y')
+
+    # Recommendations based on soil test results (fertilizer rows 2 and 3 stay empty)
+    recs = recommend(soil_test_results.get('nitrogen'), soil_test_results.get('phosphorus'),
+                     soil_test_results.get('potassium'), crop)
+    values.update({
+        'fert.crop': recs['crop'],
+        'fert.yield': recs['yield'],
+        'fert.combo1': recs['fert_combo1'],
+        'fert.combo2': recs['fert_combo2'],
+    })
+    return values
+
+
+def card_text(farmer_data, soil_test_results, card_date=None, sample_number=None):
+    """Every per-card string with its position: [(x, y, text, ha, fontsize), ...]
+
+    This is the complete dynamic content of a card (card_values() placed on
+    CARD_LAYOUT), so it also serves as the normalized form that cache keys
+    are computed from.
+    """
+    return place_values(card_values(farmer_data, soil_test_results, card_date, sample_number))
+
+
+def encode_png(pixels, dpi=DPI):
+    """PNG bytes for an RGB pixel array"""
+    return encode_image(pixels, 'png', dpi)
+
+
+def encode_image(pixels, fmt='png', dpi=DPI, quality=JPEG_QUALITY):
+    """PNG/JPEG/WebP bytes for an RGB pixel array"""
+    buffer = io.BytesIO()
+    if fmt == 'png':
+        Image.fromarray(pixels).save(buffer, format='png', dpi=(dpi, dpi))
+    else:
+        Image.fromarray(pixels).save(buffer, format=fmt, dpi=(dpi, dpi), quality=quality)
+    return buffer.getvalue()
+
+
+def render_vector_card(items, fmt, figsize=FIGSIZE, timer=_untimed):
+    """SVG/PDF bytes: the full layout drawn as vectors (the raster template does not apply)
+
+    SVG is written directly from the layout spec, without matplotlib. PDF
+    steps run under `timer` (figure, patches, static_text, draw_text, encode;
+    encode includes savefig's tight bbox).
+    """
+    if fmt == 'svg':
+        with timer('svg'):
+            return render_svg(items, figsize)
+    with timer('figure'):
+        fig, ax = _new_card_axes(figsize, 72)
+    _draw_static_layout(ax, timer=timer)
+    with timer('draw_text'):
+        for x, y, text, ha, fontsize in items:
+            ax.text(x, y, text, ha=ha, va='center', fontsize=fontsize)
+    with timer('encode'):
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, bbox_inches='tight', pad_inches=PAD_INCHES, facecolor='white')
+    return buffer.getvalue()
+
+
+def card_extent(figsize=FIGSIZE):
+    """(width, height) in inches of the cropped card
+
+    The crop is measured in figure inches, so it is the same at every dpi
+    and is found once per figsize on a throwaway low-dpi figure rather than
+    on a full CardTemplate.
+    """
+    key = tuple(figsize)
+    extent = _extents.get(key)
+    if extent is None:
+        fig, ax = _new_card_axes(key, MIN_DPI)
+        _draw_static_layout(ax)
+        tight = _tight_bbox(fig, key)
+        extent = _extents[key] = (tight.width, tight.height)
+    return extent
+
+
+def thumbnail_dpi(thumbnail, dpi=DPI, figsize=FIGSIZE):
+    """Lowest render dpi whose cropped output still fills a (max width, max height) thumbnail box"""
+    width_inches, height_inches = card_extent(figsize)
+    # The box is filled along whichever side limits the aspect-preserving fit
+    needed = min(thumbnail[0] / width_inches, thumbnail[1] / height_inches)
+    return int(min(dpi, max(MIN_DPI, np.ceil(needed) + 1)))
+
+
+def normalize_options(fmt='png', dpi=DPI, thumbnail=None):
+    """Validated (format, dpi, thumbnail); dpi and thumbnail are None for vector formats"""
+    fmt = str(fmt or 'png').lower()
+    fmt = 'jpeg' if fmt == 'jpg' else fmt
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r} (choose from {', '.join(FORMATS)})")
+    if fmt in VECTOR_FORMATS:
+        return fmt, None, None
+    dpi = int(dpi or DPI)
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise ValueError(f"dpi must be between {MIN_DPI} and {MAX_DPI}")
+    if thumbnail:
+        thumbnail = tuple(int(v) for v in thumbnail)
+        if len(thumbnail) != 2 or min(thumbnail) <= 0:
+            raise ValueError("thumbnail must be [max width, max height] in pixels")
+    return fmt, dpi, thumbnail or None
+
+
+def card_cache_key(items, dpi=DPI, figsize=FIGSIZE, fmt='png', thumbnail=None, quality=JPEG_QUALITY):
+    return cache_key(CARD_LAYOUT_VERSION, list(figsize), dpi, fmt, thumbnail, quality, items)
+
+
+def render_soil_health_card(farmer_data, soil_test_results, fmt='png', dpi=DPI, figsize=FIGSIZE,
+                            thumbnail=None, quality=JPEG_QUALITY, card_date=None, sample_number=None,
+                            cache=card_cache):
+    """
+    Encoded card bytes in any of FORMATS
+
+    Raster formats are drawn on the static template at `dpi`; a thumbnail
+    (max width, max height) in pixels renders at just enough dpi and then
+    shrinks to fit. 'svg' and 'pdf' are vector output and ignore dpi.
+    Identical cards are served from `cache`.
+    """
+    fmt, dpi, thumbnail = normalize_options(fmt, dpi, thumbnail)
+    items = card_text(farmer_data, soil_test_results, card_date, sample_number)
+    key = card_cache_key(items, dpi, figsize, fmt, thumbnail, quality)
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+    if fmt in VECTOR_FORMATS:
+        data = render_vector_card(items, fmt, figsize)
+    elif thumbnail:
+        render_dpi = thumbnail_dpi(thumbnail, dpi, figsize)
+        image = Image.fromarray(get_static_template(figsize, render_dpi).render(items))
+        image.thumbnail(thumbnail, Image.LANCZOS)
+        data = encode_image(np.asarray(image), fmt, render_dpi, quality)
+    else:
+        data = encode_image(get_static_template(figsize, dpi).render(items), fmt, dpi, quality)
+
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+def save_soil_health_card(path, farmer_data, soil_test_results, fmt=None, **kwargs):
+    """Render straight to a file (format taken from the extension unless given); returns path"""
+    if fmt is None:
+        fmt = os.path.splitext(path)[1].lstrip('.') or 'png'
+    data = render_soil_health_card(farmer_data, soil_test_results, fmt=fmt, **kwargs)
+    atomic_write(path, data)
+    return path
+
+
+def create_soil_health_card(farmer_data, soil_test_results, recommendations, dpi=DPI, figsize=FIGSIZE,
+                            card_date=None, sample_number=None, cache=card_cache, fmt='png', thumbnail=None):
     """
     Generate a Soil Health Card similar to the government format
     Returns base64 encoded image
+
+    Boxes, headers and fixed tables come from a static layer rendered once
+    per size and dpi; only the farmer/soil specific text is drawn per call.
+    card_date (default today) and sample_number (default derived from the
+    date) are printed on the card. Use render_soil_health_card() for raw
+    bytes.
     """
-    # Create figure with specific dimensions (A4 landscape)
-    fig, ax = plt.subplots(1, 1, figsize=(11.7, 8.3))
-    ax.set_xlim(0, 100)
-    ax.set_ylim(0, 100)
-    ax.axis('off')
+    data = render_soil_health_card(farmer_data, soil_test_results, fmt=fmt, dpi=dpi, figsize=figsize,
+                                   thumbnail=thumbnail, card_date=card_date, sample_number=sample_number,
+                                   cache=cache)
+    return base64.b64encode(data).decode()
+
+
+# -- Worker mode: long-running renderer fed JSON lines on stdin -------------
+
+# A request is {id, farmerData, sensorData, cardDate, sampleNumber} plus optional
+# format ('png'), dpi, thumbnail ([w, h]), quality and output ('base64' or 'path')
+
+def job_cache_key(job):
+    """Cache key of the card a request asks for (same key render_soil_health_card uses)"""
+    fmt, dpi, thumbnail = normalize_options(job.get('format'), job.get('dpi'), job.get('thumbnail'))
+    items = card_text(job.get('farmerData') or {}, job.get('sensorData') or {},
+                      job.get('cardDate'), job.get('sampleNumber'))
+    return card_cache_key(items, dpi, FIGSIZE, fmt, thumbnail, job.get('quality') or JPEG_QUALITY)
+
+
+def render_job_data(job, cache=card_cache):
+    """Render one request into {id, success, data (raw bytes) | error}"""
+    try:
+        started = time.perf_counter()
+        data = render_soil_health_card(
+            job.get('farmerData') or {}, job.get('sensorData') or {},
+            fmt=job.get('format') or 'png', dpi=job.get('dpi') or DPI, thumbnail=job.get('thumbnail'),
+            quality=job.get('quality') or JPEG_QUALITY, card_date=job.get('cardDate'),
+            sample_number=job.get('sampleNumber'), cache=cache
+        )
+        return {'id': job.get('id'), 'success': True, 'data': data,
+                'renderSeconds': round(time.perf_counter() - started, 6)}
+    except Exception as e:
+        return {'id': job.get('id'), 'success': False, 'error': str(e)}
+
+
+def job_response(job, result, output_dir=None):
+    """JSON-safe response: the image as base64, or written to a file under output_dir"""
+    if not result.get('success'):
+        return result
+    result = dict(result)
+    data = result.pop('data')
+    fmt = normalize_options(job.get('format'))[0]
+    result['mimeType'] = FORMATS[fmt]
+    if job.get('output') == 'path':
+        fd, path = tempfile.mkstemp(prefix='health-card-', suffix='.' + fmt, dir=output_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        result['path'] = path
+    else:
+        result['image'] = base64.b64encode(data).decode()
+    return result
+
+
+def render_job(job, cache=card_cache, output_dir=None):
+    """Render one request into a response dict"""
+    return job_response(job, render_job_data(job, cache), output_dir)
+
+
+def _worker_main(conn):
+    """Worker process: build the static layer up front, then render jobs until the pipe closes"""
+    get_static_template()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        conn.send(render_job_data(job, cache=None))  # the parent process owns the cache
+
 
-    # Colors
-    green_header = '#4CAF50'
-    orange_header = '#FF9800'
-    light_green = '#E8F5E8'
-    light_orange = '#FFF3E0'
-
-    # Header Section
-    header_rect = Rectangle((2, 85), 96, 12, facecolor=green_header, edgecolor='black', linewidth=1)
-    ax.add_patch(header_rect)
-
-    # Title
-    ax.text(50, 91, 'SOIL HEALTH CARD', ha='center', va='center', fontsize=16, weight='bold', color='white')
-
-    # Farmer Details Section
-    farmer_header = Rectangle((2, 75), 48, 8, facecolor=orange_header, edgecolor='black', linewidth=1)
-    ax.add_patch(farmer_header)
-    ax.text(26, 79, "Farmer's Details", ha='center', va='center', fontsize=12, weight='bold', color='white')
-
-    # Farmer details fields
-    farmer_fields = [
-        ('Name', farmer_data.get('name', 'Smart Farm User')),
-        ('Address', farmer_data.get('address', 'Smart Farm Location')),
-        ('Village', farmer_data.get('village', 'Digital Farm')),
-        ('Sub-District', farmer_data.get('sub_district', 'IoT District')),
-        ('District', farmer_data.get('district', 'Smart Agriculture')),
-        ('PIN', farmer_data.get('pin', '000000')),
-        ('Mobile Number', farmer_data.get('mobile', '+91-XXXXXXXXXX'))
-    ]
-
-    y_pos = 73
-    for field, value in farmer_fields:
-        farmer_field_rect = Rectangle((2, y_pos-2), 24, 2, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(farmer_field_rect)
-        ax.text(3, y_pos-1, field, ha='left', va='center', fontsize=8)
-
-        farmer_value_rect = Rectangle((26, y_pos-2), 24, 2, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(farmer_value_rect)
-        ax.text(27, y_pos-1, str(value), ha='left', va='center', fontsize=8)
-
-        y_pos -= 2
-
-    # Soil Test Results Section
-    test_header = Rectangle((52, 75), 46, 8, facecolor=green_header, edgecolor='black', linewidth=1)
-    ax.add_patch(test_header)
-    ax.text(75, 79, 'SOIL TEST RESULTS', ha='center', va='center', fontsize=12, weight='bold', color='white')
-
-    # Test results table headers
-    headers = ['S.\nNo.', 'Parameter', 'Test\nValue', 'Unit', 'Rating']
-    header_widths = [4, 18, 8, 8, 8]
-    x_start = 52
-
-    for i, (header, width) in enumerate(zip(headers, header_widths)):
-        header_rect = Rectangle((x_start, 73), width, 4, facecolor=light_green, edgecolor='black', linewidth=0.5)
-        ax.add_patch(header_rect)
-        ax.text(x_start + width/2, 75, header, ha='center', va='center', fontsize=7, weight='bold')
-        x_start += width
-
-    # Get rating based on value
-    def get_rating(param, value):
+class RenderPool:
+    """Fixed set of warm render processes behind a bounded job queue
+
+    Each process is driven by its own dispatcher thread. A job that runs past
+    `timeout` seconds gets its process killed and replaced, so one stuck card
+    cannot wedge the pool. submit() never blocks: when the queue is full the
+    callback immediately receives a 'busy' error.
+    """
+
+    def __init__(self, processes=2, queue_size=32, timeout=30.0):
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context('spawn')
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._dispatch, name=f"render-dispatch-{i}", daemon=True)
+            for i in range(processes)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job, callback):
         try:
-            val = float(value)
-            if param == 'temperature':
-                if 20 <= val <= 30: return 'Optimal'
-                elif 15 <= val <= 35: return 'Good'
-                else: return 'Poor'
-            elif param == 'ph':
-                if 6.0 <= val <= 7.5: return 'Optimal'
-                elif 5.5 <= val <= 8.0: return 'Good'
-                else: return 'Poor'
-            elif param == 'moisture':
-                if 40 <= val <= 70: return 'Optimal'
-                elif 30 <= val <= 80: return 'Good'
-                else: return 'Poor'
-            elif param in ['nitrogen', 'phosphorus', 'potassium']:
-                if val >= 50: return 'High'
-                elif val >= 25: return 'Medium'
-                else: return 'Low'
+            self._jobs.put_nowait((job, callback))
+        except queue.Full:
+            callback({'id': job.get('id'), 'success': False, 'error': 'busy: render queue is full'})
+
+    def close(self):
+        """Finish queued jobs, then stop every worker process"""
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _dispatch(self):
+        process, conn = self._spawn()
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            job, callback = item
+            try:
+                conn.send(job)
+                if conn.poll(self.timeout):
+                    result = conn.recv()
+                else:
+                    result = {'id': job.get('id'), 'success': False,
+                              'error': f'timeout: render took longer than {self.timeout:g}s'}
+                    process.kill()
+                    process.join()
+                    process, conn = self._spawn()
+            except (EOFError, OSError) as e:
+                # Worker died mid-job (e.g. OOM killed); replace it
+                result = {'id': job.get('id'), 'success': False, 'error': f'worker crashed: {e}'}
+                process.join(timeout=1)
+                process, conn = self._spawn()
+            callback(result)
+        conn.close()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+
+
+def write_metrics_file(path):
+    """Prometheus textfile-collector output, replaced atomically"""
+    atomic_write(path, render_metrics.render(), fsync=False)
+
+
+def run_worker(processes, queue_size, timeout, cache=card_cache, output_dir=None, metrics_file=None):
+    """Serve JSON-lines requests from stdin, one JSON response line per request on stdout
+
+    Repeat cards are answered from `cache` without touching the pool, and a
+    request for a card that is already being rendered waits for that render
+    instead of queueing a second one. Render processes hand back raw bytes;
+    base64 is only produced for requests that did not ask for output='path'
+    (files go to output_dir).
+    {"id": ..., "command": "stats"} returns the cache counters and
+    {"id": ..., "command": "metrics"} the render metrics; with metrics_file
+    they are also written there (at most once a second).
+    """
+    write_lock = threading.Lock()
+    last_metrics_write = [0.0]
+    in_flight = {}  # cache key -> jobs waiting on the render already queued for it
+    in_flight_lock = threading.Lock()
+
+    def respond(result):
+        line = json.dumps(result)
+        with write_lock:
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+            if metrics_file and time.monotonic() - last_metrics_write[0] >= 1.0:
+                last_metrics_write[0] = time.monotonic()
+                write_metrics_file(metrics_file)
+
+    def respond_and_cache(job, key):
+        def callback(result):
+            if result.get('success'):
+                cache.put(key, result['data'])
+                render_requests.inc(1, 'rendered')
+                render_latency.observe(result['renderSeconds'], normalize_options(job.get('format'))[0])
             else:
-                return 'Normal'
-        except:
-            return 'N/A'
-
-    # Test results data
-    test_params = [
-        ('1', 'Temperature', soil_test_results.get('temperature', '0'), '°C', get_rating('temperature', soil_test_results.get('temperature', '0'))),
-        ('2', 'pH Level', soil_test_results.get('ph_level', soil_test_results.get('pH', '0')), '', get_rating('ph', soil_test_results.get('ph_level', soil_test_results.get('pH', '0')))),
-        ('3', 'Soil Moisture', soil_test_results.get('soil_moisture', soil_test_results.get('moisture', '0')), '%', get_rating('moisture', soil_test_results.get('soil_moisture', soil_test_results.get('moisture', '0')))),
-        ('4', 'Nitrogen', soil_test_results.get('nitrogen', '0'), 'ppm', get_rating('nitrogen', soil_test_results.get('nitrogen', '0'))),
-        ('5', 'Phosphorus', soil_test_results.get('phosphorus', '0'), 'ppm', get_rating('phosphorus', soil_test_results.get('phosphorus', '0'))),
-        ('6', 'Potassium', soil_test_results.get('potassium', '0'), 'ppm', get_rating('potassium', soil_test_results.get('potassium', '0'))),
-        ('7', 'Timestamp', soil_test_results.get('timestamp', soil_test_results.get('datetime', 'Current')), '', 'Current')
-    ]
-
-    y_pos = 73
-    for param_data in test_params:
-        x_start = 52
-        for i, (data, width) in enumerate(zip(param_data, header_widths)):
-            cell_rect = Rectangle((x_start, y_pos-2), width, 2, facecolor='white', edgecolor='black', linewidth=0.5)
-            ax.add_patch(cell_rect)
-            # Truncate long timestamp values
-            display_data = str(data)
-            if i == 2 and len(display_data) > 10:  # Test Value column
-                display_data = display_data[:10] + '...'
-            ax.text(x_start + width/2, y_pos-1, display_data, ha='center', va='center', fontsize=7)
-            x_start += width
-        y_pos -= 2
-
-    # Soil Sample Details Section
-    sample_header = Rectangle((2, 52), 48, 3, facecolor=orange_header, edgecolor='black', linewidth=1)
-    ax.add_patch(sample_header)
-    ax.text(26, 53.5, 'Soil Sample Details', ha='center', va='center', fontsize=10, weight='bold', color='white')
-
-    current_date = datetime.now().strftime('%d/%m/%Y')
-    sample_fields = [
-        ('Soil Sample Number', f"SHC{datetime.now().strftime('%Y%m%d')}001"),
-        ('Sample Collected on', current_date),
-        ('Survey No.', 'SMART-001'),
-        ('Farm Size', '1.0 acres'),
-        ('Geo Position (GPS)', 'IoT Sensor Location'),
-        ('Irrigated / Rainfed', 'Smart Irrigation')
-    ]
-
-    y_pos = 51
-    for field, value in sample_fields:
-        sample_field_rect = Rectangle((2, y_pos-2), 24, 2, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(sample_field_rect)
-        ax.text(3, y_pos-1, field, ha='left', va='center', fontsize=8)
-
-        sample_value_rect = Rectangle((26, y_pos-2), 24, 2, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(sample_value_rect)
-        ax.text(27, y_pos-1, str(value), ha='left', va='center', fontsize=7)
-
-        y_pos -= 2
-
-    # Fertilizer Recommendations Table
-    fert_header = Rectangle((52, 45), 46, 3, facecolor=green_header, edgecolor='black', linewidth=1)
-    ax.add_patch(fert_header)
-    ax.text(75, 46.5, 'Fertilizer Recommendations for Reference Yield', ha='center', va='center', fontsize=9, weight='bold', color='white')
-
-    # Generate recommendations based on soil test results
-    def generate_recommendations(soil_data):
-        nitrogen = float(soil_data.get('nitrogen', 50))
-        phosphorus = float(soil_data.get('phosphorus', 30))
-        potassium = float(soil_data.get('potassium', 80))
-        
-        if nitrogen < 30:
-            n_rec = "High Nitrogen needed - Urea 300kg/ha"
-        elif nitrogen < 50:
-            n_rec = "Medium Nitrogen - Urea 200kg/ha"
+                render_requests.inc(1, 'error')
+            with in_flight_lock:
+                waiting = in_flight.pop(key)
+            respond(job_response(job, result, output_dir))
+            for waiter in waiting:
+                respond(job_response(waiter, dict(result, id=waiter.get('id')), output_dir))
+        return callback
+
+    pool = RenderPool(processes=processes, queue_size=queue_size, timeout=timeout)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError('request must be a JSON object')
+        except ValueError as e:
+            respond({'id': None, 'success': False, 'error': f'invalid request: {e}'})
+            continue
+
+        if job.get('command') == 'stats':
+            respond({'id': job.get('id'), 'success': True, 'stats': cache.stats()})
+            continue
+        if job.get('command') == 'metrics':
+            respond({'id': job.get('id'), 'success': True, 'metrics': render_metrics.render()})
+            continue
+
+        try:
+            key = job_cache_key(job)
+        except Exception as e:
+            render_requests.inc(1, 'error')
+            respond({'id': job.get('id'), 'success': False, 'error': str(e)})
+            continue
+        data = cache.get(key)
+        if data is not None:
+            render_requests.inc(1, 'cached')
+            respond(job_response(job, {'id': job.get('id'), 'success': True, 'data': data, 'cached': True}, output_dir))
+            continue
+        with in_flight_lock:
+            waiting = in_flight.get(key)
+            if waiting is not None:
+                waiting.append(job)
+            else:
+                in_flight[key] = []
+        if waiting is not None:
+            render_requests.inc(1, 'coalesced')
         else:
-            n_rec = "Low Nitrogen - Urea 100kg/ha"
-            
-        return {
-            'crop_1': 'Mixed Vegetables',
-            'yield_1': '4.0 t/ha',
-            'fert_combo1_1': n_rec,
-            'fert_combo2_1': f'NPK Complex based on N:{nitrogen:.0f} P:{phosphorus:.0f} K:{potassium:.0f}'
-        }
-
-    recs = generate_recommendations(soil_test_results)
-
-    # Fertilizer table headers
-    fert_headers = ['Sl.\nNo.', 'Crop & Variety', 'Ref.\nYield', 'Fertilizer Combination-1\nfor N P K', 'Fertilizer Combination-2\nfor N P K']
-    fert_widths = [3, 12, 6, 12.5, 12.5]
-    x_start = 52
-
-    for header, width in zip(fert_headers, fert_widths):
-        header_rect = Rectangle((x_start, 42), width, 3, facecolor=light_green, edgecolor='black', linewidth=0.5)
-        ax.add_patch(header_rect)
-        ax.text(x_start + width/2, 43.5, header, ha='center', va='center', fontsize=6, weight='bold')
-        x_start += width
-
-    # Fertilizer recommendations data
-    fert_data = [
-        ('1', recs['crop_1'], recs['yield_1'], recs['fert_combo1_1'], recs['fert_combo2_1']),
-        ('2', '', '', '', ''),
-        ('3', '', '', '', '')
-    ]
-
-    y_pos = 42
-    for fert_row in fert_data:
-        x_start = 52
-        for i, (data, width) in enumerate(zip(fert_row, fert_widths)):
-            cell_height = 4 if i >= 3 else 3
-            cell_rect = Rectangle((x_start, y_pos-cell_height), width, cell_height, facecolor='white', edgecolor='black', linewidth=0.5)
-            ax.add_patch(cell_rect)
-            font_size = 5 if i >= 3 else 6
-            ax.text(x_start + width/2, y_pos-cell_height/2, str(data), ha='center', va='center', fontsize=font_size)
-            x_start += width
-        y_pos -= 4
-
-    # Secondary & Micro Nutrients Recommendations
-    micro_header = Rectangle((2, 32), 32, 3, facecolor=green_header, edgecolor='black', linewidth=1)
-    ax.add_patch(micro_header)
-    ax.text(18, 33.5, 'Secondary & Micro Nutrients Recommendations', ha='center', va='center', fontsize=8, weight='bold', color='white')
-
-    micro_params = [
-        ('1', 'Sulphur (S)', '20 kg/ha'),
-        ('2', 'Zinc (Zn)', '5 kg/ha'),
-        ('3', 'Boron (B)', '1 kg/ha'),
-        ('4', 'Iron (Fe)', '10 kg/ha'),
-        ('5', 'Manganese (Mn)', '5 kg/ha'),
-        ('6', 'Copper (Cu)', '2 kg/ha')
-    ]
-
-    micro_headers = ['S.\nNo.', 'Parameter', 'Recommendations for\nSoil Applications']
-    micro_widths = [3, 10, 19]
-    x_start = 2
-
-    for header, width in zip(micro_headers, micro_widths):
-        header_rect = Rectangle((x_start, 29), width, 3, facecolor=light_green, edgecolor='black', linewidth=0.5)
-        ax.add_patch(header_rect)
-        ax.text(x_start + width/2, 30.5, header, ha='center', va='center', fontsize=7, weight='bold')
-        x_start += width
-
-    y_pos = 29
-    for param_data in micro_params:
-        x_start = 2
-        for data, width in zip(param_data, micro_widths):
-            cell_rect = Rectangle((x_start, y_pos-2.5), width, 2.5, facecolor='white', edgecolor='black', linewidth=0.5)
-            ax.add_patch(cell_rect)
-            ax.text(x_start + width/2, y_pos-1.25, str(data), ha='center', va='center', fontsize=7)
-            x_start += width
-        y_pos -= 2.5
-
-    # General Recommendations
-    general_header = Rectangle((2, 11), 32, 2, facecolor=orange_header, edgecolor='black', linewidth=1)
-    ax.add_patch(general_header)
-    ax.text(18, 12, 'General Recommendations', ha='center', va='center', fontsize=9, weight='bold', color='white')
-
-    general_recs = [
-        ('1', 'Organic Manure', '5 tons/ha'),
-        ('2', 'Biofertilizer', 'Azotobacter + PSB'),
-        ('3', 'Lime / Gypsum', 'Gypsum 250 kg/ha')
-    ]
-
-    y_pos = 10
-    for rec_data in general_recs:
-        sno_rect = Rectangle((2, y_pos-3), 3, 3, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(sno_rect)
-        ax.text(3.5, y_pos-1.5, rec_data[0], ha='center', va='center', fontsize=7)
-
-        param_rect = Rectangle((5, y_pos-3), 10, 3, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(param_rect)
-        ax.text(10, y_pos-1.5, rec_data[1], ha='center', va='center', fontsize=7)
-
-        rec_rect = Rectangle((15, y_pos-3), 19, 3, facecolor='white', edgecolor='black', linewidth=0.5)
-        ax.add_patch(rec_rect)
-        ax.text(24.5, y_pos-1.5, rec_data[2], ha='center', va='center', fontsize=7)
-
-        y_pos -= 3
-
-    # Bottom text
-    ax.text(50, 5, 'Healthy Soil\nfor\na Healthy Farm', ha='center', va='center', fontsize=11, weight='bold')
-
-    # Convert to base64
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight', facecolor='white', edgecolor='none')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-    plt.close(fig)
-    
-    return image_base64
\ No newline at end of file
+            pool.submit(job, respond_and_cache(job, key))
+    pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Soil health card renderer')
+    parser.add_argument('--worker', action='store_true',
+                        help='stay running and render JSON-lines requests from stdin')
+    parser.add_argument('--processes', type=int, default=2, help='render processes in --worker mode')
+    parser.add_argument('--queue-size', type=int, default=32, help='jobs waiting before requests are refused')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a render is killed')
+    parser.add_argument('--cache-dir', help='directory for the on-disk card cache tier')
+    parser.add_argument('--cache-disk-mb', type=int, default=512, help='size cap of the on-disk cache')
+    parser.add_argument('--cache-memory-mb', type=int, default=64, help='size cap of the in-memory cache')
+    parser.add_argument('--metrics-file', help='keep Prometheus render metrics in this file (textfile collector)')
+    parser.add_argument('--output-dir', help="where output='path' requests write their files (default: temp dir)")
+    args = parser.parse_args()
+
+    if args.worker:
+        card_cache = CardCache(
+            max_memory_bytes=args.cache_memory_mb * 1024 * 1024,
+            disk_dir=args.cache_dir,
+            max_disk_bytes=args.cache_disk_mb * 1024 * 1024
+        )
+        run_worker(args.processes, args.queue_size, args.timeout, cache=card_cache, output_dir=args.output_dir,
+                   metrics_file=args.metrics_file)
+    else:
+        # One-shot: a single JSON request on stdin, the response on stdout
+        print(json.dumps(render_job(json.loads(sys.stdin.read() or '{}'), output_dir=args.output_dir)))
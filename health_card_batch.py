@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Bulk soil health card generation
+
+Renders one card per farmer record across a pool of warm render processes
+and streams the pages, in input order, into a multi-page PDF, a zip file or
+a directory of PNGs as they finish. At most `window` cards are in flight or
+waiting to be written at any time, so peak memory does not depend on the
+size of the batch.
+
+Records are JSON lines in the same shape the --worker renderer accepts:
+    {"farmerData": {...}, "sensorData": {...}, "cardDate": ..., "sampleNumber": ...}
+Records without sensorData can name a device ("deviceId", or
+farmerData.device_id) whose readings are averaged from the sensor log.
+
+Usage:
+    python health_card_batch.py farmers.jsonl --pdf village.pdf
+    python health_card_batch.py farmers.jsonl --zip cards.zip --processes 4
+    python health_card_batch.py farmers.jsonl --dir cards/ --sensor-log sensor_log --days 7
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from atomic_file import atomic_write
+from generate_health_card import DPI, card_text, encode_png, get_static_template, resolve_card_date
+from sensor_log import SensorLog
+from sensor_store import CHANNEL_NAMES
+
+
+# -- Input -------------------------------------------------------------------
+
+class BadRecord:
+    """Stands in for an input line that is not a JSON object
+
+    It flows through the batch in its place so the line is reported as a
+    failed card instead of aborting the whole run.
+    """
+
+    def __init__(self, line_number, error):
+        self.line_number = line_number
+        self.error = f"line {line_number}: {error}"
+
+
+def read_records(path):
+    """Records from a JSON-lines file ('-' for stdin), skipping blank lines
+
+    Malformed lines are yielded as BadRecord.
+    """
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield BadRecord(line_number, f"invalid JSON ({e})")
+                continue
+            if not isinstance(record, dict):
+                yield BadRecord(line_number, "record must be a JSON object")
+                continue
+            yield record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def sensor_log_averages(log_dir, since=None):
+    """{device_id: mean reading} over the sensor log (from `since`, epoch seconds)"""
+    log = SensorLog(log_dir)
+    try:
+        sums, counts, newest = {}, {}, {}
+        for records in log.read(since=since):
+            for device in np.unique(records['device_id']):
+                rows = records[records['device_id'] == device]
+                device_id = device.decode('utf-8', 'ignore')
+                values = np.array([rows[name].sum(dtype=np.float64) for name in CHANNEL_NAMES])
+                sums[device_id] = sums.get(device_id, 0) + values
+                counts[device_id] = counts.get(device_id, 0) + len(rows)
+                newest[device_id] = max(newest.get(device_id, 0.0), float(rows['timestamp'].max()))
+    finally:
+        log.close()
+
+    averages = {}
+    for device_id, total in sums.items():
+        reading = {name: round(float(value) / counts[device_id], 2) for name, value in zip(CHANNEL_NAMES, total)}
+        reading['timestamp'] = time.strftime('%Y-%m-%d', time.gmtime(newest[device_id]))
+        averages[device_id] = reading
+    return averages
+
+
+def attach_sensor_data(records, averages):
+    """Fill in sensorData from the averaged sensor log for records that name a device"""
+    for record in records:
+        if not isinstance(record, BadRecord) and not record.get('sensorData'):
+            farmer = record.get('farmerData') or {}
+            device_id = record.get('deviceId') or farmer.get('device_id')
+            if device_id is not None and str(device_id) in averages:
+                record = dict(record, sensorData=averages[str(device_id)])
+        yield record
+
+
+# -- Rendering (runs in the pool processes) ------------------------------------
+
+def _init_render_process(dpi):
+    get_static_template(dpi=dpi)
+
+
+def render_record(record, dpi=DPI):
+    """(png bytes, (width, height)) for one record"""
+    items = card_text(record.get('farmerData') or {}, record.get('sensorData') or {},
+                      record.get('cardDate'), record.get('sampleNumber'))
+    pixels = get_static_template(dpi=dpi).render(items)
+    return encode_png(pixels, dpi), (pixels.shape[1], pixels.shape[0])
+
+
+def render_records(records, processes=None, dpi=DPI, window=None):
+    """Yield (index, record, png, size, error) in input order
+
+    Records are pulled from the iterable only as pool slots free up.
+    """
+    processes = processes or os.cpu_count() or 1
+    window = window or processes * 2
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx,
+                             initializer=_init_render_process, initargs=(dpi,)) as pool:
+        in_flight = deque()
+        records = iter(enumerate(records))
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < window:
+                try:
+                    index, record = next(records)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if isinstance(record, BadRecord):
+                    in_flight.append((index, record, None))
+                else:
+                    in_flight.append((index, record, pool.submit(render_record, record, dpi)))
+            if not in_flight:
+                break
+            index, record, future = in_flight.popleft()
+            if future is None:
+                yield index, record, None, None, record.error
+                continue
+            try:
+                png, size = future.result()
+                yield index, record, png, size, None
+            except Exception as e:
+                yield index, record, None, None, str(e)
+
+
+# -- Output --------------------------------------------------------------------
+
+def _png_image_data(png):
+    """Concatenated IDAT payload (a zlib stream with PNG row filters) of a PNG"""
+    position, chunks = 8, []
+    while position < len(png):
+        length, kind = struct.unpack('>I4s', png[position:position + 8])
+        if kind == b'IDAT':
+            chunks.append(png[position + 8:position + 8 + length])
+        elif kind == b'IEND':
+            break
+        position += 12 + length
+    return b''.join(chunks)
+
+
+class StreamingPdfWriter:
+    """Multi-page PDF written one page at a time
+
+    Each page is a single image embedded straight from the PNG's compressed
+    data (FlateDecode with the PNG predictor), so pages are never decoded or
+    held in memory; only object offsets are kept until close().
+    """
+
+    def __init__(self, path, dpi=DPI):
+        self.dpi = dpi
+        self._file = open(path, 'wb')
+        self._offsets = []
+        self._pages = []
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._reserve()  # 1: catalog
+        self._reserve()  # 2: page tree
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number - 1] = self._file.tell()
+        self._file.write(f'{number} 0 obj\n'.encode() + body)
+        if stream is not None:
+            self._file.write(b'\nstream\n' + stream + b'\nendstream')
+        self._file.write(b'\nendobj\n')
+
+    def add_png(self, png, size):
+        width, height = size
+        page_width, page_height = width * 72.0 / self.dpi, height * 72.0 / self.dpi
+        image, content, page = self._reserve(), self._reserve(), self._reserve()
+
+        data = _png_image_data(png)
+        self._object(image, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode '
+            f'/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {width} >> '
+            f'/Length {len(data)} >>'
+        ).encode(), data)
+        draw = f'q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q'.encode()
+        self._object(content, f'<< /Length {len(draw)} >>'.encode(), draw)
+        self._object(page, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>'
+        ).encode())
+        self._pages.append(page)
+
+    def close(self):
+        kids = ' '.join(f'{page} 0 R' for page in self._pages)
+        self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode())
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref = self._file.tell()
+        self._file.write(f'xref\n0 {len(self._offsets) + 1}\n0000000000 65535 f \n'.encode())
+        for offset in self._offsets:
+            self._file.write(f'{offset:010d} 00000 n \n'.encode())
+        self._file.write(
+            f'trailer\n<< /Size {len(self._offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+        )
+        self._file.close()
+
+
+def card_filename(index, record):
+    """Stable, filesystem-safe name for one card"""
+    farmer = record.get('farmerData') or {}
+    label = record.get('sampleNumber') or farmer.get('name') or 'card'
+    label = re.sub(r'[^A-Za-z0-9_-]+', '_', str(label)).strip('_') or 'card'
+    return f"{index + 1:05d}_{label}.png"
+
+
+def generate_batch(records, pdf=None, zip_path=None, directory=None, processes=None,
+                   dpi=DPI, window=None, on_card=None):
+    """Render every record and stream the cards to the chosen output(s)
+
+    Records without a sampleNumber are numbered sequentially per card date.
+    Returns {'rendered': n, 'failed': [{'index', 'error'}, ...]}; failures
+    from malformed input lines also carry their 'line' number.
+    """
+    if not (pdf or zip_path or directory):
+        raise ValueError('choose at least one output: pdf, zip_path or directory')
+
+    def numbered(records):
+        sequence = {}
+        for record in records:
+            if not isinstance(record, BadRecord) and not record.get('sampleNumber'):
+                try:
+                    card_date = resolve_card_date(record.get('cardDate'))
+                except (TypeError, ValueError):
+                    yield record  # left for the renderer to report
+                    continue
+                sequence[card_date] = sequence.get(card_date, 0) + 1
+                record = dict(record, cardDate=card_date.isoformat(),
+                              sampleNumber=f"SHC{card_date.strftime('%Y%m%d')}{sequence[card_date]:03d}")
+            yield record
+
+    writer = StreamingPdfWriter(pdf, dpi) if pdf else None
+    archive = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) if zip_path else None  # PNGs are already deflated
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    summary = {'rendered': 0, 'failed': []}
+    try:
+        for index, record, png, size, error in render_records(numbered(records), processes, dpi, window):
+            if error is not None:
+                failure = {'index': index, 'error': error}
+                if isinstance(record, BadRecord):
+                    failure['line'] = record.line_number
+                summary['failed'].append(failure)
+            else:
+                name = card_filename(index, record)
+                if writer:
+                    writer.add_png(png, size)
+                if archive:
+                    archive.writestr(name, png)
+                if directory:
+                    atomic_write(os.path.join(directory, name), png, fsync=False)
+                summary['rendered'] += 1
+            if on_card:
+                on_card(index, error)
+    finally:
+        if writer:
+            writer.close()
+        if archive:
+            archive.close()
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render soil health cards for many farmers at once')
+    parser.add_argument('records', help="JSON-lines file of farmer records ('-' for stdin)")
+    parser.add_argument('--pdf', help='write all cards into this multi-page PDF')
+    parser.add_argument('--zip', dest='zip_path', help='write the card PNGs into this zip file')
+    parser.add_argument('--dir', dest='directory', help='write the card PNGs into this directory')
+    parser.add_argument('--processes', type=int, default=None, help='render processes (default: CPU count)')
+    parser.add_argument('--dpi', type=int, default=DPI)
+    parser.add_argument('--window', type=int, default=None,
+                        help='cards in flight or waiting to be written (default: 2 x processes)')
+    parser.add_argument('--sensor-log', help='sensor log directory to take soil readings from')
+    parser.add_argument('--days', type=float, default=None, help='only average the last N days of the sensor log')
+    args = parser.parse_args()
+
+    if not (args.pdf or args.zip_path or args.directory):
+        parser.error('choose at least one output: --pdf, --zip or --dir')
+
+    records = read_records(args.records)
+    if args.sensor_log:
+        since = time.time() - args.days * 86400 if args.days else None
+        records = attach_sensor_data(records, sensor_log_averages(args.sensor_log, since))
+
+    started = time.time()
+
+    def progress(index, error):
+        if error:
+            print(f"❌ Card {index + 1} failed: {error}", file=sys.stderr)
+        elif (index + 1) % 25 == 0:
+            print(f"📄 {index + 1} cards rendered ({time.time() - started:.1f}s)", file=sys.stderr)
+
+    summary = generate_batch(records, args.pdf, args.zip_path, args.directory,
+                             args.processes, args.dpi, args.window, on_card=progress)
+    print(f"✅ {summary['rendered']} cards rendered, {len(summary['failed'])} failed "
+          f"in {time.time() - started:.1f}s", file=sys.stderr)
+    sys.exit(1 if summary['failed'] else 0)
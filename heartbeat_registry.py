@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+In-memory heartbeat registry - one entry per device, monotonic clock timestamps
+
+A background sweeper marks devices alive/dead against the timeout and, if a
+snapshot file is configured, periodically writes the registry to disk
+(temp file + rename, so a reader never sees a partial snapshot).
+
+Entries are immutable and the device map is copied on write: writers
+serialize on a lock and swap in a new map, readers just take the current
+reference and never lock.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from atomic_file import atomic_write
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 20.0        # seconds without a heartbeat before a device is dead
+DEFAULT_SWEEP_INTERVAL = 1.0  # seconds between liveness sweeps
+DISPLAY_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+
+class DeviceHeartbeat(NamedTuple):
+    """Liveness state of one device (replaced, never modified)"""
+    device_id: str
+    last_monotonic: Optional[float] = None  # time.monotonic() of the last heartbeat
+    last_wall: Optional[float] = None       # time.time() of the last heartbeat, for display only
+    count: int = 0
+    alive: bool = False
+    info: dict = {}
+
+    def status(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        seconds_since = None
+        if self.last_monotonic is not None:
+            seconds_since = int(now - self.last_monotonic)
+        last_heartbeat = "Never"
+        if self.last_wall is not None:
+            last_heartbeat = datetime.fromtimestamp(self.last_wall).strftime(DISPLAY_FORMAT)
+        return {
+            'device_id': self.device_id,
+            'esp32_alive': self.alive,
+            'seconds_since_heartbeat': seconds_since,
+            'last_heartbeat': last_heartbeat,
+            'heartbeat_count': self.count
+        }
+
+
+class HeartbeatRegistry:
+    """Heartbeats keyed by device id; liveness is judged on the monotonic clock"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, sweep_interval=DEFAULT_SWEEP_INTERVAL,
+                 snapshot_file=None, snapshot_interval=30.0, on_snapshot=None):
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.on_snapshot = on_snapshot  # called as on_snapshot(nbytes, seconds) after each save
+
+        self._devices = {}  # replaced wholesale on every write
+        self._lock = threading.Lock()  # writers only
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_device_id = None
+
+        if snapshot_file:
+            self.load_snapshot()
+
+    def beat(self, device_id, info=None):
+        """Record a heartbeat; the device is alive immediately"""
+        with self._lock:
+            entry = self._devices.get(device_id) or DeviceHeartbeat(device_id)
+            entry = entry._replace(last_monotonic=time.monotonic(), last_wall=time.time(),
+                                   count=entry.count + 1, alive=True, info=info or entry.info)
+            devices = dict(self._devices)
+            devices[device_id] = entry
+            self._devices = devices
+            self.last_device_id = device_id
+        return entry
+
+    def status(self, device_id=None):
+        """Status of device_id (or of the last device to beat), None if unknown"""
+        entry = self._devices.get(device_id or self.last_device_id)
+        return entry.status() if entry else None
+
+    def all_status(self):
+        now = time.monotonic()
+        return {device_id: entry.status(now) for device_id, entry in self._devices.items()}
+
+    def alive_count(self):
+        return sum(1 for entry in self._devices.values() if entry.alive)
+
+    def reset(self, device_id=None):
+        """Forget one device, or every device"""
+        with self._lock:
+            if device_id is None:
+                self._devices = {}
+                self.last_device_id = None
+            else:
+                self._devices = {key: entry for key, entry in self._devices.items() if key != device_id}
+                if self.last_device_id == device_id:
+                    self.last_device_id = None
+        if self.snapshot_file and device_id is None and os.path.exists(self.snapshot_file):
+            os.remove(self.snapshot_file)
+
+    # -- sweeper ---------------------------------------------------------
+
+    def sweep(self):
+        """Mark every device alive or dead; returns ids that just went dead"""
+        now = time.monotonic()
+        died = []
+        with self._lock:
+            changed = {}
+            for device_id, entry in self._devices.items():
+                alive = entry.last_monotonic is not None and now - entry.last_monotonic < self.timeout
+                if alive != entry.alive:
+                    changed[device_id] = entry._replace(alive=alive)
+                    if not alive:
+                        died.append(device_id)
+            if changed:
+                devices = dict(self._devices)
+                devices.update(changed)
+                self._devices = devices
+        return died
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="heartbeat-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the sweeper and write a final snapshot (safe to call twice)"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_file:
+            self.save_snapshot()
+
+    def _run(self):
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while not self._stop.wait(self.sweep_interval):
+            for device_id in self.sweep():
+                log.warning("💔 %s missed heartbeats for %.0fs - marked DEAD", device_id, self.timeout)
+            if self.snapshot_file and time.monotonic() >= next_snapshot:
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    log.error("Error saving heartbeat snapshot: %s", e)
+                next_snapshot = time.monotonic() + self.snapshot_interval
+
+    # -- persistence -----------------------------------------------------
+
+    def save_snapshot(self):
+        """Write last-seen wall times and counts (monotonic times don't survive a restart)"""
+        started = time.perf_counter()
+        snapshot = {
+            device_id: {'last_wall': entry.last_wall, 'count': entry.count}
+            for device_id, entry in self._devices.items()
+        }
+        nbytes = atomic_write(self.snapshot_file, json.dumps(snapshot))
+        if self.on_snapshot:
+            self.on_snapshot(nbytes, time.perf_counter() - started)
+
+    def load_snapshot(self):
+        """Restore devices from a snapshot; they stay dead until they beat again"""
+        if not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+            restored = {
+                device_id: DeviceHeartbeat(device_id, last_wall=saved.get('last_wall'), count=saved.get('count', 0))
+                for device_id, saved in snapshot.items()
+            }
+            with self._lock:
+                devices = dict(self._devices)
+                for device_id, entry in restored.items():
+                    current = devices.get(device_id)
+                    devices[device_id] = current._replace(last_wall=entry.last_wall, count=entry.count) if current else entry
+                self._devices = devices
+        except (ValueError, AttributeError, OSError) as e:
+            # Older servers wrote a bare timestamp here; just start fresh
+            log.warning("Ignoring heartbeat snapshot %s: %s", self.snapshot_file, e)
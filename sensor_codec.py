@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Request body decoding for the ingest endpoints
+
+Besides JSON / NDJSON, ESP32 nodes can send:
+  * MessagePack (application/msgpack) or CBOR (application/cbor)
+  * a fixed-layout packed body (application/octet-stream):
+
+        version  u8           layout version, currently 1
+        device   16 bytes     UTF-8, NUL padded (empty = default device)
+        records  20 bytes each, little endian, no padding:
+                 timestamp f8 (epoch s or ms), temperature i2 (0.01 C),
+                 pH u2 (0.01), moisture u2 (0.1 %), nitrogen u2,
+                 phosphorus u2, potassium u2
+
+  * any of the above with Content-Encoding: gzip or deflate
+
+Packed bodies are read with one np.frombuffer (plus a scale per fixed-point
+column) and a decoded map of equally long arrays ({"timestamp": [...],
+"pH": [...], ...}) is read column-wise, so neither builds a dict per reading.
+"""
+
+import json
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from sensor_store import CHANNEL_NAMES, DEFAULT_READING
+
+PACKED_CONTENT_TYPE = 'application/octet-stream'
+PACKED_HEADER = struct.Struct('<B16s')
+PACKED_VERSION = 1
+PACKED_LAYOUTS = {
+    1: np.dtype([
+        ('timestamp', '<f8'),
+        ('temperature', '<i2'),
+        ('pH', '<u2'),
+        ('moisture', '<u2'),
+        ('nitrogen', '<u2'),
+        ('phosphorus', '<u2'),
+        ('potassium', '<u2'),
+    ]),
+}
+# Fixed-point channels: packed integer / scale = value
+PACKED_SCALES = {1: {'temperature': 100, 'pH': 100, 'moisture': 10}}
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+CBOR_TYPES = ('application/cbor',)
+JSON_TYPES = ('', 'application/json', 'application/x-ndjson', 'application/jsonl', 'text/plain')
+
+DEFAULT_MAX_DECODED_BYTES = 16 * 1024 * 1024
+
+
+class UnsupportedPayload(ValueError):
+    """Content-Type / Content-Encoding the server cannot decode (HTTP 415)"""
+
+
+class ColumnBatch:
+    """Readings held column-wise: `columns[name]` is an array per channel"""
+
+    def __init__(self, device_id, timestamps, columns):
+        self.device_id = device_id
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+def decompress(body, encoding, max_bytes=DEFAULT_MAX_DECODED_BYTES):
+    """Undo Content-Encoding (gzip, deflate or identity), refusing to inflate past max_bytes"""
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding in ('gzip', 'x-gzip'):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        # RFC 9110 says zlib-wrapped, but raw deflate is common in the wild
+        wbits = zlib.MAX_WBITS if body[:1] == b'\x78' else -zlib.MAX_WBITS
+        inflater = zlib.decompressobj(wbits)
+    else:
+        raise UnsupportedPayload(f"unsupported Content-Encoding {encoding!r}")
+    try:
+        data = inflater.decompress(body, max_bytes)
+        if inflater.unconsumed_tail:
+            raise ValueError(f"decompressed body exceeds {max_bytes} bytes")
+        return data + inflater.flush()
+    except zlib.error as e:
+        raise ValueError(f"bad {encoding} body: {e}")
+
+
+def media_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def decode_packed(body):
+    """ColumnBatch from a packed body"""
+    if len(body) < PACKED_HEADER.size:
+        raise ValueError("packed body shorter than its header")
+    version, raw_id = PACKED_HEADER.unpack_from(body)
+    layout = PACKED_LAYOUTS.get(version)
+    if layout is None:
+        raise ValueError(f"unknown packed layout version {version}")
+    size = len(body) - PACKED_HEADER.size
+    if size % layout.itemsize:
+        raise ValueError(f"packed body is not a whole number of {layout.itemsize}-byte records")
+    records = np.frombuffer(body, dtype=layout, offset=PACKED_HEADER.size)
+    scales = PACKED_SCALES[version]
+    columns = {name: records[name] / scales[name] if name in scales else records[name] for name in CHANNEL_NAMES}
+    device_id = raw_id.rstrip(b'\0').decode('utf-8', 'replace') or None
+    return ColumnBatch(device_id, records['timestamp'], columns)
+
+
+def encode_packed(device_id, readings, timestamps, version=PACKED_VERSION):
+    """Packed body for readings (dicts) - what an ESP32 would send; used by tools and tests"""
+    layout, scales = PACKED_LAYOUTS[version], PACKED_SCALES[version]
+    records = np.zeros(len(readings), dtype=layout)
+    records['timestamp'] = timestamps
+    for name in CHANNEL_NAMES:
+        values = np.array([reading[name] for reading in readings], dtype=np.float64)
+        records[name] = np.round(values * scales.get(name, 1))
+    return PACKED_HEADER.pack(version, (device_id or '').encode('utf-8')[:16]) + records.tobytes()
+
+
+def is_columnar(data):
+    return isinstance(data, dict) and isinstance(data.get('timestamp'), (list, tuple))
+
+
+def _numeric_column(name, values):
+    """float64 array of a decoded column; ValueError (not TypeError) for non-numeric cells"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"column {name!r} holds non-numeric values")
+
+
+def decode_columns(data):
+    """ColumnBatch from {"device_id": ..., "timestamp": [...], "<channel>": [...]}"""
+    timestamps = _numeric_column('timestamp', data['timestamp'])
+    columns = {}
+    for name in CHANNEL_NAMES:
+        column = data.get(name)
+        if column is None:
+            columns[name] = np.full(len(timestamps), DEFAULT_READING[name], dtype=np.float64)
+            continue
+        columns[name] = _numeric_column(name, column)
+        if columns[name].shape != timestamps.shape:
+            raise ValueError(f"column {name!r} has {len(columns[name])} values for {len(timestamps)} timestamps")
+    device_id = data.get('device_id')
+    return ColumnBatch(None if device_id is None else str(device_id), timestamps, columns)
+
+
+def decode_body(body, content_type, content_encoding=None, max_bytes=DEFAULT_MAX_DECODED_BYTES):
+    """Decoded request body: a ColumnBatch for packed/columnar bodies, otherwise
+    the plain object (dict, or list of records for JSON arrays / NDJSON / msgpack / CBOR)
+    """
+    body = decompress(body, content_encoding, max_bytes)
+    kind = media_type(content_type)
+    if kind == PACKED_CONTENT_TYPE:
+        return decode_packed(body)
+    if kind in MSGPACK_TYPES:
+        if msgpack is None:
+            raise UnsupportedPayload("MessagePack support needs the msgpack package")
+        try:
+            data = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise ValueError(f"invalid MessagePack: {e}")
+    elif kind in CBOR_TYPES:
+        if cbor2 is None:
+            raise UnsupportedPayload("CBOR support needs the cbor2 package")
+        try:
+            data = cbor2.loads(body)
+        except Exception as e:
+            raise ValueError(f"invalid CBOR: {e}")
+    elif kind in JSON_TYPES:
+        data = parse_json_body(body)
+    else:
+        raise UnsupportedPayload(f"unsupported Content-Type {kind!r}")
+    return decode_columns(data) if is_columnar(data) else data
+
+
+def parse_json_body(body):
+    """JSON value, or a list of records for NDJSON (one object per line)"""
+    text = body.decode('utf-8').strip()
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        if '\n' not in text:
+            raise
+    records = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            records.append(e)  # reported as a rejected record by the caller
+    return records
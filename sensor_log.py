@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Append-only binary sensor log
+
+Readings are packed into fixed-width records and written by a background
+flusher thread in batches, so request handlers only enqueue. Segments rotate
+by size or by (UTC) day and are read back through mmap without copying.
+
+A failed write (disk full, I/O error) is logged and retried with backoff;
+meanwhile the queue is capped at `max_pending` records and enqueueing past
+that raises SensorLogFull, which ingest turns into a 503.
+"""
+
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SENSLOG2"
+HEADER = struct.Struct("<8sI4x")  # magic, record size, padding -> 16 bytes
+DEVICE_ID_BYTES = 64  # longer ids are rejected, never truncated
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('device_id', f'S{DEVICE_ID_BYTES}'),
+    ('temperature', '<f8'),
+    ('pH', '<f8'),
+    ('moisture', '<f8'),
+    ('nitrogen', '<i4'),
+    ('phosphorus', '<i4'),
+    ('potassium', '<i4'),
+])
+
+# SENSLOG1 segments (16-byte device ids) are still readable
+LEGACY_FORMATS = {
+    b"SENSLOG1": np.dtype([(name, 'S16' if name == 'device_id' else dtype)
+                           for name, (dtype, _) in RECORD_DTYPE.fields.items()]),
+}
+
+RETRY_MIN_SECONDS = 0.5   # backoff after a failed write, doubled per failure...
+RETRY_MAX_SECONDS = 30.0  # ...up to this
+
+
+class SensorLogFull(RuntimeError):
+    """The flusher is too far behind (e.g. the disk is failing); retry later"""
+
+
+def device_id_key(device_id):
+    """device_id as stored in a record; ValueError if it does not fit"""
+    key = str(device_id).encode('utf-8')
+    if len(key) > DEVICE_ID_BYTES:
+        raise ValueError(f"device_id is longer than {DEVICE_ID_BYTES} bytes")
+    return key
+
+
+class SensorLog:
+    """Batched, append-only writer and mmap reader for sensor records
+
+    fsync happens after `fsync_every` records or `fsync_interval_ms`
+    milliseconds, whichever comes first; fsync_every=0 leaves syncing to
+    the OS page cache.
+    """
+
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024, rotate_daily=True,
+                 fsync_every=256, fsync_interval_ms=1000, prefix="sensors", on_write=None,
+                 on_error=None, max_pending=100000):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.rotate_daily = rotate_daily
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.prefix = prefix
+        self.on_write = on_write  # on_write(nbytes, write_seconds, fsync_seconds or None) after each flush
+        self.on_error = on_error  # on_error(exception) after each failed flush
+        self.max_pending = max_pending
+        self.write_errors = 0
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # flush() may race the flusher thread
+        self._closed = False
+        self._file = None
+        self._path = None
+        self._day = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="sensor-log-flusher", daemon=True)
+        self._thread.start()
+
+    # -- writing ---------------------------------------------------------
+
+    def append(self, device_id, reading, timestamp=None):
+        """Queue one reading; returns immediately"""
+        if timestamp is None:
+            timestamp = time.time()
+        self._enqueue([_pack(device_id, reading, timestamp)])
+
+    def extend(self, entries):
+        """Queue many (device_id, reading, timestamp) entries at once"""
+        self._enqueue([_pack(device_id, reading, timestamp) for device_id, reading, timestamp in entries])
+
+    def extend_columns(self, device_id, timestamps, columns):
+        """Queue one device's readings given column-wise (arrays per channel)"""
+        records = np.zeros(len(timestamps), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        records['device_id'] = device_id_key(device_id)
+        for name in RECORD_DTYPE.names[2:]:
+            records[name] = columns[name]
+        self._enqueue(records.tolist())
+
+    def _enqueue(self, records):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("sensor log is closed")
+            if self.max_pending and len(self._pending) + len(records) > self.max_pending:
+                raise SensorLogFull(f"sensor log has {len(self._pending)} records waiting to be written")
+            self._pending.extend(records)
+            self._cond.notify()
+
+    def pending_count(self):
+        """Records queued for the flusher thread"""
+        return len(self._pending)
+
+    def flush(self):
+        """Block until everything queued so far is written and fsynced"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        self._write(batch, force_sync=True)
+
+    def close(self):
+        """Stop the flusher and persist anything still queued"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        try:
+            self.flush()
+        except Exception as e:
+            log.error("Sensor log lost %d queued records at close: %s", self.pending_count(), e)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                if backoff:
+                    # New records must not cut the backoff short
+                    deadline = time.monotonic() + backoff
+                    while not self._closed and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                elif not self._pending and not self._closed:
+                    # Wake up on new records, or when an fsync is due for written ones
+                    self._cond.wait(self.fsync_interval if self._unsynced else None)
+                if self._closed:
+                    return
+                batch, self._pending = self._pending, []
+            try:
+                self._write(batch)
+                backoff = 0.0
+            except Exception as e:
+                self.write_errors += 1
+                backoff = min(RETRY_MAX_SECONDS, max(RETRY_MIN_SECONDS, backoff * 2))
+                log.error("Sensor log write failed (retrying in %.1fs, %d records queued): %s",
+                          backoff, self.pending_count(), e)
+                if self.on_error:
+                    self.on_error(e)
+
+    def _write(self, batch, force_sync=False):
+        """Write and (when due) fsync batch; on failure the unwritten records go back to the queue"""
+        with self._write_lock:
+            started = time.perf_counter()
+            records = np.array(batch, dtype=RECORD_DTYPE)
+            nbytes = records.nbytes
+            done = 0
+            try:
+                while done < len(records):
+                    # Split the batch where it would overflow the current segment
+                    segment = self._segment_for(RECORD_DTYPE.itemsize)
+                    room = max(1, (self.max_segment_bytes - segment.tell()) // RECORD_DTYPE.itemsize)
+                    chunk = records[done:done + room]
+                    segment.write(chunk.tobytes())
+                    segment.flush()
+                    self._unsynced += len(chunk)
+                    done += len(chunk)
+            except Exception:
+                # Reopening the segment trims a torn record; nothing written is queued twice
+                self._close_segment()
+                with self._cond:
+                    self._pending[:0] = batch[done:]
+                raise
+            written = time.perf_counter()
+            fsync_seconds = None
+
+            if self._file and self._unsynced:
+                due = (force_sync
+                       or (self.fsync_every and self._unsynced >= self.fsync_every)
+                       or time.monotonic() - self._last_sync >= self.fsync_interval)
+                if due:
+                    os.fsync(self._file.fileno())
+                    fsync_seconds = time.perf_counter() - written
+                    self._unsynced = 0
+                    self._last_sync = time.monotonic()
+
+            if self.on_write and (nbytes or fsync_seconds is not None):
+                self.on_write(nbytes, written - started, fsync_seconds)
+
+    def _segment_for(self, nbytes):
+        """Current segment file, rotating first if the day or size limit is hit"""
+        day = time.strftime("%Y%m%d", time.gmtime())
+        if self._file is not None:
+            too_big = self._file.tell() + nbytes > self.max_segment_bytes
+            new_day = self.rotate_daily and day != self._day
+            if not (too_big or new_day):
+                return self._file
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+        existing = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-{day}-*.bin")))
+        index = 0
+        if existing:
+            index = int(existing[-1].rsplit('-', 1)[1].split('.')[0])
+            if (os.path.getsize(existing[-1]) + nbytes > self.max_segment_bytes
+                    or _segment_magic(existing[-1]) not in (MAGIC, None)):
+                index += 1
+
+        self._day = day
+        self._path = os.path.join(self.directory, f"{self.prefix}-{day}-{index:03d}.bin")
+        self._file = open(self._path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, RECORD_DTYPE.itemsize))
+        else:
+            self._trim_partial_record()
+        return self._file
+
+    def _close_segment(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _trim_partial_record(self):
+        """Drop a torn trailing record left by a crash mid-write"""
+        size = self._file.tell()
+        extra = (size - HEADER.size) % RECORD_DTYPE.itemsize
+        if extra:
+            self._file.truncate(size - extra)
+            self._file.seek(0, os.SEEK_END)
+
+    # -- reading ---------------------------------------------------------
+
+    def segments(self):
+        """Segment paths, oldest first"""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.bin")))
+
+    @staticmethod
+    def map_segment(path):
+        """Zero-copy structured-array view over one segment file"""
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= HEADER.size:
+                return np.empty(0, dtype=RECORD_DTYPE)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size = HEADER.unpack_from(mm, 0)
+        dtype = RECORD_DTYPE if magic == MAGIC else LEGACY_FORMATS.get(magic)
+        if dtype is None or record_size != dtype.itemsize:
+            raise ValueError(f"{path} is not a sensor log segment")
+        count = (size - HEADER.size) // dtype.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        if dtype is not RECORD_DTYPE:
+            return np.frombuffer(mm, dtype=dtype, count=count, offset=HEADER.size).astype(RECORD_DTYPE)
+        # The array keeps the mmap alive for as long as it is referenced
+        return np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+
+    def read(self, device_id=None, since=None, until=None):
+        """Records matching the filters, one array per segment (oldest first)
+
+        Records are in arrival order, and backfilled batches put old
+        timestamps after newer ones, so every segment is masked rather than
+        skipped by its first/last timestamp. Segments with no filter applied
+        are returned as the raw mmap views.
+        """
+        key = str(device_id).encode('utf-8') if device_id is not None else None
+        for path in self.segments():
+            records = self.map_segment(path)
+            if not len(records):
+                continue
+            mask = None
+            if key is not None:
+                mask = records['device_id'] == key
+            if since is not None:
+                mask = (records['timestamp'] >= since) if mask is None else mask & (records['timestamp'] >= since)
+            if until is not None:
+                mask = (records['timestamp'] <= until) if mask is None else mask & (records['timestamp'] <= until)
+            yield records if mask is None else records[mask]
+
+    def tail(self, n):
+        """Newest n records across all segments, oldest first"""
+        chunks = []
+        remaining = n
+        for path in reversed(self.segments()):
+            if remaining <= 0:
+                break
+            records = self.map_segment(path)
+            chunks.append(records[-remaining:] if remaining < len(records) else records)
+            remaining -= len(chunks[-1])
+        if not chunks:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(chunks[::-1])
+
+
+def _segment_magic(path):
+    """Format tag of an existing segment, or None if it has no header yet"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    return HEADER.unpack(header)[0] if len(header) == HEADER.size else None
+
+
+def _pack(device_id, reading, timestamp):
+    return (
+        timestamp,
+        device_id_key(device_id),
+        reading['temperature'],
+        reading['pH'],
+        reading['moisture'],
+        reading['nitrogen'],
+        reading['phosphorus'],
+        reading['potassium'],
+    )
+
+
+def record_to_reading(record):
+    """(device_id, reading, timestamp) from one structured log record"""
+    reading = {
+        'temperature': float(record['temperature']),
+        'pH': float(record['pH']),
+        'moisture': float(record['moisture']),
+        'nitrogen': int(record['nitrogen']),
+        'phosphorus': int(record['phosphorus']),
+        'potassium': int(record['potassium'])
+    }
+    return record['device_id'].decode('utf-8', 'ignore'), reading, float(record['timestamp'])
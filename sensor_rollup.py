@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained min/max/mean rollups per device and bucket size
+
+Each tier is a ring of fixed-width time buckets (slot = bucket % capacity),
+so memory is constant, adding a reading is O(1) and a range query is a
+handful of vectorized NumPy operations over at most `capacity` buckets.
+"""
+
+import threading
+
+import numpy as np
+
+from sensor_store import CHANNEL_NAMES
+
+# name -> (bucket seconds, buckets kept)
+DEFAULT_TIERS = {
+    '1m': (60, 24 * 60),          # one day of minutes
+    '15m': (15 * 60, 31 * 96),    # a month of quarter hours
+    '1h': (60 * 60, 366 * 24),    # a year of hours
+}
+
+
+class RollupTier:
+    """Ring of buckets holding count/sum/min/max for every channel"""
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        nch = len(CHANNEL_NAMES)
+        self.bucket_ids = np.full(capacity, -1, dtype=np.int64)  # which bucket each slot holds
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.sums = np.zeros((capacity, nch), dtype=np.float64)
+        self.mins = np.full((capacity, nch), np.inf, dtype=np.float32)
+        self.maxs = np.full((capacity, nch), -np.inf, dtype=np.float32)
+        self.newest = -1
+
+    def add(self, timestamps, values):
+        """Fold readings in; timestamps has shape (n,), values (n, channels)"""
+        buckets = (np.asarray(timestamps, dtype=np.float64) // self.bucket_seconds).astype(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        self.newest = max(self.newest, int(buckets.max()))
+
+        # Readings older than the ring's window (or than what a slot now holds) are dropped
+        keep = buckets > self.newest - self.capacity
+        slots = buckets % self.capacity
+        keep &= self.bucket_ids[slots] <= buckets
+        if not keep.all():
+            buckets, slots, values = buckets[keep], slots[keep], values[keep]
+            if not len(buckets):
+                return
+
+        # Slots still holding an older bucket start over (within the window
+        # every slot maps to exactly one bucket, so duplicates agree)
+        stale = self.bucket_ids[slots] != buckets
+        if stale.any():
+            reset = slots[stale]
+            self.bucket_ids[reset] = buckets[stale]
+            self.counts[reset] = 0
+            self.sums[reset] = 0.0
+            self.mins[reset] = np.inf
+            self.maxs[reset] = -np.inf
+
+        np.add.at(self.counts, slots, 1)
+        np.add.at(self.sums, slots, values)
+        np.minimum.at(self.mins, slots, values.astype(np.float32))
+        np.maximum.at(self.maxs, slots, values.astype(np.float32))
+
+    def query(self, start, end):
+        """Columnar min/max/mean/count for buckets overlapping [start, end]"""
+        first = max(int(start // self.bucket_seconds), self.newest - self.capacity + 1)
+        last = min(int(end // self.bucket_seconds), self.newest)
+        buckets = np.arange(first, last + 1, dtype=np.int64)
+        slots = buckets % self.capacity
+        present = (self.bucket_ids[slots] == buckets) & (self.counts[slots] > 0)
+        buckets, slots = buckets[present], slots[present]
+
+        counts = self.counts[slots]
+        means = self.sums[slots] / counts[:, None]
+        result = {
+            'timestamps': (buckets * self.bucket_seconds).tolist(),
+            'count': counts.tolist(),
+            'channels': {}
+        }
+        for i, name in enumerate(CHANNEL_NAMES):
+            result['channels'][name] = {
+                'min': self.mins[slots, i].astype(np.float64).round(3).tolist(),
+                'max': self.maxs[slots, i].astype(np.float64).round(3).tolist(),
+                'mean': means[:, i].round(3).tolist()
+            }
+        return result
+
+
+class RollupStore:
+    """One set of tiers per device"""
+
+    def __init__(self, tiers=None):
+        self.tiers = dict(tiers or DEFAULT_TIERS)
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def device_tiers(self, device_id):
+        return self._devices.get(device_id)
+
+    def add(self, device_id, readings, timestamps):
+        """Fold a list of reading dicts (with matching timestamps) into every tier"""
+        if not readings:
+            return
+        values = np.array([[reading[name] for name in CHANNEL_NAMES] for reading in readings], dtype=np.float64)
+        self.add_columns(device_id, timestamps, values)
+
+    def add_columns(self, device_id, timestamps, values):
+        """Like add(), with values already shaped (n, channels) in CHANNEL_NAMES order"""
+        with self._lock:
+            tiers = self._devices.get(device_id)
+            if tiers is None:
+                tiers = self._devices[device_id] = {
+                    name: RollupTier(seconds, capacity) for name, (seconds, capacity) in self.tiers.items()
+                }
+            for tier in tiers.values():
+                tier.add(timestamps, values)
+
+    def query(self, device_id, bucket, start, end):
+        """Rollup rows for one device/tier, or None if the device is unknown"""
+        with self._lock:
+            tiers = self._devices.get(device_id)
+            if tiers is None:
+                return None
+            return tiers[bucket].query(start, end)
+
+    def pick_bucket(self, start, end, max_buckets):
+        """Finest tier that covers [start, end] in at most max_buckets buckets"""
+        by_size = sorted(self.tiers.items(), key=lambda item: item[1][0])
+        for name, (seconds, capacity) in by_size:
+            if (end - start) / seconds <= max_buckets and end - start <= seconds * capacity:
+                return name
+        return by_size[-1][0]
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Rolling per-device statistics and threshold alerts, updated at ingest time
+
+Every reading updates, for all channels at once, a Welford running
+mean/variance, an EWMA, an EWMA-smoothed rate of change and time-windowed
+min/max (monotonic deques, amortized O(1)). Readings are also checked
+against alert bounds derived from the soil_rating tables (outside the
+'good' band, or below 'medium' for nutrient levels); crossing a bound
+raises an alert and coming back past it (with some hysteresis) clears it.
+Queries read the maintained state directly and never rescan stored data.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from sensor_store import CHANNEL_NAMES
+from soil_rating import DEFAULT_THRESHOLDS
+
+DEFAULT_WINDOW_SECONDS = 300.0
+DEFAULT_EWMA_ALPHA = 0.1
+
+# How far back inside a bound a value must come before its alert clears
+DEFAULT_HYSTERESIS = {
+    'temperature': 0.5,
+    'pH': 0.1,
+    'moisture': 2.0,
+    'nitrogen': 2.0,
+    'phosphorus': 2.0,
+    'potassium': 2.0,
+}
+
+
+def alert_bounds(thresholds=None):
+    """(low, high) arrays in CHANNEL_NAMES order; NaN where a channel has no bound"""
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    low = np.full(len(CHANNEL_NAMES), np.nan)
+    high = np.full(len(CHANNEL_NAMES), np.nan)
+    for i, name in enumerate(CHANNEL_NAMES):
+        spec = thresholds.get(name)
+        if not spec:
+            continue
+        if spec['kind'] == 'band':
+            low[i], high[i] = spec['good']
+        elif spec['kind'] == 'level':
+            low[i] = spec['medium']
+    return low, high
+
+
+class DeviceStats:
+    """Rolling state for one device, every field an array over the channels"""
+
+    def __init__(self, window_seconds, alpha):
+        n = len(CHANNEL_NAMES)
+        self.window_seconds = window_seconds
+        self.alpha = alpha
+        self.count = 0
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.ewma = np.zeros(n)
+        self.rate = np.full(n, np.nan)  # per minute
+        self.last = np.full(n, np.nan)
+        self.last_timestamp = None
+        self.alert_low = np.zeros(n, dtype=bool)
+        self.alert_high = np.zeros(n, dtype=bool)
+        self.alert_since = {}  # (channel index, 'low'|'high') -> alert event
+        # Per channel (timestamp, value) deques: maxima decreasing, minima increasing
+        self._window_max = [deque() for _ in range(n)]
+        self._window_min = [deque() for _ in range(n)]
+
+    def update(self, values, timestamp):
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+        # Order-dependent state (EWMA, rate, window) only moves forward in time
+        # (batches may replay older readings)
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return
+        if self.last_timestamp is None:
+            self.ewma[:] = values
+        else:
+            self.ewma += self.alpha * (values - self.ewma)
+            instant = (values - self.last) / (timestamp - self.last_timestamp) * 60.0
+            self.rate = np.where(np.isnan(self.rate), instant, self.rate + self.alpha * (instant - self.rate))
+        self.last = values
+        self.last_timestamp = timestamp
+
+        cutoff = timestamp - self.window_seconds
+        for i, value in enumerate(values.tolist()):
+            maxima, minima = self._window_max[i], self._window_min[i]
+            while maxima and maxima[-1][1] <= value:
+                maxima.pop()
+            maxima.append((timestamp, value))
+            while maxima[0][0] < cutoff:
+                maxima.popleft()
+            while minima and minima[-1][1] >= value:
+                minima.pop()
+            minima.append((timestamp, value))
+            while minima[0][0] < cutoff:
+                minima.popleft()
+
+    def snapshot(self):
+        variance = self.m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.m2)
+        channels = {}
+        for i, name in enumerate(CHANNEL_NAMES):
+            channels[name] = {
+                'last': _finite(self.last[i]),
+                'mean': round(float(self.mean[i]), 4),
+                'std': round(math.sqrt(float(variance[i])), 4),
+                'ewma': round(float(self.ewma[i]), 4),
+                'rate_per_min': _finite(self.rate[i]),
+                'window_min': self._window_min[i][0][1] if self._window_min[i] else None,
+                'window_max': self._window_max[i][0][1] if self._window_max[i] else None,
+            }
+        return {
+            'count': self.count,
+            'last_timestamp': self.last_timestamp,
+            'window_seconds': self.window_seconds,
+            'channels': channels
+        }
+
+
+def _finite(value):
+    value = float(value)
+    return round(value, 4) if math.isfinite(value) else None
+
+
+class SensorStats:
+    """DeviceStats per device plus the alert state machine"""
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, ewma_alpha=DEFAULT_EWMA_ALPHA,
+                 thresholds=None, hysteresis=None, history_size=500):
+        self.window_seconds = window_seconds
+        self.ewma_alpha = ewma_alpha
+        self.low, self.high = alert_bounds(thresholds)
+        margins = dict(DEFAULT_HYSTERESIS, **(hysteresis or {}))
+        self.hysteresis = np.array([margins.get(name, 0.0) for name in CHANNEL_NAMES])
+        self.history = deque(maxlen=history_size)
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id, reading, timestamp=None):
+        """Fold one reading dict in; returns the alert events it caused (raised/cleared)"""
+        values = np.array([reading[name] for name in CHANNEL_NAMES], dtype=np.float64)
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            return self._update(self._device(device_id), device_id, values, timestamp)
+
+    def update_columns(self, device_id, timestamps, values):
+        """Fold in rows of an (n, channels) array in time order; returns alert events"""
+        events = []
+        with self._lock:
+            stats = self._device(device_id)
+            for i in np.argsort(timestamps, kind='stable').tolist():
+                events.extend(self._update(stats, device_id, values[i], float(timestamps[i])))
+        return events
+
+    def _device(self, device_id):
+        stats = self._devices.get(device_id)
+        if stats is None:
+            stats = self._devices[device_id] = DeviceStats(self.window_seconds, self.ewma_alpha)
+        return stats
+
+    def _update(self, stats, device_id, values, timestamp):
+        newest = stats.last_timestamp is None or timestamp > stats.last_timestamp
+        stats.update(values, timestamp)
+        # Alerts follow the newest reading only
+        return self._check(device_id, stats, values, timestamp) if newest else []
+
+    def _check(self, device_id, stats, values, timestamp):
+        with np.errstate(invalid='ignore'):
+            low = np.where(stats.alert_low, values < self.low + self.hysteresis, values < self.low)
+            high = np.where(stats.alert_high, values > self.high - self.hysteresis, values > self.high)
+        changed_low = np.flatnonzero(low != stats.alert_low)
+        changed_high = np.flatnonzero(high != stats.alert_high)
+        if not len(changed_low) and not len(changed_high):
+            return []
+
+        events = []
+        for kind, changed, active, bounds in (('low', changed_low, low, self.low),
+                                              ('high', changed_high, high, self.high)):
+            for i in changed.tolist():
+                name = CHANNEL_NAMES[i]
+                state = 'raised' if active[i] else 'cleared'
+                word = 'below' if kind == 'low' else 'above'
+                event = {
+                    'device_id': device_id,
+                    'channel': name,
+                    'kind': kind,
+                    'state': state,
+                    'value': float(values[i]),
+                    'threshold': float(bounds[i]),
+                    'timestamp': timestamp,
+                    'message': (f"{name} {values[i]:g} is {word} {bounds[i]:g}" if state == 'raised'
+                                else f"{name} back to {values[i]:g}")
+                }
+                if state == 'raised':
+                    stats.alert_since[(i, kind)] = event
+                else:
+                    event['raised_at'] = stats.alert_since.pop((i, kind))['timestamp']
+                self.history.append(event)
+                events.append(event)
+        stats.alert_low, stats.alert_high = low, high
+        return events
+
+    def stats(self, device_id):
+        """Current rolling stats for one device, or None if it never reported"""
+        with self._lock:
+            stats = self._devices.get(device_id)
+            return stats.snapshot() if stats else None
+
+    def all_stats(self):
+        with self._lock:
+            return {device_id: stats.snapshot() for device_id, stats in self._devices.items()}
+
+    def active_alerts(self, device_id=None):
+        """Alerts currently raised, oldest first"""
+        with self._lock:
+            devices = [self._devices[device_id]] if device_id in self._devices else (
+                [] if device_id is not None else list(self._devices.values()))
+            active = [event for stats in devices for event in stats.alert_since.values()]
+        return sorted(active, key=lambda event: event['timestamp'])
+
+    def recent_alerts(self, limit=100, device_id=None):
+        """Raised/cleared events, newest first"""
+        with self._lock:
+            events = list(self.history)
+        events = [e for e in reversed(events) if device_id is None or e['device_id'] == device_id]
+        return events[:limit]
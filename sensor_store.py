@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Per-device sensor store - fixed-capacity NumPy ring buffers, one per channel
+
+Writers are serialized by locks; readers never take them. The newest reading
+of every device is published as an immutable StoreSnapshot that writers swap
+in with a single reference assignment, and copies out of the ring buffers
+are validated with a sequence counter (a seqlock) and retried if a write
+overlapped them. A reader therefore never waits on, or delays, ingest and
+never sees a half-written reading.
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+import numpy as np
+
+DEFAULT_DEVICE_ID = "esp32"
+DEFAULT_CAPACITY = 4096
+READ_RETRIES = 8  # optimistic ring-buffer copies before a reader waits for the writer lock
+
+# (channel, dtype, default) - defaults are the values server.py has always used
+CHANNELS = (
+    ('temperature', np.float64, 22.0),
+    ('pH', np.float64, 6.5),
+    ('moisture', np.float64, 45.0),
+    ('nitrogen', np.int32, 50),
+    ('phosphorus', np.int32, 30),
+    ('potassium', np.int32, 60),
+)
+CHANNEL_NAMES = tuple(name for name, _, _ in CHANNELS)
+DEFAULT_READING = {name: default for name, _, default in CHANNELS}
+
+
+def coerce_reading(data):
+    """Coerce a raw ESP32 payload into a reading (float for T/pH/moisture, int for NPK)
+
+    Raises ValueError for a value that is not a finite number or does not
+    fit its channel's dtype.
+    """
+    reading = {}
+    for name, dtype, default in CHANNELS:
+        value = data.get(name, default)
+        if np.issubdtype(dtype, np.integer):
+            try:
+                value = int(value)
+            except OverflowError:
+                raise ValueError(f"{name} must be a finite number")
+            limits = np.iinfo(dtype)
+            if not limits.min <= value <= limits.max:
+                raise ValueError(f"{name} out of range: {value}")
+        else:
+            value = float(value)
+            if not np.isfinite(value):
+                raise ValueError(f"{name} must be a finite number")
+        reading[name] = value
+    return reading
+
+
+def column_checks(columns):
+    """The checks coerce_reading applies, done column-wise for batches
+
+    Yields (row mask, reason) pairs; a True row fails that check.
+    """
+    for name, dtype, _ in CHANNELS:
+        column = np.asarray(columns[name], dtype=np.float64)
+        finite = np.isfinite(column)
+        yield ~finite, f"{name} must be a finite number"
+        if np.issubdtype(dtype, np.integer):
+            limits = np.iinfo(dtype)
+            with np.errstate(invalid='ignore'):
+                yield finite & ((column < limits.min) | (column > limits.max)), f"{name} out of range"
+
+
+def parse_timestamp(value):
+    """Device-side timestamp -> epoch seconds
+
+    Accepts epoch seconds, epoch milliseconds (anything past year ~2286 in
+    seconds), either as a number or a numeric string (query parameters), or
+    an ISO 8601 string. Raises ValueError otherwise.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"invalid timestamp: {value!r}")
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    if isinstance(value, (int, float)):
+        timestamp = float(value)
+        if not np.isfinite(timestamp) or timestamp <= 0:
+            raise ValueError(f"invalid timestamp: {value!r}")
+        return timestamp / 1000.0 if timestamp > 1e10 else timestamp
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    raise ValueError(f"invalid timestamp: {value!r}")
+
+
+class StoreSnapshot(NamedTuple):
+    """Read-only state of a SensorStore, replaced (never modified) on every write"""
+    version: int                    # bumped on every write; used for ETags and SSE event ids
+    last_device_id: Optional[str]
+    latest: Mapping                 # device_id -> newest reading (read-only, with timestamp and device_id)
+    counts: Mapping                 # device_id -> readings ever appended
+
+
+EMPTY_SNAPSHOT = StoreSnapshot(0, None, MappingProxyType({}), MappingProxyType({}))
+
+
+class DeviceRingBuffer:
+    """Last `capacity` readings of one device, stored column-wise
+
+    Slots are filled in arrival order. Backfilled readings (older than ones
+    already stored) are allowed: `newest` only moves forward in time, and
+    while the buffer holds out-of-order readings, reads sort by timestamp.
+    """
+
+    def __init__(self, device_id, capacity=DEFAULT_CAPACITY):
+        self.device_id = device_id
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.channels = {name: np.zeros(capacity, dtype=dtype) for name, dtype, _ in CHANNELS}
+        self.count = 0  # readings ever appended; write slot is count % capacity
+        self.newest = None  # read-only mapping of the newest reading by timestamp
+        self.max_timestamp = -np.inf
+        self._unordered_until = 0  # slots are out of time order until count reaches this
+        self._seq = 0  # odd while a write is in progress
+        self._lock = threading.Lock()  # writers only
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, reading, timestamp=None):
+        """Store one reading; returns True if it became the newest one"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            self._seq += 1
+            try:
+                slot = self.count % self.capacity
+                self.timestamps[slot] = timestamp
+                for name in CHANNEL_NAMES:
+                    self.channels[name][slot] = reading[name]
+                self.count += 1
+                newer = self._track_order(timestamp, timestamp)
+            finally:
+                self._seq += 1
+            if newer:
+                self._publish_newest(slot)
+            return newer
+
+    def extend(self, readings, timestamps):
+        """Append many readings with one vectorized write per channel"""
+        columns = {name: [reading[name] for reading in readings] for name in CHANNEL_NAMES}
+        return self.extend_columns(columns, timestamps)
+
+    def extend_columns(self, columns, timestamps):
+        """Like extend(), with a sequence or array of values per channel
+
+        The batch is written in timestamp order; returns True if it holds a
+        reading newer than the current newest one.
+        """
+        n = len(timestamps)
+        if n == 0:
+            return False
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        order = np.argsort(timestamps, kind='stable')
+        # Only the newest `capacity` readings would survive anyway
+        order = order[-self.capacity:]
+        skipped, n = n - len(order), len(order)
+        with self._lock:
+            self._seq += 1
+            try:
+                self.count += skipped
+                slots = np.arange(self.count, self.count + n) % self.capacity
+                self.timestamps[slots] = timestamps[order]
+                for name in CHANNEL_NAMES:
+                    self.channels[name][slots] = np.asarray(columns[name])[order]
+                self.count += n
+                newer = self._track_order(timestamps[order[0]], timestamps[order[-1]])
+            finally:
+                self._seq += 1
+            if newer:
+                self._publish_newest(slots[-1])
+            return newer
+
+    def _track_order(self, first, last):
+        """Note a write spanning [first, last]; True if last is the newest timestamp so far"""
+        if first < self.max_timestamp:
+            # Out of order until every slot written so far has been overwritten
+            self._unordered_until = self.count + self.capacity
+        newer = last >= self.max_timestamp
+        self.max_timestamp = max(self.max_timestamp, last)
+        return newer
+
+    def _publish_newest(self, slot):
+        reading = {name: self.channels[name][slot].item() for name in CHANNEL_NAMES}
+        reading['timestamp'] = self.timestamps[slot].item()
+        reading['device_id'] = self.device_id
+        self.newest = MappingProxyType(reading)
+
+    def _read(self, copy):
+        """copy() without the writer lock; retried if a write overlapped it (seqlock)"""
+        for _ in range(READ_RETRIES):
+            seq = self._seq
+            if seq % 2 == 0:
+                result = copy()
+                if self._seq == seq:
+                    return result
+            time.sleep(0)  # let the writer thread finish
+        with self._lock:
+            return copy()
+
+    def _slots(self, n):
+        """Buffer slots of the newest n readings (by timestamp), oldest first"""
+        n = max(0, min(n, len(self)))
+        if self.count >= self._unordered_until:
+            return np.arange(self.count - n, self.count) % self.capacity
+        slots = np.arange(self.count - len(self), self.count) % self.capacity
+        slots = slots[np.argsort(self.timestamps[slots], kind='stable')]
+        return slots[len(slots) - n:]
+
+    def latest(self):
+        """Newest reading as a plain dict, or None if the buffer is empty"""
+        newest = self.newest
+        return dict(newest) if newest is not None else None
+
+    def last(self, n):
+        """Newest n readings as copied arrays keyed by channel (plus 'timestamp')"""
+        def copy():
+            slots = self._slots(n)
+            columns = {name: self.channels[name][slots] for name in CHANNEL_NAMES}
+            columns['timestamp'] = self.timestamps[slots]
+            return columns
+        return self._read(copy)
+
+    def last_records(self, n):
+        """Newest n readings as a list of dicts, oldest first"""
+        columns = self.last(n)
+        keys = ('timestamp',) + CHANNEL_NAMES
+        rows = zip(*(columns[key].tolist() for key in keys))
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class SensorStore:
+    """Ring buffers keyed by device_id; memory is bounded by capacity x devices"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._devices = {}
+        self._lock = threading.Lock()  # device creation and snapshot publication
+        self._versions = itertools.count(1)
+        self.snapshot = EMPTY_SNAPSHOT
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @property
+    def last_device_id(self):
+        return self.snapshot.last_device_id
+
+    def device(self, device_id):
+        """Buffer for device_id, or None if that device has never reported"""
+        return self._devices.get(device_id)
+
+    def device_ids(self):
+        return list(self.snapshot.counts)
+
+    def _buffer(self, device_id):
+        buffer = self._devices.get(device_id)
+        if buffer is None:
+            with self._lock:
+                buffer = self._devices.setdefault(device_id, DeviceRingBuffer(device_id, self.capacity))
+        return buffer
+
+    def _publish(self, buffer, newer):
+        """Swap in a new snapshot; a backfill (newer=False) leaves the latest readings alone"""
+        with self._lock:
+            previous = self.snapshot
+            latest = previous.latest
+            last_device_id = previous.last_device_id
+            if newer:
+                latest = dict(latest)
+                latest[buffer.device_id] = buffer.newest
+                latest = MappingProxyType(latest)
+                last_device_id = buffer.device_id
+            counts = dict(previous.counts)
+            counts[buffer.device_id] = buffer.count
+            self.snapshot = StoreSnapshot(next(self._versions), last_device_id, latest, MappingProxyType(counts))
+
+    def append(self, device_id, reading, timestamp=None):
+        buffer = self._buffer(device_id)
+        self._publish(buffer, buffer.append(reading, timestamp))
+        return buffer
+
+    def extend(self, device_id, readings, timestamps):
+        """Append a batch of readings for one device"""
+        buffer = self._buffer(device_id)
+        newer = buffer.extend(readings, timestamps)
+        if readings:
+            self._publish(buffer, newer)
+        return buffer
+
+    def extend_columns(self, device_id, columns, timestamps):
+        """Append a batch held column-wise (e.g. a packed ESP32 body)"""
+        buffer = self._buffer(device_id)
+        newer = buffer.extend_columns(columns, timestamps)
+        if len(timestamps):
+            self._publish(buffer, newer)
+        return buffer
+
+    def latest(self, device_id=None, snapshot=None):
+        """Newest reading of device_id, or of whichever device reported last"""
+        snapshot = snapshot or self.snapshot
+        reading = snapshot.latest.get(device_id or snapshot.last_device_id)
+        return dict(reading) if reading is not None else None
+
+    def last(self, device_id, n):
+        buffer = self.device(device_id)
+        return buffer.last_records(n) if buffer else []
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events fan-out for new sensor readings
+
+Each reading is serialized once in publish() and the same bytes are queued
+for every matching subscriber. A subscriber that falls behind loses its
+oldest events instead of slowing ingest down.
+"""
+
+import json
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_KEEPALIVE = 15.0  # seconds between comment lines on an idle stream
+
+
+def format_event(data, event='reading', event_id=None):
+    """One SSE frame as bytes"""
+    frame = f"event: {event}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    frame += f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+    return frame.encode('utf-8')
+
+
+class SensorBroadcaster:
+    """Pushes readings to SSE subscribers, optionally filtered by device"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, keepalive=DEFAULT_KEEPALIVE):
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._subscribers = {}  # device_id (None = every device) -> set of queues
+        self._lock = threading.Lock()
+
+    def subscriber_count(self):
+        return sum(len(queues) for queues in list(self._subscribers.values()))
+
+    def subscribe(self, device_id=None):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(device_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, q, device_id=None):
+        with self._lock:
+            queues = self._subscribers.get(device_id)
+            if queues:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[device_id]
+
+    def publish(self, device_id, reading, event_id=None, event='reading'):
+        """Queue a reading (or other event, e.g. 'alert') for everyone watching device_id or all devices"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            targets = list(self._subscribers.get(None, ())) + list(self._subscribers.get(device_id, ()))
+        if not targets:
+            return
+        frame = format_event(dict(reading, device_id=device_id), event, event_id)
+        for q in targets:
+            while True:
+                try:
+                    q.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()  # drop the oldest event for this slow client
+                    except queue.Empty:
+                        pass
+
+    def stream(self, q, device_id=None, initial=None):
+        """Generator of SSE frames for one subscriber; unsubscribes on disconnect"""
+        try:
+            yield b"retry: 3000\n\n"
+            if initial is not None:
+                yield initial
+            while True:
+                try:
+                    yield q.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(q, device_id)
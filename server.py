@@ -1,145 +1,667 @@
 #!/usr/bin/env python3
 """
-SUPER SIMPLE Pi server - saves heartbeat timestamp to file
+SUPER SIMPLE Pi server - tracks ESP32 heartbeats and sensor readings in memory
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import json
 import time
 from datetime import datetime
 import os
+import sys
+import atexit
+import signal
+import argparse
+import logging
+
+import numpy as np
+
+from heartbeat_registry import HeartbeatRegistry
+from sensor_log import SensorLog, SensorLogFull, device_id_key, record_to_reading
+from sensor_rollup import RollupStore, DEFAULT_TIERS
+from sensor_stats import SensorStats
+from sensor_codec import ColumnBatch, UnsupportedPayload, decode_body
+from sensor_stream import SensorBroadcaster, format_event
+from soil_rating import rate
+from server_metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server_logging import LoggingPipeline
+from sensor_store import (
+    SensorStore, CHANNELS, CHANNEL_NAMES, DEFAULT_DEVICE_ID, DEFAULT_READING, column_checks, coerce_reading,
+    parse_timestamp
+)
 
 app = Flask(__name__)
 CORS(app)
 
-# File to store heartbeat timestamp
-HEARTBEAT_FILE = "esp32_heartbeat.txt"
-SENSOR_DATA_FILE = "sensor_data.json"
+# Handlers only enqueue log records; a background thread writes them out.
+# Every event (DEBUG and up) lands in the GET /debug/events ring; the
+# output is sampled per level and route (warnings and errors always pass).
+LOG_LEVEL = 'DEBUG'
+LOG_FORMAT = 'text'   # or 'json' (--log-format json)
+LOG_QUEUE_SIZE = 10000
+LOG_RING_SIZE = 2000
+LOG_LEVEL_SAMPLING = {'DEBUG': 0.0}   # payload echoes stay in the ring only
+LOG_ROUTE_SAMPLING = {'/sensor-data': 0.01, '/esp32-heartbeat': 0.01, '/sensor-data/batch': 0.1}
+
+logging_pipeline = LoggingPipeline(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    ring_size=LOG_RING_SIZE,
+    level_rates=LOG_LEVEL_SAMPLING,
+    route_rates=LOG_ROUTE_SAMPLING
+)
+log = logging.getLogger('server')
+
+# Instrumentation for GET /metrics (Prometheus text format)
+metrics = MetricsRegistry()
+http_requests = metrics.counter(
+    'http_requests_total', 'Requests handled, by route and status', ('method', 'route', 'status'))
+http_latency = metrics.histogram(
+    'http_request_duration_seconds', 'Time to build the response, by route', ('method', 'route'))
+body_parse_latency = metrics.histogram(
+    'request_body_parse_seconds', 'Time spent decoding request bodies', ('route',))
+readings_ingested = metrics.counter(
+    'sensor_readings_total', 'Sensor readings stored, by device', ('device',))
+file_write_latency = metrics.histogram(
+    'file_write_duration_seconds', 'Disk write and fsync time per flush', ('file', 'op'))
+file_write_bytes = metrics.counter(
+    'file_write_bytes_total', 'Bytes written to disk', ('file',))
+alerts_raised = metrics.counter(
+    'sensor_alerts_total', 'Threshold alert transitions', ('channel', 'kind', 'state'))
+file_write_errors = metrics.counter(
+    'file_write_errors_total', 'Failed disk writes (retried)', ('file',))
+
+# Card rendering runs in the Next.js route's worker (generate_health_card.py
+# --worker --metrics-file); its health_card_* metrics are appended from this
+# file so one scrape covers both (None disables it)
+HEALTH_CARD_METRICS_FILE = "health_card_metrics.prom"
+
+def record_log_write(nbytes, write_seconds, fsync_seconds):
+    if nbytes:
+        file_write_bytes.inc(nbytes, 'sensor_log')
+        file_write_latency.observe(write_seconds, 'sensor_log', 'write')
+    if fsync_seconds is not None:
+        file_write_latency.observe(fsync_seconds, 'sensor_log', 'fsync')
+
+def record_log_error(error):
+    file_write_errors.inc(1, 'sensor_log')
+
+def record_snapshot_write(nbytes, seconds):
+    file_write_bytes.inc(nbytes, 'heartbeat_snapshot')
+    file_write_latency.observe(seconds, 'heartbeat_snapshot', 'write')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.observe(time.perf_counter() - started, request.method, route)
+        http_requests.inc(1, request.method, route, str(response.status_code))
+    return response
+
+def timed_parse(route, parse):
+    """Run a body parser and record how long it took"""
+    started = time.perf_counter()
+    try:
+        return parse()
+    finally:
+        body_parse_latency.observe(time.perf_counter() - started, route)
+
+def read_body():
+    """Request body decoded per Content-Type (JSON/NDJSON, MessagePack, CBOR or packed
+    octet-stream) and Content-Encoding (gzip/deflate); see sensor_codec"""
+    return decode_body(request.get_data(), request.content_type,
+                       request.headers.get('Content-Encoding'), MAX_DECODED_BODY_BYTES)
+
+def query_limit(default, maximum):
+    """?limit= capped at maximum; ValueError (a 400) unless it is a positive integer"""
+    limit = int(request.args.get('limit', default))
+    if limit < 1:
+        raise ValueError(f'limit must be at least 1, got {limit}')
+    return min(limit, maximum)
+
+# Heartbeats live in memory; this file is only a periodic snapshot (None disables it)
+HEARTBEAT_FILE = "esp32_heartbeat.json"
+HEARTBEAT_TIMEOUT = 20.0           # seconds without a heartbeat before a device is DEAD
+HEARTBEAT_SWEEP_INTERVAL = 1.0     # how often the sweeper re-checks liveness
+HEARTBEAT_SNAPSHOT_INTERVAL = 30.0
+
+heartbeats = HeartbeatRegistry(
+    timeout=HEARTBEAT_TIMEOUT,
+    sweep_interval=HEARTBEAT_SWEEP_INTERVAL,
+    snapshot_file=HEARTBEAT_FILE,
+    snapshot_interval=HEARTBEAT_SNAPSHOT_INTERVAL,
+    on_snapshot=record_snapshot_write
+)
+heartbeats.start()
+
+# Append-only binary log of every reading (written by a background flusher)
+SENSOR_LOG_DIR = "sensor_log"
+SENSOR_LOG_MAX_BYTES = 64 * 1024 * 1024   # rotate segments at 64 MB or at UTC midnight
+SENSOR_LOG_FSYNC_EVERY = 256              # fsync after this many records...
+SENSOR_LOG_FSYNC_INTERVAL_MS = 1000       # ...or this long, whichever comes first
+SENSOR_LOG_MAX_PENDING = 100000           # queued records before ingest answers 503
+
+# Recent readings per device, kept in fixed-size ring buffers
+SENSOR_BUFFER_CAPACITY = 4096
+MAX_BATCH_RECORDS = 10000  # per POST /sensor-data/batch
+MAX_CLOCK_SKEW_SECONDS = 300  # device timestamps further in the future are rejected
+MIN_DEVICE_TIMESTAMP = 1577836800  # 2020-01-01 UTC; older means the device clock was never set
+MAX_DECODED_BODY_BYTES = 16 * 1024 * 1024  # gzip/deflate bodies may not inflate past this
+sensor_store = SensorStore(capacity=SENSOR_BUFFER_CAPACITY)
+
+# min/max/mean rollups per device for GET /sensor-history (1m / 15m / 1h tiers)
+ROLLUP_TIERS = DEFAULT_TIERS
+ROLLUP_REPLAY_SECONDS = 31 * 24 * 3600  # rebuild this much history from the log at startup
+MAX_HISTORY_BUCKETS = 1500              # bucket auto-selection keeps responses under this
+sensor_rollups = RollupStore(ROLLUP_TIERS)
+
+# Rolling per-device stats (Welford mean/std, EWMA, windowed min/max, rate of
+# change) and threshold alerts, all updated as readings arrive
+STATS_WINDOW_SECONDS = 300.0
+STATS_EWMA_ALPHA = 0.1
+ALERT_HISTORY_SIZE = 1000
+sensor_stats = SensorStats(
+    window_seconds=STATS_WINDOW_SECONDS,
+    ewma_alpha=STATS_EWMA_ALPHA,
+    history_size=ALERT_HISTORY_SIZE
+)
+
+# Live push of new readings to GET /sensor-data/stream subscribers
+sensor_broadcaster = SensorBroadcaster()
+
+# Each open stream holds a request thread; --serve caps them below the pool size
+MAX_STREAM_SUBSCRIBERS = None
+
+# Pre-serialized GET /sensor-data bodies: (device, last) -> (etag, bytes)
+SENSOR_RESPONSE_CACHE_SIZE = 256
+sensor_response_cache = {}
+
+sensor_log = SensorLog(
+    SENSOR_LOG_DIR,
+    max_segment_bytes=SENSOR_LOG_MAX_BYTES,
+    fsync_every=SENSOR_LOG_FSYNC_EVERY,
+    fsync_interval_ms=SENSOR_LOG_FSYNC_INTERVAL_MS,
+    on_write=record_log_write,
+    on_error=record_log_error,
+    max_pending=SENSOR_LOG_MAX_PENDING
+)
+
+def shutdown():
+    """Flush queued log records and snapshot heartbeats (safe to call twice)"""
+    atexit.unregister(shutdown)
+    sensor_log.close()
+    heartbeats.stop()
+    logging_pipeline.stop()
+
+atexit.register(shutdown)
+
+# Replay the newest logged readings so a restart still serves recent data
+try:
+    for record in sensor_log.tail(SENSOR_BUFFER_CAPACITY):
+        device_id, reading, timestamp = record_to_reading(record)
+        if timestamp > time.time() + MAX_CLOCK_SKEW_SECONDS:
+            continue  # logged before future timestamps were rejected
+        sensor_store.append(device_id, reading, timestamp)
+        sensor_stats.update(device_id, reading, timestamp)
+except Exception as e:
+    log.warning("Could not replay sensor log: %s", e)
+
+# Rebuild rollups straight from the mmap'd log, one vectorized pass per segment and device
+try:
+    for records in sensor_log.read(since=time.time() - ROLLUP_REPLAY_SECONDS,
+                                   until=time.time() + MAX_CLOCK_SKEW_SECONDS):
+        for raw_id in np.unique(records['device_id']):
+            rows = records[records['device_id'] == raw_id]
+            values = np.column_stack([rows[name] for name in CHANNEL_NAMES]).astype(np.float64)
+            sensor_rollups.add_columns(raw_id.decode('utf-8', 'ignore'), rows['timestamp'], values)
+except Exception as e:
+    log.warning("Could not rebuild rollups: %s", e)
+
+def publish_alerts(events):
+    for event in events:
+        alerts_raised.inc(1, event['channel'], event['kind'], event['state'])
+        if event['state'] == 'raised':
+            log.warning("🚨 %s: %s", event['device_id'], event['message'], extra={'fields': {'alert': event}})
+        else:
+            log.info("✅ %s: %s", event['device_id'], event['message'], extra={'fields': {'alert': event}})
+        sensor_broadcaster.publish(event['device_id'], event, event='alert')
+
+def store_reading(device_id, reading, timestamp):
+    """Single ingest path: append-only log, ring buffer, rolling stats, live subscribers
+
+    The log goes first: when it is backed up (SensorLogFull) nothing is stored.
+    """
+    sensor_log.append(device_id, reading, timestamp)
+    sensor_store.append(device_id, reading, timestamp)
+    sensor_rollups.add(device_id, [reading], [timestamp])
+    alerts = sensor_stats.update(device_id, reading, timestamp)
+    sensor_broadcaster.publish(device_id, dict(reading, timestamp=timestamp), sensor_store.version)
+    publish_alerts(alerts)
+    readings_ingested.inc(1, device_id)
+
+def store_batch(by_device):
+    """Batch ingest path; by_device maps device_id -> (readings, timestamps)"""
+    sensor_log.extend(
+        (device_id, reading, timestamp)
+        for device_id, (readings, timestamps) in by_device.items()
+        for reading, timestamp in zip(readings, timestamps)
+    )
+    for device_id, (readings, timestamps) in by_device.items():
+        sensor_store.extend(device_id, readings, timestamps)
+        sensor_rollups.add(device_id, readings, timestamps)
+        readings_ingested.inc(len(readings), device_id)
+    alerts = []
+    for device_id, (readings, timestamps) in by_device.items():
+        for reading, timestamp in sorted(zip(readings, timestamps), key=lambda pair: pair[1]):
+            alerts.extend(sensor_stats.update(device_id, reading, timestamp))
+    for device_id, (readings, timestamps) in by_device.items():
+        for reading, timestamp in zip(readings, timestamps):
+            sensor_broadcaster.publish(device_id, dict(reading, timestamp=timestamp), sensor_store.version)
+    publish_alerts(alerts)
 
-# Store latest sensor data
-latest_sensor_data = {
-    'temperature': 22.0,
-    'pH': 6.5,
-    'moisture': 45.0,
-    'nitrogen': 50,
-    'phosphorus': 30,
-    'potassium': 60
-}
+def store_columns(device_id, timestamps, columns):
+    """Columnar ingest path for packed / columnar bodies: arrays end to end, no dict per reading"""
+    values = np.column_stack([columns[name] for name in CHANNEL_NAMES]).astype(np.float64)
+    sensor_log.extend_columns(device_id, timestamps, columns)
+    sensor_store.extend_columns(device_id, columns, timestamps)
+    sensor_rollups.add_columns(device_id, timestamps, values)
+    alerts = sensor_stats.update_columns(device_id, timestamps, values)
+    readings_ingested.inc(len(timestamps), device_id)
+    if sensor_broadcaster.subscriber_count():
+        keys = ('timestamp',) + CHANNEL_NAMES
+        rows = zip(np.asarray(timestamps).tolist(),
+                   *(np.asarray(columns[name], dtype=dtype).tolist() for name, dtype, _ in CHANNELS))
+        for row in rows:
+            sensor_broadcaster.publish(device_id, dict(zip(keys, row)), sensor_store.version)
+    publish_alerts(alerts)
+
+def log_backed_up(e):
+    """503 for ingest while the sensor log cannot keep up (e.g. the disk is failing)"""
+    log.error("Rejecting readings: %s", e)
+    response = jsonify({'status': 'error', 'message': f'Storage is behind, retry later ({e})'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
 
 @app.route('/sensor-data', methods=['POST'])
 def receive_sensor_data():
-    """Receive sensor data from ESP32"""
-    global latest_sensor_data
-    
+    """Receive sensor data from ESP32 (JSON, MessagePack, CBOR or one packed record)"""
     try:
-        sensor_data = request.get_json()
+        sensor_data = timed_parse('/sensor-data', read_body)
         
-        if sensor_data:
-            print(f"Received sensor data: {sensor_data}")
-            
-            # Update latest sensor data
-            latest_sensor_data.update({
-                'temperature': float(sensor_data.get('temperature', 22.0)),
-                'pH': float(sensor_data.get('pH', 6.5)),
-                'moisture': float(sensor_data.get('moisture', 45.0)),
-                'nitrogen': int(sensor_data.get('nitrogen', 50)),
-                'phosphorus': int(sensor_data.get('phosphorus', 30)),
-                'potassium': int(sensor_data.get('potassium', 60))
-            })
+        if isinstance(sensor_data, ColumnBatch):
+            if len(sensor_data) != 1:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Expected one reading, got {len(sensor_data)} (use /sensor-data/batch)'
+                }), 400
+            for rejected, reason in column_checks(sensor_data.columns):
+                if rejected.any():
+                    return jsonify({'status': 'error', 'message': f'Invalid reading: {reason}'}), 400
+            device_id = sensor_data.device_id or DEFAULT_DEVICE_ID
+            device_id_key(device_id)
+            store_columns(device_id, np.array([time.time()]), sensor_data.columns)
+            log.info("📥 Reading from %s", device_id, extra={'route': '/sensor-data', 'fields': {'device': device_id}})
+            return jsonify({'status': 'success', 'message': 'Data received'}), 200
+        
+        if isinstance(sensor_data, dict) and sensor_data:
+            # Ring buffer + background log + SSE subscribers
+            device_id = str(sensor_data.get('device_id', DEFAULT_DEVICE_ID))
+            device_id_key(device_id)
+            store_reading(device_id, coerce_reading(sensor_data), time.time())
             
-            # Save to file
-            with open(SENSOR_DATA_FILE, 'w') as f:
-                json.dump(latest_sensor_data, f)
+            log.debug("Received sensor data", extra={'route': '/sensor-data', 'fields': {'payload': sensor_data}})
+            log.info("📥 Reading from %s", device_id, extra={'route': '/sensor-data', 'fields': {'device': device_id}})
             
             return jsonify({'status': 'success', 'message': 'Data received'}), 200
         else:
             return jsonify({'status': 'error', 'message': 'No data received'}), 400
             
+    except SensorLogFull as e:
+        return log_backed_up(e)
+    except UnsupportedPayload as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 415
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Malformed body: {e}'}), 400
+    except Exception as e:
+        log.error("Error receiving sensor data: %s", e, extra={'route': '/sensor-data'})
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def receive_column_batch(batch):
+    """Packed / columnar batch: validated with array masks and stored without per-record dicts"""
+    if not len(batch):
+        return jsonify({'status': 'error', 'message': 'No data received'}), 400
+    if len(batch) > MAX_BATCH_RECORDS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Batch too large ({len(batch)} > {MAX_BATCH_RECORDS} records)'
+        }), 413
+    
+    # Epoch milliseconds -> seconds, as parse_timestamp does for JSON records
+    timestamps = np.where(batch.timestamps > 1e10, batch.timestamps / 1000.0, batch.timestamps)
+    # Same checks, in the same order, as the per-record path; a row reports the first it fails
+    with np.errstate(invalid='ignore'):
+        checks = [
+            (~(np.isfinite(timestamps) & (timestamps > 0)), 'invalid timestamp'),
+            (timestamps > time.time() + MAX_CLOCK_SKEW_SECONDS, 'timestamp is in the future (check the device clock)'),
+            (timestamps < MIN_DEVICE_TIMESTAMP, 'timestamp is implausibly old (check the device clock)'),
+        ] + list(column_checks(batch.columns))
+    failed = np.zeros(len(batch), dtype=np.intp)  # 0: valid, otherwise 1 + index of the first failed check
+    for number, (rejected, _) in enumerate(checks, start=1):
+        failed[(failed == 0) & rejected] = number
+    valid = failed == 0
+    device_id = batch.device_id or DEFAULT_DEVICE_ID
+    device_id_key(device_id)
+    accepted = int(valid.sum())
+    if accepted == len(batch):
+        store_columns(device_id, timestamps, batch.columns)
+    elif accepted:
+        store_columns(device_id, timestamps[valid], {name: column[valid] for name, column in batch.columns.items()})
+    
+    log.info("📦 Received batch: %d/%d readings from 1 device(s)", accepted, len(batch),
+             extra={'route': '/sensor-data/batch', 'fields': {'devices': [device_id]}})
+    
+    # Only rejected records are listed; a packed batch can hold thousands of readings
+    return jsonify({
+        'status': 'success' if accepted else 'error',
+        'accepted': accepted,
+        'rejected': len(batch) - accepted,
+        'results': [{'index': index, 'accepted': False, 'error': checks[failed[index] - 1][1]}
+                    for index in np.flatnonzero(~valid).tolist()]
+    }), 200 if accepted else 400
+
+@app.route('/sensor-data/batch', methods=['POST'])
+def receive_sensor_data_batch():
+    """Receive buffered readings from ESP32 in bulk
+
+    Bodies: JSON array, NDJSON, MessagePack/CBOR arrays, a columnar map
+    ({"device_id", "timestamp": [...], "<channel>": [...]}) or packed
+    records (application/octet-stream), optionally gzip/deflate encoded.
+    Every record needs a device-side `timestamp` (epoch s/ms or ISO 8601) no
+    more than MAX_CLOCK_SKEW_SECONDS ahead of the server and no older than
+    MIN_DEVICE_TIMESTAMP; `device_id` defaults like the single-reading
+    endpoint. Bad records are rejected individually and the rest are still
+    stored.
+    """
+    try:
+        records = timed_parse('/sensor-data/batch', read_body)
+        
+        if isinstance(records, ColumnBatch):
+            return receive_column_batch(records)
+        if isinstance(records, dict):
+            records = [records]  # single-line NDJSON
+        if not records:
+            return jsonify({'status': 'error', 'message': 'No data received'}), 400
+        if not isinstance(records, list):
+            return jsonify({'status': 'error', 'message': 'Expected an array of records or NDJSON'}), 400
+        if len(records) > MAX_BATCH_RECORDS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Batch too large ({len(records)} > {MAX_BATCH_RECORDS} records)'
+            }), 413
+        
+        results = []
+        by_device = {}
+        latest_allowed = time.time() + MAX_CLOCK_SKEW_SECONDS
+        for index, record in enumerate(records):
+            try:
+                if isinstance(record, Exception):
+                    raise ValueError(f'invalid JSON: {record}')
+                if not isinstance(record, dict):
+                    raise ValueError('record must be a JSON object')
+                if 'timestamp' not in record:
+                    raise ValueError('missing timestamp')
+                device_id = str(record.get('device_id', DEFAULT_DEVICE_ID))
+                device_id_key(device_id)
+                timestamp = parse_timestamp(record['timestamp'])
+                if timestamp > latest_allowed:
+                    raise ValueError('timestamp is in the future (check the device clock)')
+                if timestamp < MIN_DEVICE_TIMESTAMP:
+                    raise ValueError('timestamp is implausibly old (check the device clock)')
+                reading = coerce_reading(record)
+            except (TypeError, ValueError) as e:
+                results.append({'index': index, 'accepted': False, 'error': str(e)})
+                continue
+            readings, timestamps = by_device.setdefault(device_id, ([], []))
+            readings.append(reading)
+            timestamps.append(timestamp)
+            results.append({'index': index, 'accepted': True})
+        
+        # One vectorized insert per device, one queue hand-off for the log
+        store_batch(by_device)
+        
+        accepted = sum(1 for r in results if r['accepted'])
+        log.info("📦 Received batch: %d/%d readings from %d device(s)", accepted, len(results), len(by_device),
+                 extra={'route': '/sensor-data/batch', 'fields': {'devices': sorted(by_device)}})
+        
+        return jsonify({
+            'status': 'success' if accepted else 'error',
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'results': results
+        }), 200 if accepted else 400
+        
+    except SensorLogFull as e:
+        return log_backed_up(e)
+    except UnsupportedPayload as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 415
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Malformed batch: {e}'}), 400
     except Exception as e:
-        print(f"Error receiving sensor data: {e}")
+        log.error("Error receiving sensor batch: %s", e, extra={'route': '/sensor-data/batch'})
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/esp32-heartbeat', methods=['POST'])
 def receive_heartbeat():
-    """Receive heartbeat from ESP32 - SAVE SIMPLE TIMESTAMP TO FILE"""
+    """Receive heartbeat from ESP32 - recorded in the in-memory registry"""
     try:
-        heartbeat_data = request.get_json()
+        heartbeat_data = timed_parse('/esp32-heartbeat', read_body)
         
-        if heartbeat_data:
-            print(f"Received heartbeat: {heartbeat_data}")
+        if isinstance(heartbeat_data, dict) and heartbeat_data:
+            device_id = str(heartbeat_data.get('device_id', DEFAULT_DEVICE_ID))
+            entry = heartbeats.beat(device_id, heartbeat_data)
             
-            # Save simple human-readable timestamp to file
-            current_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-            with open(HEARTBEAT_FILE, 'w') as f:
-                f.write(current_time)
-            
-            print(f"💓 Heartbeat saved to file: {current_time}")
+            log.debug("Received heartbeat", extra={'route': '/esp32-heartbeat', 'fields': {'payload': heartbeat_data}})
+            log.info("💓 Heartbeat from %s (#%d)", device_id, entry.count,
+                     extra={'route': '/esp32-heartbeat', 'fields': {'device': device_id}})
             
             return jsonify({'status': 'success', 'message': 'Heartbeat received'}), 200
         else:
             return jsonify({'status': 'error', 'message': 'No heartbeat data'}), 400
             
+    except UnsupportedPayload as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 415
     except Exception as e:
-        print(f"Error receiving heartbeat: {e}")
+        log.error("Error receiving heartbeat: %s", e, extra={'route': '/esp32-heartbeat'})
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def sensor_data_version(snapshot, device_id):
+    """Version that changes whenever the GET /sensor-data answer could change"""
+    if device_id:
+        return f"{device_id}.{snapshot.counts.get(device_id, 0)}"
+    return str(snapshot.version)
+
+def render_sensor_data(snapshot, device_id, last):
+    """(body, status) for GET /sensor-data, as of `snapshot` (a StoreSnapshot)"""
+    if last:
+        device_id = device_id or snapshot.last_device_id
+        readings = sensor_store.last(device_id, last)
+        return {'device_id': device_id, 'count': len(readings), 'readings': readings}, 200
+    
+    data = sensor_store.latest(device_id, snapshot)
+    if data is None:
+        if device_id:
+            return {'status': 'error', 'message': f'Unknown device: {device_id}'}, 404
+        data = DEFAULT_READING
+    return data, 200
+
 @app.route('/sensor-data', methods=['GET'])
 def get_sensor_data():
-    """Serve latest sensor data to dashboard"""
+    """Serve latest sensor data to dashboard
+
+    ?device=<id>  pick a device (default: whichever reported last)
+    ?last=<n>     return the newest n readings instead of just the latest
+
+    Responses carry an ETag; an unchanged If-None-Match gets a bodiless 304,
+    and unchanged bodies are served from pre-serialized bytes.
+    """
     try:
-        # Try to load from file
-        if os.path.exists(SENSOR_DATA_FILE):
-            with open(SENSOR_DATA_FILE, 'r') as f:
-                data = json.load(f)
-        else:
-            data = latest_sensor_data
+        device_id = request.args.get('device')
+        last = request.args.get('last', type=int)
+        
+        # One immutable snapshot for the whole request: the ETag and the body always agree
+        snapshot = sensor_store.snapshot
+        etag = sensor_data_version(snapshot, device_id)
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
         
-        return jsonify(data), 200
+        key = (device_id, last)
+        cached = sensor_response_cache.get(key)
+        if cached is None or cached[0] != etag:
+            data, status = render_sensor_data(snapshot, device_id, last)
+            body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            if len(sensor_response_cache) >= SENSOR_RESPONSE_CACHE_SIZE:
+                sensor_response_cache.clear()
+            cached = sensor_response_cache[key] = (etag, body, status)
+        
+        return Response(cached[1], status=cached[2], mimetype='application/json',
+                        headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
         
     except Exception as e:
-        print(f"Error serving sensor data: {e}")
-        return jsonify(latest_sensor_data), 200
+        log.error("Error serving sensor data: %s", e, extra={'route': '/sensor-data'})
+        return jsonify(DEFAULT_READING), 200
 
-@app.route('/heartbeat-status', methods=['GET'])
-def get_heartbeat_status():
-    """SUPER SIMPLE heartbeat check - read human-readable timestamp from file"""
+@app.route('/sensor-data/stream', methods=['GET'])
+def stream_sensor_data():
+    """Server-Sent Events: one `reading` event per ingested reading (?device=<id> to filter)"""
+    device_id = request.args.get('device')
+    if MAX_STREAM_SUBSCRIBERS and sensor_broadcaster.subscriber_count() >= MAX_STREAM_SUBSCRIBERS:
+        return jsonify({'status': 'error', 'message': 'Too many open streams, poll GET /sensor-data instead'}), 503
+    q = sensor_broadcaster.subscribe(device_id)
+    
+    snapshot = sensor_store.snapshot
+    latest = sensor_store.latest(device_id, snapshot)
+    initial = format_event(latest, event_id=snapshot.version) if latest else None
+    
+    return Response(
+        sensor_broadcaster.stream(q, device_id, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/sensor-history', methods=['GET'])
+def get_sensor_history():
+    """Downsampled history from the rollup tiers
+
+    ?device=<id>         default: whichever device reported last
+    ?from=&to=           epoch seconds or ISO 8601 (default: the last 24 hours)
+    ?bucket=1m|15m|1h    default: finest tier that fits in MAX_HISTORY_BUCKETS
+    ?ratings=1           add a rating per bucket mean (?crop=<name> picks the thresholds)
+    """
     try:
-        if not os.path.exists(HEARTBEAT_FILE):
-            return jsonify({
-                'esp32_alive': False,
-                'reason': 'No heartbeat file found'
-            }), 200
-        
-        # Read simple timestamp from file (format: "03-11-2024 22:30:15")
-        with open(HEARTBEAT_FILE, 'r') as f:
-            last_heartbeat_str = f.read().strip()
+        device_id = request.args.get('device') or sensor_store.last_device_id
+        end = parse_timestamp(request.args['to']) if 'to' in request.args else time.time()
+        start = parse_timestamp(request.args['from']) if 'from' in request.args else end - 24 * 3600
+        bucket = request.args.get('bucket') or sensor_rollups.pick_bucket(start, end, MAX_HISTORY_BUCKETS)
         
-        # Parse the timestamp
-        last_heartbeat_time = datetime.strptime(last_heartbeat_str, "%d-%m-%Y %H:%M:%S")
-        current_time = datetime.now()
+        if bucket not in ROLLUP_TIERS:
+            return jsonify({
+                'status': 'error',
+                'message': f"Unknown bucket '{bucket}', expected one of {', '.join(ROLLUP_TIERS)}"
+            }), 400
+        if end < start:
+            return jsonify({'status': 'error', 'message': "'from' must be before 'to'"}), 400
         
-        # Calculate difference in seconds
-        time_diff = current_time - last_heartbeat_time
-        seconds_since = int(time_diff.total_seconds())
+        history = sensor_rollups.query(device_id, bucket, start, end)
+        if history is None:
+            return jsonify({'status': 'error', 'message': f'Unknown device: {device_id}'}), 404
         
-        # ESP32 is alive if heartbeat is within 20 seconds
-        esp32_alive = seconds_since < 20
+        if request.args.get('ratings'):
+            crop = request.args.get('crop')
+            for name, channel in history['channels'].items():
+                channel['rating'] = rate(name, channel['mean'], crop).tolist()
         
-        print(f"🔍 Current time: {current_time.strftime('%d-%m-%Y %H:%M:%S')}")
-        print(f"🔍 Last heartbeat: {last_heartbeat_str}")
-        print(f"🔍 Seconds since: {seconds_since}")
-        print(f"🔍 ESP32 alive: {esp32_alive}")
+        history.update({'device_id': device_id, 'bucket': bucket, 'from': start, 'to': end})
+        return jsonify(history), 200
         
+    except (KeyError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Bad query: {e}'}), 400
+    except Exception as e:
+        log.error("Error serving sensor history: %s", e, extra={'route': '/sensor-history'})
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/sensor-stats', methods=['GET'])
+def get_sensor_stats():
+    """Rolling per-channel stats maintained at ingest (no rescan)
+
+    ?device=<id>  one device (default: whichever device reported last)
+    ?all=1        every device
+    """
+    if request.args.get('all'):
+        return jsonify({'devices': sensor_stats.all_stats()}), 200
+    device_id = request.args.get('device') or sensor_store.last_device_id
+    stats = sensor_stats.stats(device_id)
+    if stats is None:
+        return jsonify({'status': 'error', 'message': f'No readings for device {device_id}'}), 404
+    stats['device_id'] = device_id
+    return jsonify(stats), 200
+
+@app.route('/alerts', methods=['GET'])
+def get_alerts():
+    """Active threshold alerts plus recent raised/cleared events
+
+    ?device=<id>  only this device
+    ?limit=<n>    recent events to include (default 50)
+    """
+    try:
+        device_id = request.args.get('device')
+        limit = query_limit(50, ALERT_HISTORY_SIZE)
+        active = sensor_stats.active_alerts(device_id)
         return jsonify({
-            'esp32_alive': esp32_alive,
-            'seconds_since_heartbeat': seconds_since,
-            'last_heartbeat': last_heartbeat_str,
-            'current_time': current_time.strftime('%d-%m-%Y %H:%M:%S')
+            'active': active,
+            'active_count': len(active),
+            'recent': sensor_stats.recent_alerts(limit, device_id)
         }), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Bad query: {e}'}), 400
+
+@app.route('/heartbeat-status', methods=['GET'])
+def get_heartbeat_status():
+    """Heartbeat check from the in-memory registry (never touches disk)
+
+    ?device=<id>  one device (default: whichever beat last)
+    ?all=1        every known device
+    """
+    try:
+        current_time = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+        
+        if request.args.get('all'):
+            devices = heartbeats.all_status()
+            return jsonify({
+                'devices': devices,
+                'alive_count': sum(1 for d in devices.values() if d['esp32_alive']),
+                'timeout_seconds': heartbeats.timeout,
+                'current_time': current_time
+            }), 200
+        
+        status = heartbeats.status(request.args.get('device'))
+        if status is None:
+            return jsonify({
+                'esp32_alive': False,
+                'reason': 'No heartbeat received'
+            }), 200
+        
+        status['current_time'] = current_time
+        return jsonify(status), 200
         
     except Exception as e:
-        print(f"Error checking heartbeat: {e}")
+        log.error("Error checking heartbeat: %s", e, extra={'route': '/heartbeat-status'})
         return jsonify({
             'esp32_alive': False,
             'reason': f'Error: {str(e)}'
@@ -147,56 +669,147 @@ def get_heartbeat_status():
 
 @app.route('/reset-heartbeat', methods=['POST'])
 def reset_heartbeat():
-    """Reset heartbeat file (for debugging)"""
+    """Forget heartbeats (for debugging) - ?device=<id> for one device, otherwise all"""
     try:
-        if os.path.exists(HEARTBEAT_FILE):
-            os.remove(HEARTBEAT_FILE)
-            print("🗑️ Heartbeat file deleted")
-        return jsonify({'status': 'success', 'message': 'Heartbeat file reset'}), 200
+        heartbeats.reset(request.args.get('device'))
+        log.info("🗑️ Heartbeat registry reset", extra={'route': '/reset-heartbeat'})
+        return jsonify({'status': 'success', 'message': 'Heartbeat registry reset'}), 200
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def resident_memory_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+metrics.gauge('process_resident_memory_bytes', 'Resident memory of the server process', resident_memory_bytes)
+metrics.gauge('sensor_stream_subscribers', 'Open GET /sensor-data/stream connections',
+              sensor_broadcaster.subscriber_count)
+metrics.gauge('heartbeat_devices_alive', 'Devices with a recent heartbeat', heartbeats.alive_count)
+metrics.gauge('sensor_devices', 'Devices with buffered readings', lambda: len(sensor_store.device_ids()))
+metrics.gauge('sensor_log_queue_records', 'Readings waiting for the log flusher', sensor_log.pending_count)
+metrics.gauge('sensor_alerts_active', 'Threshold alerts currently raised', lambda: len(sensor_stats.active_alerts()))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint (server metrics plus the card worker's, when it has written them)"""
+    body = metrics.render()
+    if HEALTH_CARD_METRICS_FILE:
+        try:
+            with open(HEALTH_CARD_METRICS_FILE, encoding='utf-8') as f:
+                body += f.read()
+        except OSError:
+            pass  # no card rendered yet, or the worker runs without --metrics-file
+    return Response(body, mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/debug/events', methods=['GET'])
+def get_debug_events():
+    """Recent log events from the in-memory ring (unsampled, newest first)
+
+    ?limit=<n>       default 100
+    ?level=<name>    minimum level, e.g. warning
+    ?route=<path>    only events logged for this route
+    """
+    try:
+        limit = query_limit(100, LOG_RING_SIZE)
+        events = logging_pipeline.ring.recent(limit, request.args.get('level'), request.args.get('route'))
+        return jsonify({'events': events, 'logging': logging_pipeline.stats()}), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Bad query: {e}'}), 400
+
 @app.route('/', methods=['GET'])
 def index():
     """Simple index page"""
-    try:
-        # Check heartbeat status using simple timestamp
-        esp32_alive = False
-        last_heartbeat_display = "Never"
-        
-        if os.path.exists(HEARTBEAT_FILE):
-            with open(HEARTBEAT_FILE, 'r') as f:
-                last_heartbeat_str = f.read().strip()
-            
-            last_heartbeat_display = last_heartbeat_str
-            last_heartbeat_time = datetime.strptime(last_heartbeat_str, "%d-%m-%Y %H:%M:%S")
-            current_time = datetime.now()
-            seconds_since = int((current_time - last_heartbeat_time).total_seconds())
-            esp32_alive = seconds_since < 20
-    except:
-        esp32_alive = False
+    status = heartbeats.status() or {'esp32_alive': False, 'last_heartbeat': 'Never'}
     
     return jsonify({
         'message': 'SUPER SIMPLE ESP32 Server',
-        'esp32_status': 'ALIVE' if esp32_alive else 'DEAD',
-        'last_heartbeat': last_heartbeat_display,
+        'esp32_status': 'ALIVE' if status['esp32_alive'] else 'DEAD',
+        'last_heartbeat': status['last_heartbeat'],
+        'alive_devices': heartbeats.alive_count(),
+        'devices': sensor_store.device_ids(),
         'current_time': datetime.now().strftime('%d-%m-%Y %H:%M:%S'),
         'endpoints': {
             'POST /sensor-data': 'Receive sensor data from ESP32',
-            'GET /sensor-data': 'Get latest sensor data',
-            'POST /esp32-heartbeat': 'Receive heartbeat (saves human-readable timestamp)',
-            'GET /heartbeat-status': 'Check if ESP32 is alive (reads human-readable timestamp)'
+            'POST /sensor-data/batch': 'Receive buffered readings (JSON/NDJSON, msgpack, CBOR, packed; gzip ok)',
+            'GET /sensor-data': 'Get latest sensor data (?device=<id>&last=<n>, ETag/304)',
+            'GET /sensor-data/stream': 'Server-Sent Events push of new readings (?device=<id>)',
+            'GET /sensor-history': 'min/max/mean per bucket (?device=&from=&to=&bucket=1m|15m|1h)',
+            'GET /sensor-stats': 'Rolling mean/std/EWMA/min/max/rate per channel (?device=<id> or ?all=1)',
+            'GET /alerts': 'Active threshold alerts and recent transitions (?device=&limit=)',
+            'POST /esp32-heartbeat': 'Receive heartbeat (per device_id, kept in memory)',
+            'GET /heartbeat-status': 'Check if ESP32 is alive (?device=<id> or ?all=1)',
+            'GET /metrics': 'Prometheus metrics (request latency, ingest rate, disk I/O, card render times)',
+            'GET /debug/events': 'Recent log events (?limit=&level=&route=)'
         }
     }), 200
 
+def serve(host, port, workers):
+    """Production server: no debugger or reloader, `workers` request threads
+
+    Everything (ring buffers, rollups, heartbeats, SSE subscribers) lives in
+    this one process and the log has a single writer thread, so all workers
+    share the same state. Separate processes would each see only their own
+    slice of the fleet, hence threads rather than forked workers. Readers
+    work from immutable snapshots (sensor_store, heartbeats) and never take
+    the writers' locks, so adding workers does not slow ingest down.
+    """
+    global MAX_STREAM_SUBSCRIBERS
+    MAX_STREAM_SUBSCRIBERS = max(1, workers // 2)
+    
+    # SIGTERM (systemd, docker stop) unwinds like Ctrl+C so queued writes get flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    try:
+        from waitress import create_server
+        server = create_server(app, host=host, port=port, threads=workers)
+        run = server.run
+        log.info("🏭 Serving on http://%s:%d with waitress (%d threads)", host, port, workers)
+    except ImportError:
+        from werkzeug.serving import make_server
+        server = make_server(host, port, app, threaded=True)
+        run = server.serve_forever
+        log.info("🏭 Serving on http://%s:%d with Werkzeug threaded server (pip install waitress)", host, port)
+    
+    try:
+        run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.info("🛑 Shutting down - flushing sensor log")
+        shutdown()
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ESP32 sensor / heartbeat server')
+    parser.add_argument('--serve', action='store_true', help='production mode (no debug reloader)')
+    parser.add_argument('--workers', type=int, default=8, help='request threads in --serve mode')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--log-format', choices=['text', 'json'], default=LOG_FORMAT)
+    parser.add_argument('--log-level', default=LOG_LEVEL, help='lowest level recorded (ring and output)')
+    args = parser.parse_args()
+    logging_pipeline.set_format(args.log_format)
+    logging_pipeline.set_level(args.log_level)
+    
     print("🚀 Starting SIMPLE ESP32 Server...")
-    print("📁 Heartbeat file:", HEARTBEAT_FILE)
-    print("📁 Sensor data file:", SENSOR_DATA_FILE)
+    print("📁 Heartbeat snapshot file:", HEARTBEAT_FILE)
+    print("📁 Sensor log directory:", SENSOR_LOG_DIR)
     print("🔗 Endpoints:")
     print("  POST /sensor-data     - Receive data from ESP32")
+    print("  POST /sensor-data/batch - Receive buffered readings in bulk")
     print("  GET /sensor-data      - Serve data to dashboard")
-    print("  POST /esp32-heartbeat - Receive heartbeat (saves timestamp to file)")
-    print("  GET /heartbeat-status - Check ESP32 status (reads timestamp from file)")
+    print("  GET /sensor-data/stream - Push new readings (Server-Sent Events)")
+    print("  GET /sensor-history   - Downsampled history (1m / 15m / 1h rollups)")
+    print("  GET /sensor-stats     - Rolling per-channel stats (updated at ingest)")
+    print("  GET /alerts           - Active threshold alerts")
+    print("  POST /esp32-heartbeat - Receive heartbeat (kept in memory)")
+    print("  GET /heartbeat-status - Check ESP32 status (no disk access)")
+    print("  GET /metrics          - Prometheus metrics")
+    print("  GET /debug/events     - Recent log events (in-memory ring)")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    if args.serve:
+        serve(args.host, args.port, args.workers)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
\ No newline at end of file
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Non-blocking, sampled logging for server.py
+
+Request handlers only append to an in-memory queue; a background listener
+thread does the formatting and the (possibly slow) stdout/journald writes.
+On top of that:
+  * sampling: per level and per route, keep 1 in N records on the output
+    (warnings and errors are always kept)
+  * structured output: one JSON object per line, or readable text
+  * a bounded ring of recent events, unsampled, for GET /debug/events
+
+Log with `extra={'route': ..., 'fields': {...}}` to get the route used for
+sampling and extra structured fields on the event.
+"""
+
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import deque
+
+
+def level_number(level):
+    """logging level from a name ('info') or number"""
+    if isinstance(level, int):
+        return level
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"unknown log level {level!r}")
+    return number
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every Nth record per (level, route); rates are fractions in [0, 1]"""
+
+    def __init__(self, level_rates=None, route_rates=None):
+        super().__init__()
+        self.level_rates = {level_number(level): rate for level, rate in (level_rates or {}).items()}
+        self.route_rates = dict(route_rates or {})
+        self._counters = {}
+        self.sampled_out = 0
+
+    def rate_for(self, record):
+        """The stricter of the level's and the route's rate"""
+        if record.levelno >= logging.WARNING:
+            return 1.0
+        rate = self.level_rates.get(record.levelno, 1.0)
+        route = getattr(record, 'route', None)
+        if route in self.route_rates:
+            rate = min(rate, self.route_rates[route])
+        return rate
+
+    def filter(self, record):
+        rate = self.rate_for(record)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            self.sampled_out += 1
+            return False
+        key = (record.levelno, getattr(record, 'route', None))
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        keep = next(counter) % round(1 / rate) == 0
+        if not keep:
+            self.sampled_out += 1
+        return keep
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # No formatting on the request thread; the listener formats it
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def event_dict(record):
+    """Structured form of a record: time, level, logger, message, route and extra fields"""
+    event = {
+        'ts': round(record.created, 3),
+        'level': record.levelname,
+        'logger': record.name,
+        'msg': record.getMessage(),
+    }
+    route = getattr(record, 'route', None)
+    if route is not None:
+        event['route'] = route
+    fields = getattr(record, 'fields', None)
+    if fields:
+        event.update(fields)
+    if record.exc_info:
+        event['exc'] = logging.Formatter().formatException(record.exc_info)
+    return event
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(event_dict(record), default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        event = event_dict(record)
+        stamp = time.strftime('%d-%m-%Y %H:%M:%S', time.localtime(record.created))
+        extra = ' '.join(f'{key}={value}' for key, value in event.items()
+                         if key not in ('ts', 'level', 'logger', 'msg', 'exc'))
+        line = f"{stamp} {record.levelname:<7} {event['msg']}" + (f"  [{extra}]" if extra else '')
+        return line + ('\n' + event['exc'] if 'exc' in event else '')
+
+
+class RingBufferHandler(logging.Handler):
+    """Last `capacity` events as dicts, newest last (appending is O(1), no I/O)"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.events = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.events.append(record)
+
+    def recent(self, limit=100, level=None, route=None):
+        """Newest-first event dicts, optionally filtered by minimum level and route"""
+        minimum = level_number(level) if level else 0
+        result = []
+        for record in reversed(list(self.events)):
+            if record.levelno < minimum or (route and getattr(record, 'route', None) != route):
+                continue
+            result.append(event_dict(record))
+            if len(result) >= limit:
+                break
+        return result
+
+
+class LoggingPipeline:
+    """Root logging setup: ring buffer (all events) + sampled, queued writer (stream output)"""
+
+    def __init__(self, level='INFO', fmt='text', stream=None, queue_size=10000, ring_size=1000,
+                 level_rates=None, route_rates=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.ring = RingBufferHandler(ring_size)
+        self.sampler = SamplingFilter(level_rates, route_rates)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.queue_handler.addFilter(self.sampler)
+
+        self.output = logging.StreamHandler(stream or sys.stdout)
+        self.set_format(fmt)
+        self.listener = logging.handlers.QueueListener(self.queue, self.output, respect_handler_level=False)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.ring)
+        root.addHandler(self.queue_handler)
+        root.setLevel(level_number(level))
+        self.listener.start()
+
+    def set_format(self, fmt):
+        """'json' (one object per line) or 'text'"""
+        self.output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    def set_level(self, level):
+        logging.getLogger().setLevel(level_number(level))
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'sampled_out': self.sampler.sampled_out,
+            'ring_size': len(self.ring.events),
+        }
+
+    def stop(self):
+        """Write out everything still queued (safe to call twice)"""
+        if self.listener._thread is not None:
+            self.listener.stop()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms)
+
+No client library needed: each metric keeps its series in a dict keyed by
+label values and MetricsRegistry.render() produces the text exposition
+format for GET /metrics. Recording is a dict lookup, a bisect and a few
+additions under a per-metric lock, cheap enough to leave on in production.
+"""
+
+import bisect
+import threading
+
+# Seconds; covers sub-millisecond handlers up to slow disk syncs and renders
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._series.get(labelvalues, 0)
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        lines = self.header()
+        for labelvalues, value in sorted(series):
+            lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}')
+        return lines
+
+
+class Gauge(Metric):
+    """Value read at scrape time from `function`, returning a number or {labelvalues: number}"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def render(self):
+        value = self.function()
+        series = value.items() if isinstance(value, dict) else [((), value)]
+        lines = self.header()
+        for labelvalues, number in sorted(series):
+            if not isinstance(labelvalues, tuple):
+                labelvalues = (labelvalues,)
+            lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(number)}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # per-bucket (non-cumulative) counts + overflow, then sum
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        with self._lock:
+            series = [(labelvalues, list(counts), total) for labelvalues, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labelvalues, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}')
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_number(round(total, 9))}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        return self._register(Gauge(name, documentation, function, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Table-driven soil ratings and fertilizer recommendations
+
+Thresholds live in plain tables (one per crop, falling back to 'default'),
+and every function accepts scalars or NumPy arrays: a whole device history
+is rated with one np.digitize per parameter instead of a Python loop.
+
+    rate('pH', 6.8)                          -> 'Optimal'
+    rate('nitrogen', history['nitrogen'])    -> array(['Low', 'Medium', ...])
+    rate_readings({'pH': [...], ...}, crop='rice')
+    recommend(nitrogen=[20, 45], phosphorus=30, potassium=80)
+"""
+
+import numpy as np
+
+# 'band' parameters are best inside a range: Optimal inside `optimal`, Good
+# inside `good`, Poor outside. 'level' parameters are Low below `medium`,
+# Medium below `high`, High from there on. All bounds are inclusive.
+DEFAULT_THRESHOLDS = {
+    'temperature': {'kind': 'band', 'optimal': (20, 30), 'good': (15, 35)},
+    'pH': {'kind': 'band', 'optimal': (6.0, 7.5), 'good': (5.5, 8.0)},
+    'moisture': {'kind': 'band', 'optimal': (40, 70), 'good': (30, 80)},
+    'nitrogen': {'kind': 'level', 'medium': 25, 'high': 50},
+    'phosphorus': {'kind': 'level', 'medium': 25, 'high': 50},
+    'potassium': {'kind': 'level', 'medium': 25, 'high': 50},
+}
+
+# Per-crop overrides of DEFAULT_THRESHOLDS plus the crop shown on the card
+CROPS = {
+    'default': {'name': 'Mixed Vegetables', 'yield': '4.0 t/ha', 'thresholds': {}},
+    'rice': {
+        'name': 'Rice (Paddy)', 'yield': '5.5 t/ha',
+        'thresholds': {
+            'pH': {'kind': 'band', 'optimal': (5.5, 6.5), 'good': (5.0, 7.5)},
+            'moisture': {'kind': 'band', 'optimal': (60, 90), 'good': (50, 100)},
+        }
+    },
+    'wheat': {
+        'name': 'Wheat', 'yield': '4.5 t/ha',
+        'thresholds': {
+            'temperature': {'kind': 'band', 'optimal': (12, 25), 'good': (8, 30)},
+            'moisture': {'kind': 'band', 'optimal': (35, 60), 'good': (25, 70)},
+        }
+    },
+    'potato': {
+        'name': 'Potato', 'yield': '25 t/ha',
+        'thresholds': {
+            'pH': {'kind': 'band', 'optimal': (5.0, 6.5), 'good': (4.8, 7.0)},
+            'temperature': {'kind': 'band', 'optimal': (15, 22), 'good': (10, 27)},
+        }
+    },
+}
+
+BAND_LABELS = ('Poor', 'Good', 'Optimal', 'Good', 'Poor')
+LEVEL_LABELS = ('Low', 'Medium', 'High')
+MISSING_LABEL = 'N/A'      # value could not be read as a number
+UNKNOWN_LABEL = 'Normal'   # parameter has no threshold table
+
+PARAMETER_ALIASES = {'ph': 'pH', 'ph_level': 'pH', 'soil_moisture': 'moisture'}
+
+# Nitrogen advice: (readings below this, advice), the last entry catches the rest
+NITROGEN_ADVICE = [
+    (30, 'High Nitrogen needed - Urea 300kg/ha'),
+    (50, 'Medium Nitrogen - Urea 200kg/ha'),
+    (None, 'Low Nitrogen - Urea 100kg/ha'),
+]
+NITROGEN_MISSING_ADVICE = 'Nitrogen not measured'
+
+# Assumed when a reading is absent, as on the printed card
+RECOMMENDATION_DEFAULTS = {'nitrogen': 50, 'phosphorus': 30, 'potassium': 80}
+
+_compiled = {}
+
+
+def canonical_parameter(param):
+    return PARAMETER_ALIASES.get(param, PARAMETER_ALIASES.get(str(param).lower(), param))
+
+
+def crop_profile(crop=None):
+    """Crop entry from CROPS ('default' for None or unknown crops)"""
+    return CROPS.get(str(crop).lower() if crop else 'default', CROPS['default'])
+
+
+def thresholds_for(crop=None):
+    """Merged threshold table for a crop"""
+    return dict(DEFAULT_THRESHOLDS, **crop_profile(crop)['thresholds'])
+
+
+def register_crop(key, name, yield_text, thresholds=None):
+    """Add or replace a crop profile at runtime"""
+    CROPS[key.lower()] = {'name': name, 'yield': yield_text, 'thresholds': dict(thresholds or {})}
+    _compiled.clear()
+
+
+def _compile(spec):
+    """(edges, labels) for np.digitize; upper bounds are nudged up so they stay inclusive"""
+    if spec['kind'] == 'band':
+        (opt_lo, opt_hi), (good_lo, good_hi) = spec['optimal'], spec['good']
+        edges = [good_lo, opt_lo, np.nextafter(opt_hi, np.inf), np.nextafter(good_hi, np.inf)]
+        return np.array(edges, dtype=np.float64), np.array(BAND_LABELS)
+    if spec['kind'] == 'level':
+        return np.array([spec['medium'], spec['high']], dtype=np.float64), np.array(LEVEL_LABELS)
+    raise ValueError(f"unknown threshold kind {spec['kind']!r}")
+
+
+def _table(param, crop):
+    key = (param, crop_profile(crop)['name'])
+    table = _compiled.get(key)
+    if table is None:
+        spec = thresholds_for(crop).get(param)
+        table = _compiled[key] = _compile(spec) if spec else None
+    return table
+
+
+def to_float_array(values):
+    """float64 array of values; anything that is not a number becomes NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        def number(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+        return np.vectorize(number, otypes=[np.float64])(np.asarray(values, dtype=object))
+
+
+def rate(param, values, crop=None):
+    """Rating label(s) for one parameter; a scalar in gives a str out"""
+    param = canonical_parameter(param)
+    values = to_float_array(values)
+    table = _table(param, crop)
+    if table is None:
+        labels = np.full(values.shape, UNKNOWN_LABEL)
+    else:
+        edges, names = table
+        labels = np.where(np.isnan(values), MISSING_LABEL, names[np.digitize(values, edges)])
+    return str(labels) if labels.ndim == 0 else labels
+
+
+def rate_readings(readings, crop=None):
+    """{parameter: rating(s)} for a dict of values or equally-shaped arrays"""
+    return {name: rate(name, values, crop) for name, values in readings.items()}
+
+
+def recommend(nitrogen=None, phosphorus=None, potassium=None, crop=None):
+    """Fertilizer recommendation(s); scalars give strs, arrays give arrays
+
+    Returns {'crop', 'yield', 'fert_combo1', 'fert_combo2'}.
+    """
+    values = {}
+    for name, value in (('nitrogen', nitrogen), ('phosphorus', phosphorus), ('potassium', potassium)):
+        values[name] = to_float_array(RECOMMENDATION_DEFAULTS[name] if value is None else value)
+    n, p, k = np.broadcast_arrays(values['nitrogen'], values['phosphorus'], values['potassium'])
+
+    limits = np.array([limit for limit, _ in NITROGEN_ADVICE[:-1]], dtype=np.float64)
+    advice = np.array([text for _, text in NITROGEN_ADVICE] + [NITROGEN_MISSING_ADVICE])
+    choice = np.where(np.isnan(n), len(NITROGEN_ADVICE), np.searchsorted(limits, n, side='right'))
+    combo1 = advice[choice]
+
+    combo2 = 'NPK Complex based on N:'
+    for label, column in (('', n), (' P:', p), (' K:', k)):
+        combo2 = np.char.add(np.char.add(combo2, label), np.char.mod('%.0f', column))
+
+    profile = crop_profile(crop)
+    if combo1.ndim == 0:
+        combo1, combo2 = str(combo1), str(combo2)
+    return {'crop': profile['name'], 'yield': profile['yield'], 'fert_combo1': combo1, 'fert_combo2': combo2}
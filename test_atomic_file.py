@@ -0,0 +1,42 @@
+"""Tests for atomic_file: whole-file replacement and cleanup on failure"""
+
+import os
+import stat
+
+import pytest
+
+import atomic_file
+from atomic_file import atomic_write
+
+
+def test_writes_bytes_and_text(tmp_path):
+    path = tmp_path / 'out.json'
+    assert atomic_write(str(path), b'{"a": 1}') == 8
+    assert path.read_bytes() == b'{"a": 1}'
+    assert atomic_write(str(path), 'ünïcode', fsync=False) == len('ünïcode'.encode('utf-8'))
+    assert path.read_text(encoding='utf-8') == 'ünïcode'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+    assert os.listdir(tmp_path) == ['out.json']
+
+
+def test_open_readers_keep_the_old_file(tmp_path):
+    path = tmp_path / 'card.png'
+    path.write_bytes(b'old')
+    with open(path, 'rb') as reader:
+        atomic_write(str(path), b'new contents')
+        assert reader.read() == b'old'
+    assert path.read_bytes() == b'new contents'
+
+
+def test_failed_write_leaves_the_target_and_no_temp_file(tmp_path, monkeypatch):
+    path = tmp_path / 'state.json'
+    path.write_bytes(b'intact')
+
+    def full_disk(fd):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(atomic_file.os, 'fsync', full_disk)
+    with pytest.raises(OSError):
+        atomic_write(str(path), b'replacement')
+    assert path.read_bytes() == b'intact'
+    assert os.listdir(tmp_path) == ['state.json']
@@ -0,0 +1,38 @@
+"""Tests for bench_health_card: production phase hooks and the regression gate"""
+
+from bench_health_card import PhaseTimer, build_template, peak_rss_mb, regressions, render_card
+
+
+def test_template_build_is_timed_through_the_production_hooks():
+    timer = PhaseTimer()
+    build_template(36, timer)
+    assert list(timer.seconds) == ['figure', 'patches', 'static_text', 'draw', 'tight_bbox']
+
+
+def test_vector_render_phases():
+    timer = PhaseTimer()
+    assert render_card('svg', None, timer)
+    assert 'svg' in timer.seconds
+    timer = PhaseTimer()
+    assert render_card('pdf', None, timer)
+    assert {'figure', 'patches', 'static_text', 'draw_text', 'encode'} <= set(timer.seconds)
+
+
+def test_regressions_gate_every_reported_metric():
+    def result(p50, p95, template, cold):
+        return {
+            'warm': {'png@150': {'total_ms': {'p50': p50, 'p95': p95}}},
+            'template_build': {'150': {'total_ms': template}},
+            'cold': {'png@150': {'total_ms': cold}},
+        }
+
+    baseline = result(10, 20, 300, 1000)
+    assert regressions(result(10, 20, 300, 1000), baseline, 10) == []
+    assert regressions(result(12, 20, 300, 1000), baseline, 10) == ['png@150 warm p50']
+    assert regressions(result(10, 30, 400, 1500), baseline, 10) == [
+        'png@150 warm p95', 'template@150', 'png@150 cold']
+    assert regressions(result(50, 50, 500, 5000), {'warm': {}}, 10) == []  # nothing to compare against
+
+
+def test_peak_rss_is_reported():
+    assert peak_rss_mb() > 0
@@ -0,0 +1,75 @@
+"""Tests for bench_server: latency summaries and the connection check"""
+
+import http.server
+import os
+import threading
+
+import pytest
+
+from bench_server import Client, Recorder, check_connection, free_port, rss_mb, start_server, stop_server
+
+
+def test_recorder_summary():
+    recorder = Recorder()
+    for ms in range(1, 101):
+        recorder.add('GET /sensor-data', ms / 1000.0, ok=ms != 100)
+    recorder.add('POST /sensor-data', 0.002, ok=True)
+    endpoints, totals = recorder.summary(duration=10.0)
+    stats = endpoints['GET /sensor-data']
+    assert stats['requests'] == 100 and stats['errors'] == 1 and stats['error_rate'] == 0.01
+    assert stats['latency_ms']['p50'] == 50.5 and stats['latency_ms']['max'] == 100.0
+    assert totals == {'requests': 101, 'errors': 1, 'error_rate': 0.0099, 'throughput_rps': 10.1}
+
+
+def test_rss_of_this_process():
+    assert rss_mb(os.getpid()) > 0
+    assert rss_mb(-1) is None
+
+
+@pytest.fixture
+def stub_server():
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = 500 if self.path == '/heartbeat-status' else 200
+            self.send_response(status)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', free_port()), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_connection_reports_failing_endpoints(stub_server, capsys):
+    assert check_connection(stub_server) is False
+    output = capsys.readouterr().out
+    assert '✅ GET /sensor-data' in output and '❌ GET /heartbeat-status (500)' in output
+
+
+def test_client_labels_keep_the_query_string(stub_server):
+    recorder = Recorder()
+    client = Client(stub_server, recorder)
+    client.request('GET', '/sensor-data?last=10')
+    client.request('GET', '/sensor-data?last=500')
+    client.request('GET', '/heartbeat-status')
+    client.close()
+    endpoints, _ = recorder.summary(duration=1.0)
+    assert sorted(endpoints) == ['GET /heartbeat-status', 'GET /sensor-data?last=10', 'GET /sensor-data?last=500']
+    assert endpoints['GET /heartbeat-status']['errors'] == 1
+
+
+def test_start_and_stop_server(tmp_path):
+    process, base_url = start_server(2, str(tmp_path))
+    try:
+        assert check_connection(base_url) is True
+    finally:
+        stop_server(process)
+    assert process.returncode == 0
+    assert 'Serving on' in (tmp_path / 'server.out').read_text()
@@ -0,0 +1,48 @@
+"""Tests for card_cache: content keys, memory LRU and the disk tier"""
+
+import os
+
+from card_cache import CardCache, cache_key
+
+
+def test_cache_key_ignores_dict_order():
+    assert cache_key({'a': 1, 'b': 2}, 300) == cache_key({'b': 2, 'a': 1}, 300)
+    assert cache_key({'a': 1}, 300) != cache_key({'a': 1}, 150)
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = CardCache(max_memory_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'  # a is now the most recent
+    cache.put('c', b'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa' and cache.get('c') == b'cccc'
+    stats = cache.stats()
+    assert stats['memory_evictions'] == 1 and stats['memory_bytes'] == 8
+    assert stats['memory_hits'] == 3 and stats['misses'] == 1
+
+
+def test_entries_larger_than_memory_are_not_kept():
+    cache = CardCache(max_memory_bytes=4)
+    cache.put('big', b'too large')
+    assert cache.get('big') is None
+
+
+def test_disk_tier_survives_a_new_cache_and_refills_memory(tmp_path):
+    CardCache(disk_dir=str(tmp_path)).put('k', b'image')
+    cache = CardCache(disk_dir=str(tmp_path))
+    assert cache.get('k') == b'image'
+    assert cache.get('k') == b'image'
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits']) == (1, 1)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_disk_tier_evicts_oldest_files(tmp_path):
+    cache = CardCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=25)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, b'x' * 10)
+        os.utime(tmp_path / f'{key}.card', (1000 + i, 1000 + i))
+    assert sorted(os.listdir(tmp_path)) == ['b.card', 'c.card']
+    assert cache.stats()['disk_evictions'] == 1
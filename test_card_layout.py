@@ -0,0 +1,59 @@
+"""Tests for card_layout: the layout walk, slot placement and the SVG renderer"""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from card_layout import CARD_LAYOUT, layout_shapes, place_values, render_svg, slot_names
+from generate_health_card import card_values
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+TINY_LAYOUT = {
+    'grid': (10, 10),
+    'axes': (0, 0, 1, 1),
+    'pad_inches': 0,
+    'sections': [
+        {'type': 'box', 'rect': (0, 8, 10, 2), 'fill': '#4CAF50', 'text': 'Title', 'style': 'title'},
+        {'type': 'table', 'x': 0, 'top': 8, 'row_height': 2, 'columns': [
+            {'width': 4, 'align': 'left'}, {'width': 6}
+        ], 'header': {'height': 2, 'cells': ['Name', 'Value'], 'fill': '#FF9800'},
+         'rows': [['pH', {'slot': 'ph'}], [None, {'slot': 'note'}]]},
+        {'type': 'text', 'x': 5, 'y': 1, 'text': 'Footer & <notes>'},
+    ],
+}
+
+
+def test_walk_yields_static_shapes_and_slots():
+    rects, texts = layout_shapes(TINY_LAYOUT)
+    assert len(rects) == 1 + 2 + 4  # title box, header cells, body cells
+    assert rects[0] == (0, 8, 10, 2, '#4CAF50', 1)
+    assert [t[2] for t in texts] == ['Title', 'Name', 'Value', 'pH', 'Footer & <notes>']
+    assert texts[3][:4] == (1, 5.0, 'pH', 'left')
+    assert slot_names(TINY_LAYOUT) == ['ph', 'note']
+
+
+def test_place_values_skips_empty_slots():
+    assert place_values({'ph': 6.5, 'note': None}, TINY_LAYOUT) == [(7.0, 5.0, '6.5', 'center', 7)]
+
+
+def test_unknown_section_type_is_rejected():
+    with pytest.raises(ValueError):
+        layout_shapes({'sections': [{'type': 'chart'}]})
+
+
+def test_svg_is_well_formed_and_escapes_text():
+    svg = render_svg(place_values({'ph': '<7>', 'note': 'a\nb'}, TINY_LAYOUT), figsize=(2, 2), layout=TINY_LAYOUT)
+    root = ET.fromstring(svg)
+    assert root.get('viewBox') == '-0.5 -0.5 145 144.5'  # 2in page, plus half the outer stroke
+    texts = [''.join(node.itertext()) for node in root.iter(SVG + 'text')]
+    assert 'Footer & <notes>' in texts and '<7>' in texts and 'ab' in texts
+    assert len(list(root.iter(SVG + 'tspan'))) == 2
+
+
+def test_every_card_value_has_a_slot():
+    values = card_values({'name': 'Asha'}, {'pH': 6.5}, '2024-03-01')
+    assert set(values) <= set(slot_names(CARD_LAYOUT))
+    root = ET.fromstring(render_svg(place_values(values)))
+    texts = [''.join(node.itertext()) for node in root.iter(SVG + 'text')]
+    assert 'Asha' in texts and '01/03/2024' in texts
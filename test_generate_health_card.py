@@ -0,0 +1,106 @@
+"""Tests for generate_health_card: template cache and card rendering"""
+
+import base64
+import io
+import json
+
+import numpy as np
+from PIL import Image
+
+import generate_health_card
+from generate_health_card import (
+    DPI, FIGSIZE, _draw_static_layout, _new_card_axes, card_text, get_static_template, job_response,
+    render_job_data, render_soil_health_card, save_soil_health_card
+)
+
+FARMER = {'name': 'Asha', 'village': 'Hosur'}
+SOIL = {'pH': 6.5, 'nitrogen': 120, 'phosphorus': 20, 'potassium': 150}
+
+
+def open_image(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_template_cache_keeps_the_most_recently_used(monkeypatch):
+    monkeypatch.setattr(generate_health_card, 'MAX_TEMPLATES', 2)
+    monkeypatch.setattr(generate_health_card, '_templates', type(generate_health_card._templates)())
+    first = get_static_template(dpi=36)
+    get_static_template(dpi=37)
+    assert get_static_template(dpi=36) is first
+    get_static_template(dpi=38)
+    assert list(generate_health_card._templates) == [(generate_health_card.FIGSIZE, 36),
+                                                     (generate_health_card.FIGSIZE, 38)]
+
+
+def test_template_render_is_repeatable():
+    template = get_static_template(dpi=40)
+    assert get_static_template(dpi=40) is template
+    texts = len(template.ax.texts)
+    items = card_text({'name': 'Asha'}, {'pH': 6.5, 'nitrogen': 120}, '2024-03-01')
+    first = template.render(items)
+    assert first.ndim == 3 and first.shape[2] == 3
+    assert len(template.ax.texts) == texts
+    assert (template.render(items) == first).all()
+    assert (template.render([]) != first).any()
+
+
+def test_template_crop_matches_a_tight_savefig():
+    dpi = 40
+    items = card_text({'name': 'Asha'}, {'pH': 6.5, 'nitrogen': 120}, '2024-03-01')
+    fig, ax = _new_card_axes(generate_health_card.FIGSIZE, dpi)
+    _draw_static_layout(ax)
+    for x, y, text, ha, fontsize in items:
+        ax.text(x, y, text, ha=ha, va='center', fontsize=fontsize)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    width, height = Image.open(buffer).size
+    pixels = get_static_template(dpi=dpi).render(items)
+    # The crop rounds outward to whole pixels on each side
+    assert np.allclose(pixels.shape[:2], (height, width), atol=2)
+
+
+def test_thumbnail_does_not_build_a_full_dpi_template(monkeypatch):
+    monkeypatch.setattr(generate_health_card, '_templates', type(generate_health_card._templates)())
+    data = render_soil_health_card(FARMER, SOIL, thumbnail=(200, 150), cache=None)
+    image = open_image(data)
+    assert image.format == 'PNG' and image.size[0] <= 200 and image.size[1] <= 150
+    assert max(image.size[0] - 200, image.size[1] - 150) == 0  # fills the box along one side
+    assert [key for key in generate_health_card._templates if key[1] == DPI] == []
+    assert all(dpi < 50 for _, dpi in generate_health_card._templates)
+
+
+def test_raster_formats():
+    png = open_image(render_soil_health_card(FARMER, SOIL, fmt='png', dpi=40, cache=None))
+    jpeg = open_image(render_soil_health_card(FARMER, SOIL, fmt='jpg', dpi=40, cache=None))
+    assert (png.format, png.mode) == ('PNG', 'RGB')
+    assert jpeg.format == 'JPEG'
+    assert png.size == jpeg.size == get_static_template(FIGSIZE, 40).render([]).shape[1::-1]
+
+
+def test_svg_output_is_vector():
+    data = render_soil_health_card(FARMER, SOIL, fmt='svg', cache=None)
+    assert b'<svg' in data and b'Asha' in data
+
+
+def test_save_to_an_explicit_path_takes_the_format_from_the_extension(tmp_path):
+    path = tmp_path / 'card.jpeg'
+    assert save_soil_health_card(str(path), FARMER, SOIL, dpi=40, cache=None) == str(path)
+    assert open_image(path.read_bytes()).format == 'JPEG'
+    svg = tmp_path / 'card.svg'
+    save_soil_health_card(str(svg), FARMER, SOIL, cache=None)
+    assert b'<svg' in svg.read_bytes()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['card.jpeg', 'card.svg']  # no temp files left
+
+
+def test_job_output_path_writes_the_card_under_output_dir(tmp_path):
+    job = {'id': 7, 'farmerData': FARMER, 'sensorData': SOIL, 'dpi': 40, 'output': 'path'}
+    response = job_response(job, render_job_data(job, cache=None), output_dir=str(tmp_path))
+    json.dumps(response)
+    assert response['success'] and response['mimeType'] == 'image/png' and 'image' not in response
+    assert response['path'].startswith(str(tmp_path)) and response['path'].endswith('.png')
+    assert open_image(open(response['path'], 'rb').read()).format == 'PNG'
+
+    inline = job_response(job | {'output': 'base64'}, render_job_data(job, cache=None))
+    assert open_image(base64.b64decode(inline['image'])).format == 'PNG'
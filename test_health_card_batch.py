@@ -0,0 +1,69 @@
+"""Tests for health_card_batch: input parsing and the streaming PDF writer"""
+
+import json
+import re
+import zipfile
+
+import numpy as np
+
+from generate_health_card import encode_png
+from health_card_batch import BadRecord, StreamingPdfWriter, attach_sensor_data, generate_batch, read_records
+
+RECORD = {'farmerData': {'name': 'Asha'}, 'sensorData': {'pH': 6.5}, 'cardDate': '2024-03-01'}
+
+
+def write_lines(path, lines):
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_read_records_reports_bad_lines_and_continues(tmp_path):
+    path = write_lines(tmp_path / 'in.jsonl', [json.dumps(RECORD), '', '{"broken', '[1, 2]', json.dumps(RECORD)])
+    records = list(read_records(path))
+    assert len(records) == 4
+    assert records[0] == RECORD and records[3] == RECORD
+    assert isinstance(records[1], BadRecord) and records[1].line_number == 3
+    assert isinstance(records[2], BadRecord) and records[2].line_number == 4
+    assert 'JSON object' in records[2].error
+
+
+def test_attach_sensor_data_passes_bad_records_through():
+    bad = BadRecord(7, 'invalid JSON')
+    records = list(attach_sensor_data([bad, {'deviceId': 'a'}], {'a': {'pH': 7.0}}))
+    assert records[0] is bad
+    assert records[1]['sensorData'] == {'pH': 7.0}
+
+
+def test_pdf_writer_streams_one_page_per_png(tmp_path):
+    pixels = np.zeros((20, 30, 3), dtype=np.uint8)
+    pixels[:, :, 1] = 200
+    png = encode_png(pixels, 72)
+    path = tmp_path / 'out.pdf'
+    writer = StreamingPdfWriter(str(path), dpi=72)
+    writer.add_png(png, (30, 20))
+    writer.add_png(png, (30, 20))
+    writer.close()
+
+    data = path.read_bytes()
+    assert data.startswith(b'%PDF-1.4') and data.rstrip().endswith(b'%%EOF')
+    assert b'/Count 2' in data and data.count(b'/Type /Page ') == 2
+    assert b'/MediaBox [0 0 30.00 20.00]' in data
+    # every xref offset points at the object it names
+    xref = int(re.search(rb'startxref\n(\d+)', data).group(1))
+    entries = data[xref:].split(b'\n')[3:]
+    for number, entry in enumerate(entries[:7], start=1):
+        offset = int(entry[:10])
+        assert data[offset:].startswith(f'{number} 0 obj'.encode())
+
+
+def test_generate_batch_keeps_going_past_a_malformed_line(tmp_path):
+    path = write_lines(tmp_path / 'in.jsonl', [json.dumps(RECORD), 'not json', json.dumps(RECORD)])
+    pdf, archive = tmp_path / 'cards.pdf', tmp_path / 'cards.zip'
+    summary = generate_batch(read_records(path), pdf=str(pdf), zip_path=str(archive), processes=1, dpi=40)
+    assert summary['rendered'] == 2
+    assert len(summary['failed']) == 1
+    failure = summary['failed'][0]
+    assert failure['index'] == 1 and failure['line'] == 2 and 'line 2' in failure['error']
+    assert b'/Count 2' in pdf.read_bytes()
+    with zipfile.ZipFile(archive) as z:
+        assert [name[:5] for name in z.namelist()] == ['00001', '00003']
@@ -0,0 +1,119 @@
+"""Tests for `generate_health_card.py --worker`, driven over its stdin/stdout pipes"""
+
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JOB = {'farmerData': {'name': 'Asha'}, 'sensorData': {'pH': 6.5}, 'cardDate': '2024-03-01', 'dpi': 40}
+
+
+class Worker:
+    def __init__(self, output_dir):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, 'generate_health_card.py'), '--worker', '--processes', '1',
+             '--output-dir', str(output_dir)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=str(output_dir))
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.put(json.loads(line))
+
+    def send(self, *requests):
+        self.process.stdin.write(''.join(
+            request if isinstance(request, str) else json.dumps(request) + '\n' for request in requests))
+        self.process.stdin.flush()
+
+    def receive(self, count=1):
+        responses = [self.lines.get(timeout=60) for _ in range(count)]
+        return responses[0] if count == 1 else responses
+
+    def render_processes(self):
+        """pids of the worker's spawned render processes"""
+        pids = []
+        for entry in os.listdir('/proc'):
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                    cmdline = f.read()
+            except (ValueError, OSError):
+                continue
+            if ppid == self.process.pid and b'spawn_main' in cmdline:
+                pids.append(int(entry))
+        return pids
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(timeout=60)
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = Worker(tmp_path)
+    yield worker
+    if worker.process.poll() is None:
+        worker.process.kill()
+        worker.process.wait()
+
+
+def test_renders_a_job_and_serves_the_repeat_from_cache(worker):
+    worker.send(dict(JOB, id=1))
+    response = worker.receive()
+    assert response['id'] == 1 and response['success'] and response['mimeType'] == 'image/png'
+    assert response['image'] and not response.get('cached')
+
+    worker.send(dict(JOB, id=2, output='path'))
+    response = worker.receive()
+    assert response['id'] == 2 and response['cached'] and os.path.getsize(response['path']) > 0
+    worker.close()
+    assert worker.process.returncode == 0
+
+
+def test_bad_lines_get_an_error_and_the_worker_keeps_going(worker):
+    worker.send('{"broken\n', '[1, 2]\n', dict(JOB, id=3, format='tiff'), dict(JOB, id=4))
+    broken, not_object, bad_format, ok = worker.receive(4)
+    assert broken['id'] is None and not broken['success'] and 'invalid request' in broken['error']
+    assert 'JSON object' in not_object['error']
+    assert bad_format['id'] == 3 and 'unsupported format' in bad_format['error']
+    assert ok['id'] == 4 and ok['success']
+
+
+def test_identical_jobs_in_flight_render_once(worker):
+    worker.send(dict(JOB, id=5), dict(JOB, id=6), dict(JOB, id=7, format='jpeg'))
+    responses = {response['id']: response for response in worker.receive(3)}
+    assert all(response['success'] for response in responses.values())
+    assert responses[5]['image'] == responses[6]['image'] != responses[7]['image']
+
+    worker.send({'id': 8, 'command': 'metrics'})
+    metrics = worker.receive()['metrics']
+    assert 'health_card_requests_total{result="rendered"} 2' in metrics
+    assert 'health_card_requests_total{result="coalesced"} 1' in metrics
+
+
+def test_killed_render_process_is_replaced(worker):
+    worker.send(dict(JOB, id=9))
+    assert worker.receive()['success']
+    pids = worker.render_processes()
+    assert len(pids) == 1
+    os.kill(pids[0], signal.SIGKILL)
+    while worker.render_processes() == pids:  # wait until the kernel has reaped it
+        time.sleep(0.05)
+
+    worker.send(dict(JOB, id=10, cardDate='2024-03-02'))
+    crashed = worker.receive()
+    assert crashed['id'] == 10 and not crashed['success'] and 'worker crashed' in crashed['error']
+    worker.send(dict(JOB, id=11, cardDate='2024-03-03'))
+    response = worker.receive()
+    assert response['id'] == 11 and response['success']
+    replacement = worker.render_processes()
+    assert len(replacement) == 1 and replacement != pids
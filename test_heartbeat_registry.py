@@ -0,0 +1,89 @@
+"""Tests for heartbeat_registry: liveness, sweeps, resets and snapshots"""
+
+import json
+
+from heartbeat_registry import HeartbeatRegistry
+
+
+def test_beat_makes_device_alive():
+    registry = HeartbeatRegistry(timeout=5)
+    entry = registry.beat('a', {'rssi': -60})
+    assert entry.alive and entry.count == 1 and entry.info == {'rssi': -60}
+    assert registry.beat('a').count == 2
+    assert registry.status()['device_id'] == 'a'
+    assert registry.status('a')['esp32_alive'] is True
+    assert registry.status('missing') is None
+    assert registry.alive_count() == 1
+
+
+def test_sweep_marks_silent_devices_dead(monkeypatch):
+    registry = HeartbeatRegistry(timeout=5)
+    now = [1000.0]
+    monkeypatch.setattr('heartbeat_registry.time.monotonic', lambda: now[0])
+    registry.beat('a')
+    registry.beat('b')
+    assert registry.sweep() == []
+    now[0] += 3
+    registry.beat('b')
+    now[0] += 3
+    assert registry.sweep() == ['a']
+    assert registry.sweep() == []  # only reported once
+    assert registry.all_status()['a']['esp32_alive'] is False
+    assert registry.all_status()['b']['seconds_since_heartbeat'] == 3
+
+
+def test_readers_keep_their_view_while_writers_replace_it():
+    registry = HeartbeatRegistry()
+    registry.beat('a')
+    view = registry._devices
+    registry.beat('b')
+    registry.reset('a')
+    assert sorted(view) == ['a']
+    assert sorted(registry.all_status()) == ['b']
+
+
+def test_reset(tmp_path):
+    path = tmp_path / 'hb.json'
+    registry = HeartbeatRegistry(snapshot_file=str(path))
+    registry.beat('a')
+    registry.beat('b')
+    registry.reset('b')
+    assert registry.status() is None
+    assert sorted(registry.all_status()) == ['a']
+    registry.save_snapshot()
+    registry.reset()
+    assert registry.all_status() == {} and not path.exists()
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / 'hb.json'
+    registry = HeartbeatRegistry(snapshot_file=str(path))
+    registry.beat('a')
+    registry.beat('a')
+    registry.save_snapshot()
+    assert json.loads(path.read_text())['a']['count'] == 2
+    assert [p.name for p in tmp_path.iterdir()] == ['hb.json']  # no temp files left behind
+
+    restored = HeartbeatRegistry(snapshot_file=str(path))
+    status = restored.status('a')
+    assert status['heartbeat_count'] == 2
+    assert status['esp32_alive'] is False  # dead until it beats again
+    assert status['last_heartbeat'] != 'Never'
+
+
+def test_snapshot_in_old_format_is_ignored(tmp_path):
+    path = tmp_path / 'hb.json'
+    path.write_text('1700000000.0')
+    assert HeartbeatRegistry(snapshot_file=str(path)).all_status() == {}
+
+
+def test_stop_snapshots_once(tmp_path):
+    path = tmp_path / 'hb.json'
+    writes = []
+    registry = HeartbeatRegistry(snapshot_file=str(path), on_snapshot=lambda nbytes, seconds: writes.append(nbytes))
+    registry.start()
+    registry.beat('a')
+    registry.stop()
+    path.unlink()
+    registry.stop()
+    assert len(writes) == 1 and not path.exists()
@@ -0,0 +1,90 @@
+"""Tests for sensor_codec: packed, columnar, MessagePack/CBOR, NDJSON and compressed bodies"""
+
+import gzip
+import json
+import zlib
+
+import numpy as np
+import pytest
+
+from sensor_codec import (
+    PACKED_CONTENT_TYPE, ColumnBatch, UnsupportedPayload, decode_body, decode_packed, decompress, encode_packed
+)
+from sensor_store import CHANNEL_NAMES
+
+READINGS = [
+    {'temperature': 21.37, 'pH': 6.8, 'moisture': 41.5, 'nitrogen': 50, 'phosphorus': 30, 'potassium': 60},
+    {'temperature': -3.5, 'pH': 7.25, 'moisture': 0.0, 'nitrogen': 0, 'phosphorus': 65535, 'potassium': 1},
+]
+
+
+def test_packed_round_trip():
+    body = encode_packed('node-1', READINGS, [1700000000.0, 1700000000123.0])
+    batch = decode_packed(body)
+    assert isinstance(batch, ColumnBatch) and len(batch) == 2 and batch.device_id == 'node-1'
+    assert list(batch.timestamps) == [1700000000.0, 1700000000123.0]
+    for name in CHANNEL_NAMES:
+        assert np.allclose(batch.columns[name], [r[name] for r in READINGS])
+    assert decode_packed(encode_packed(None, READINGS[:1], [1.0])).device_id is None
+
+
+@pytest.mark.parametrize('body', [b'', b'\x01' + b'\0' * 16 + b'\0' * 7, b'\x09' + b'\0' * 16])
+def test_packed_rejects_malformed_bodies(body):
+    with pytest.raises(ValueError):
+        decode_packed(body)
+
+
+def test_columnar_json_becomes_a_column_batch():
+    body = json.dumps({'device_id': 7, 'timestamp': [1.0, 2.0], 'pH': [6.5, 6.6]}).encode()
+    batch = decode_body(body, 'application/json')
+    assert batch.device_id == '7' and list(batch.columns['pH']) == [6.5, 6.6]
+    assert len(batch.columns['nitrogen']) == 2  # missing channels get defaults
+    with pytest.raises(ValueError):
+        decode_body(json.dumps({'timestamp': [1.0, 2.0], 'pH': [6.5]}).encode(), 'application/json')
+    with pytest.raises(ValueError):
+        decode_body(json.dumps({'timestamp': [1.0], 'pH': [{'a': 1}]}).encode(), 'application/json')
+
+
+def test_ndjson_keeps_bad_lines_as_errors():
+    body = b'{"pH": 6.5}\n\nnot json\n{"pH": 6.6}\n'
+    records = decode_body(body, 'application/x-ndjson; charset=utf-8')
+    assert records[0] == {'pH': 6.5} and records[2] == {'pH': 6.6}
+    assert isinstance(records[1], ValueError)
+    assert decode_body(b'  ', 'application/json') is None
+    with pytest.raises(ValueError):
+        decode_body(b'{"pH":', 'application/json')
+
+
+def test_msgpack_and_cbor():
+    msgpack = pytest.importorskip('msgpack')
+    cbor2 = pytest.importorskip('cbor2')
+    assert decode_body(msgpack.packb([{'pH': 6.5}]), 'application/msgpack') == [{'pH': 6.5}]
+    assert decode_body(cbor2.dumps({'pH': 6.5}), 'application/cbor') == {'pH': 6.5}
+    with pytest.raises(ValueError):
+        decode_body(b'\xc1', 'application/msgpack')
+
+
+@pytest.mark.parametrize('compress, encoding', [
+    (gzip.compress, 'gzip'),
+    (zlib.compress, 'deflate'),
+    (lambda data: zlib.compress(data)[2:-4], 'deflate'),  # raw deflate
+    (lambda data: data, None),
+])
+def test_content_encodings(compress, encoding):
+    body = encode_packed('node-1', READINGS, [1.0, 2.0])
+    batch = decode_body(compress(body), PACKED_CONTENT_TYPE, encoding)
+    assert len(batch) == 2
+
+
+def test_decompression_is_bounded():
+    with pytest.raises(ValueError):
+        decompress(gzip.compress(b'\0' * 10000), 'gzip', max_bytes=1000)
+    with pytest.raises(ValueError):
+        decompress(b'not gzip', 'gzip')
+    with pytest.raises(UnsupportedPayload):
+        decompress(b'', 'br')
+
+
+def test_unknown_content_type_is_unsupported():
+    with pytest.raises(UnsupportedPayload):
+        decode_body(b'<xml/>', 'application/xml')
@@ -0,0 +1,137 @@
+"""Tests for sensor_log: round trip, rotation, legacy segments and write failures"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import sensor_log
+from sensor_log import HEADER, LEGACY_FORMATS, RECORD_DTYPE, SensorLog, SensorLogFull, record_to_reading
+
+READING = {'temperature': 21.5, 'pH': 6.8, 'moisture': 40.0, 'nitrogen': 50, 'phosphorus': 30, 'potassium': 60}
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / 'log')
+
+
+def test_round_trip(log_dir):
+    log = SensorLog(log_dir)
+    log.append('a', READING, 100.0)
+    log.extend([('b', dict(READING, nitrogen=n), 100.0 + n) for n in range(1, 4)])
+    log.extend_columns('c', np.array([200.0, 201.0]), {name: np.array([value, value]) for name, value in READING.items()})
+    log.close()
+
+    records = np.concatenate(list(log.read()))
+    assert len(records) == 6
+    assert record_to_reading(records[0]) == ('a', READING, 100.0)
+    assert [int(n) for n in next(log.read(device_id='b'))['nitrogen']] == [1, 2, 3]
+    assert list(log.tail(2)['timestamp']) == [200.0, 201.0]
+    assert len(next(log.read(since=102.5, until=150.0))) == 1
+
+
+def test_long_device_ids_are_kept_whole(log_dir):
+    log = SensorLog(log_dir)
+    log.append('greenhouse-node-01', READING, 1.0)
+    log.append('greenhouse-node-02', READING, 2.0)
+    log.close()
+    ids = sorted({record_to_reading(r)[0] for r in log.tail(10)})
+    assert ids == ['greenhouse-node-01', 'greenhouse-node-02']
+    assert len(next(log.read(device_id='greenhouse-node-02'))) == 1
+
+
+def test_device_id_too_long_is_rejected(log_dir):
+    log = SensorLog(log_dir)
+    with pytest.raises(ValueError):
+        log.append('x' * (sensor_log.DEVICE_ID_BYTES + 1), READING, 1.0)
+    log.close()
+
+
+def test_rotates_by_size(log_dir):
+    log = SensorLog(log_dir, max_segment_bytes=HEADER.size + 3 * RECORD_DTYPE.itemsize)
+    log.extend([('a', READING, float(i)) for i in range(7)])
+    log.close()
+    segments = log.segments()
+    assert len(segments) == 3
+    assert [len(SensorLog.map_segment(path)) for path in segments] == [3, 3, 1]
+    assert list(log.tail(7)['timestamp']) == [float(i) for i in range(7)]
+
+
+def test_torn_record_is_trimmed_on_reopen(log_dir):
+    log = SensorLog(log_dir)
+    log.append('a', READING, 1.0)
+    log.close()
+    with open(log.segments()[-1], 'ab') as f:
+        f.write(b'\0' * 10)
+    log = SensorLog(log_dir)
+    log.append('a', READING, 2.0)
+    log.close()
+    assert list(log.tail(5)['timestamp']) == [1.0, 2.0]
+
+
+def test_reads_legacy_segments_and_starts_a_new_one(log_dir):
+    os.makedirs(log_dir)
+    legacy = LEGACY_FORMATS[b'SENSLOG1']
+    records = np.zeros(2, dtype=legacy)
+    records['timestamp'] = [1.0, 2.0]
+    records['device_id'] = b'old-node'
+    day = time.strftime("%Y%m%d", time.gmtime())
+    with open(os.path.join(log_dir, f'sensors-{day}-000.bin'), 'wb') as f:
+        f.write(HEADER.pack(b'SENSLOG1', legacy.itemsize) + records.tobytes())
+
+    log = SensorLog(log_dir)
+    log.append('new-node', READING, 3.0)
+    log.close()
+    assert len(log.segments()) == 2
+    tail = log.tail(10)
+    assert list(tail['timestamp']) == [1.0, 2.0, 3.0]
+    assert [record_to_reading(r)[0] for r in tail] == ['old-node', 'old-node', 'new-node']
+
+
+def test_failed_write_is_retried_without_losing_records(log_dir, monkeypatch):
+    monkeypatch.setattr(sensor_log, 'RETRY_MIN_SECONDS', 0.01)
+    errors = []
+    log = SensorLog(log_dir, on_error=errors.append)
+    original = log._segment_for
+    failures = iter([OSError(28, 'No space left on device')])
+
+    def flaky_segment_for(nbytes):
+        failure = next(failures, None)
+        if failure:
+            raise failure
+        return original(nbytes)
+
+    monkeypatch.setattr(log, '_segment_for', flaky_segment_for)
+    log.append('a', READING, 1.0)
+    deadline = time.monotonic() + 5
+    while log.pending_count() or not log.segments():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    log.append('a', READING, 2.0)
+    log.close()
+    assert log.write_errors == 1 and len(errors) == 1
+    assert list(log.tail(5)['timestamp']) == [1.0, 2.0]
+
+
+def test_queue_is_capped(log_dir):
+    log = SensorLog(log_dir, max_pending=3)
+    with log._cond:  # hold the queue so the flusher cannot drain it meanwhile
+        log._pending.extend([None] * 3)
+        with pytest.raises(SensorLogFull):
+            log._enqueue([('x',)])
+        log._pending.clear()
+    log.close()
+
+
+def test_read_filters_backfilled_segments_by_every_record(log_dir):
+    now = time.time()
+    log = SensorLog(log_dir)
+    log.append('a', READING, now - 60)
+    log.extend([('a', READING, now - 7200), ('a', READING, now - 30)])  # backfill lands after a newer record
+    log.close()
+    recent = np.concatenate(list(log.read(since=now - 3600)))
+    assert sorted(recent['timestamp']) == [now - 60, now - 30]
+    old = np.concatenate(list(log.read(until=now - 3600)))
+    assert list(old['timestamp']) == [now - 7200]
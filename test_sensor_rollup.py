@@ -0,0 +1,54 @@
+"""Tests for sensor_rollup: bucket aggregation, ring eviction and range slicing"""
+
+import numpy as np
+
+from sensor_rollup import RollupStore, RollupTier
+from sensor_store import CHANNEL_NAMES
+
+
+def rows(*values):
+    return np.array([[v] * len(CHANNEL_NAMES) for v in values], dtype=np.float64)
+
+
+def test_buckets_aggregate_min_max_mean():
+    tier = RollupTier(60, 10)
+    tier.add([0, 30, 59, 60], rows(1, 3, 5, 7))
+    result = tier.query(0, 119)
+    assert result['timestamps'] == [0, 60]
+    assert result['count'] == [3, 1]
+    assert result['channels']['pH'] == {'min': [1.0, 7.0], 'max': [5.0, 7.0], 'mean': [3.0, 7.0]}
+
+
+def test_query_slices_to_the_requested_range():
+    tier = RollupTier(60, 100)
+    tier.add(np.arange(0, 600, 60), rows(*range(10)))
+    result = tier.query(120, 300)
+    assert result['timestamps'] == [120, 180, 240, 300]
+    assert result['channels']['nitrogen']['mean'] == [2.0, 3.0, 4.0, 5.0]
+    assert tier.query(10000, 20000)['timestamps'] == []
+
+
+def test_ring_drops_buckets_outside_its_window():
+    tier = RollupTier(60, 3)
+    tier.add(np.arange(0, 300, 60), rows(*range(5)))
+    assert tier.query(0, 1000)['timestamps'] == [120, 180, 240]
+    tier.add([0], rows(99))  # too old for the window: ignored
+    assert tier.query(0, 1000)['count'] == [1, 1, 1]
+
+
+def test_late_readings_inside_the_window_are_merged():
+    tier = RollupTier(60, 10)
+    tier.add([120], rows(4))
+    tier.add([0, 130], rows(2, 8))
+    result = tier.query(0, 200)
+    assert result['timestamps'] == [0, 120]
+    assert result['channels']['moisture']['mean'] == [2.0, 6.0]
+
+
+def test_store_per_device_and_bucket_choice():
+    store = RollupStore({'1m': (60, 60), '1h': (3600, 48)})
+    store.add('a', [dict.fromkeys(CHANNEL_NAMES, 5)], [60.0])
+    assert store.query('a', '1h', 0, 3600)['count'] == [1]
+    assert store.query('b', '1m', 0, 60) is None
+    assert store.pick_bucket(0, 1800, 100) == '1m'
+    assert store.pick_bucket(0, 86400, 100) == '1h'
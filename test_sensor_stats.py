@@ -0,0 +1,73 @@
+"""Tests for sensor_stats: rolling stats, out-of-order readings and alert hysteresis"""
+
+import numpy as np
+import pytest
+
+from sensor_store import CHANNEL_NAMES
+from sensor_stats import SensorStats
+
+OK = {'temperature': 25.0, 'pH': 6.8, 'moisture': 50.0, 'nitrogen': 60, 'phosphorus': 60, 'potassium': 60}
+
+
+def test_mean_std_and_ewma():
+    stats = SensorStats(ewma_alpha=0.5)
+    for i, temperature in enumerate([20.0, 22.0, 24.0]):
+        stats.update('a', dict(OK, temperature=temperature), 100.0 + i)
+    channel = stats.stats('a')['channels']['temperature']
+    assert channel['mean'] == 22.0 and channel['std'] == 2.0
+    assert channel['ewma'] == 22.5  # 20 -> 21 -> 22.5
+    assert channel['rate_per_min'] == 120.0
+    assert (channel['window_min'], channel['window_max']) == (20.0, 24.0)
+    assert stats.stats('missing') is None
+
+
+def test_backfilled_readings_only_touch_order_free_stats():
+    stats = SensorStats(ewma_alpha=0.5)
+    stats.update('a', dict(OK, temperature=20.0), 100.0)
+    stats.update('a', dict(OK, temperature=30.0), 200.0)
+    before = stats.stats('a')['channels']['temperature']
+    stats.update('a', dict(OK, temperature=-40.0), 150.0)
+    after = stats.stats('a')
+    channel = after['channels']['temperature']
+    assert after['count'] == 3 and after['last_timestamp'] == 200.0
+    assert channel['mean'] == pytest.approx(10 / 3, abs=1e-4)
+    for key in ('ewma', 'last', 'rate_per_min', 'window_min', 'window_max'):
+        assert channel[key] == before[key]
+
+
+def test_window_drops_old_extremes():
+    stats = SensorStats(window_seconds=60)
+    stats.update('a', dict(OK, moisture=90.0), 0.0)
+    stats.update('a', dict(OK, moisture=45.0), 30.0)
+    stats.update('a', dict(OK, moisture=50.0), 70.0)
+    channel = stats.stats('a')['channels']['moisture']
+    assert (channel['window_min'], channel['window_max']) == (45.0, 50.0)
+
+
+def test_alert_raises_once_and_clears_with_hysteresis():
+    stats = SensorStats()
+    assert stats.update('a', OK, 1.0) == []
+    raised = stats.update('a', dict(OK, pH=8.3), 2.0)
+    assert [(e['channel'], e['kind'], e['state']) for e in raised] == [('pH', 'high', 'raised')]
+    assert stats.update('a', dict(OK, pH=8.4), 3.0) == []
+    assert stats.update('a', dict(OK, pH=7.95), 4.0) == []  # inside the bound, not past the margin
+    assert len(stats.active_alerts('a')) == 1
+    cleared = stats.update('a', dict(OK, pH=7.8), 5.0)
+    assert cleared[0]['state'] == 'cleared' and cleared[0]['raised_at'] == 2.0
+    assert stats.active_alerts() == []
+    assert [e['state'] for e in stats.recent_alerts()] == ['cleared', 'raised']
+
+
+def test_backfill_does_not_raise_alerts():
+    stats = SensorStats()
+    stats.update('a', OK, 100.0)
+    assert stats.update('a', dict(OK, nitrogen=5), 50.0) == []
+
+
+def test_update_columns_applies_rows_in_time_order():
+    stats = SensorStats(ewma_alpha=0.5)
+    rows = np.array([[dict(OK, temperature=t)[name] for name in CHANNEL_NAMES] for t in (30.0, 10.0, 20.0)])
+    events = stats.update_columns('a', np.array([3.0, 1.0, 2.0]), rows)
+    assert [e['state'] for e in events] == ['raised', 'cleared']  # 10 is below the 'good' band
+    channel = stats.stats('a')['channels']['temperature']
+    assert channel['last'] == 30.0 and channel['ewma'] == 22.5
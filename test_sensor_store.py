@@ -0,0 +1,146 @@
+"""Tests for sensor_store: ring buffers, snapshots and payload coercion"""
+
+import numpy as np
+import pytest
+
+from sensor_store import (
+    CHANNEL_NAMES, DEFAULT_READING, SensorStore, column_checks, coerce_reading, parse_timestamp
+)
+
+
+def reading(value):
+    return {name: value for name in CHANNEL_NAMES}
+
+
+def test_append_and_latest():
+    store = SensorStore(capacity=4)
+    store.append('a', reading(1), 100.0)
+    store.append('b', reading(2), 101.0)
+    assert store.latest('a') == dict(reading(1), timestamp=100.0, device_id='a')
+    assert store.latest()['device_id'] == 'b'
+    assert store.version == 2
+    assert sorted(store.device_ids()) == ['a', 'b']
+    assert store.latest('missing') is None
+
+
+def test_ring_buffer_wraps_and_keeps_newest():
+    store = SensorStore(capacity=4)
+    for i in range(10):
+        store.append('a', reading(i), float(i))
+    records = store.last('a', 10)
+    assert [r['timestamp'] for r in records] == [6.0, 7.0, 8.0, 9.0]
+    assert [r['nitrogen'] for r in records] == [6, 7, 8, 9]
+    assert store.snapshot.counts['a'] == 10
+
+
+def test_extend_larger_than_capacity():
+    store = SensorStore(capacity=3)
+    store.extend('a', [reading(i) for i in range(5)], np.arange(5, dtype=float))
+    assert [r['timestamp'] for r in store.last('a', 5)] == [2.0, 3.0, 4.0]
+    assert store.latest('a')['timestamp'] == 4.0
+
+
+def test_snapshot_is_immutable_and_replaced():
+    store = SensorStore()
+    store.append('a', reading(1), 1.0)
+    before = store.snapshot
+    store.append('a', reading(2), 2.0)
+    assert before.latest['a']['nitrogen'] == 1
+    assert store.snapshot.latest['a']['nitrogen'] == 2
+    with pytest.raises(TypeError):
+        before.latest['a']['nitrogen'] = 5
+
+
+def test_coerce_reading_defaults_and_types():
+    assert coerce_reading({}) == DEFAULT_READING
+    coerced = coerce_reading({'temperature': '21.5', 'nitrogen': '40'})
+    assert coerced['temperature'] == 21.5 and coerced['nitrogen'] == 40
+
+
+@pytest.mark.parametrize('payload', [
+    {'nitrogen': 1e12},
+    {'potassium': -2 ** 31 - 1},
+    {'phosphorus': float('inf')},
+    {'nitrogen': 'lots'},
+])
+def test_coerce_reading_rejects_values_that_do_not_fit(payload):
+    with pytest.raises(ValueError):
+        coerce_reading(payload)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp(1700000000) == 1700000000.0
+    assert parse_timestamp(1700000000123) == pytest.approx(1700000000.123)
+    assert parse_timestamp('2023-11-14T22:13:20Z') == 1700000000.0
+    assert parse_timestamp('1700000000') == 1700000000.0
+    assert parse_timestamp('1700000000123') == pytest.approx(1700000000.123)
+    with pytest.raises(ValueError):
+        parse_timestamp(True)
+
+
+def test_backfilled_batch_does_not_replace_the_newest_reading():
+    store = SensorStore(capacity=8)
+    store.append('n1', reading(9), 1000.0)
+    store.append('other', reading(1), 1001.0)
+    store.extend('n1', [reading(1), reading(2)], [100.0, 50.0])
+    assert store.latest('n1')['timestamp'] == 1000.0
+    assert store.latest()['device_id'] == 'other'
+    assert store.snapshot.counts['n1'] == 3
+    assert [r['timestamp'] for r in store.last('n1', 10)] == [50.0, 100.0, 1000.0]
+    assert [r['timestamp'] for r in store.last('n1', 2)] == [100.0, 1000.0]
+
+
+def test_batch_is_written_in_time_order_and_newest_is_its_max():
+    store = SensorStore(capacity=8)
+    store.extend('a', [reading(3), reading(1), reading(2)], [30.0, 10.0, 20.0])
+    assert [r['nitrogen'] for r in store.last('a', 3)] == [1, 2, 3]
+    assert store.latest('a')['nitrogen'] == 3
+    store.extend_columns('a', {name: np.array([5, 4]) for name in CHANNEL_NAMES}, np.array([50.0, 40.0]))
+    assert store.latest('a')['timestamp'] == 50.0
+    assert [r['nitrogen'] for r in store.last('a', 5)] == [1, 2, 3, 4, 5]
+
+
+def test_reads_are_cheap_again_once_backfill_is_overwritten():
+    store = SensorStore(capacity=3)
+    store.append('a', reading(1), 10.0)
+    store.append('a', reading(0), 5.0)
+    buffer = store.device('a')
+    assert buffer.count < buffer._unordered_until
+    for i in range(3):
+        store.append('a', reading(i), 20.0 + i)
+    assert buffer.count >= buffer._unordered_until
+    assert [r['timestamp'] for r in store.last('a', 3)] == [20.0, 21.0, 22.0]
+
+
+def test_oversized_batch_keeps_the_newest_by_time():
+    store = SensorStore(capacity=2)
+    store.extend('a', [reading(i) for i in range(4)], [4.0, 1.0, 3.0, 2.0])
+    assert [r['timestamp'] for r in store.last('a', 4)] == [3.0, 4.0]
+
+
+@pytest.mark.parametrize('payload', [
+    {'temperature': float('nan')},
+    {'pH': 'nan'},
+    {'moisture': 'inf'},
+])
+def test_coerce_reading_rejects_non_finite_values(payload):
+    with pytest.raises(ValueError):
+        coerce_reading(payload)
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), 0, -5, 'nan', 'soon'])
+def test_parse_timestamp_rejects_non_finite_and_non_positive(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_column_checks_match_coerce_reading():
+    columns = {name: np.array([1.0, 1.0, 1.0, 1.0]) for name in CHANNEL_NAMES}
+    columns['nitrogen'] = np.array([1.0, 2.0 ** 31, -2.0 ** 31, np.inf])
+    columns['pH'] = np.array([6.5, 6.5, 6.5, np.nan])
+    failures = {reason: rejected.tolist() for rejected, reason in column_checks(columns) if rejected.any()}
+    assert failures == {
+        'pH must be a finite number': [False, False, False, True],
+        'nitrogen must be a finite number': [False, False, False, True],
+        'nitrogen out of range': [False, True, False, False],
+    }
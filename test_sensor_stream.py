@@ -0,0 +1,47 @@
+"""Tests for sensor_stream: SSE framing and fan-out"""
+
+import json
+
+from sensor_stream import SensorBroadcaster, format_event
+
+
+def parse(frame):
+    lines = frame.decode('utf-8').strip().split('\n')
+    fields = dict(line.split(': ', 1) for line in lines)
+    return fields['event'], fields.get('id'), json.loads(fields['data'])
+
+
+def test_format_event():
+    assert parse(format_event({'pH': 6.5}, event_id=7)) == ('reading', '7', {'pH': 6.5})
+    assert format_event({}, event='alert').startswith(b'event: alert\n')
+
+
+def test_publish_reaches_matching_subscribers_only():
+    broadcaster = SensorBroadcaster()
+    everyone = broadcaster.subscribe()
+    only_a = broadcaster.subscribe('a')
+    only_b = broadcaster.subscribe('b')
+    broadcaster.publish('a', {'pH': 6.5}, event_id=1)
+    assert parse(everyone.get_nowait()) == ('reading', '1', {'pH': 6.5, 'device_id': 'a'})
+    assert parse(only_a.get_nowait())[2]['device_id'] == 'a'
+    assert only_b.empty()
+    assert broadcaster.subscriber_count() == 3
+
+
+def test_slow_subscriber_loses_oldest_events():
+    broadcaster = SensorBroadcaster(queue_size=2)
+    q = broadcaster.subscribe()
+    for i in range(5):
+        broadcaster.publish('a', {'n': i})
+    assert [parse(q.get_nowait())[2]['n'] for _ in range(2)] == [3, 4]
+
+
+def test_stream_unsubscribes_when_closed():
+    broadcaster = SensorBroadcaster(keepalive=0.01)
+    q = broadcaster.subscribe('a')
+    stream = broadcaster.stream(q, 'a', initial=b'initial')
+    assert next(stream) == b'retry: 3000\n\n'
+    assert next(stream) == b'initial'
+    assert next(stream) == b': keepalive\n\n'
+    stream.close()
+    assert broadcaster.subscriber_count() == 0
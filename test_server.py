@@ -0,0 +1,230 @@
+"""Tests for the server.py ingest and query endpoints (Flask test client)"""
+
+import importlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pytest
+
+from sensor_log import SensorLog
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    # server.py opens its log and heartbeat snapshot relative to the cwd at import time
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    try:
+        sys.modules.pop('server', None)
+        module = importlib.import_module('server')
+        yield module
+        module.shutdown()  # unregisters itself, so atexit doesn't rerun it from another cwd
+    finally:
+        os.chdir(cwd)
+        sys.modules.pop('server', None)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def test_single_reading(client):
+    response = client.post('/sensor-data', json={'device_id': 's1', 'pH': 6.9, 'nitrogen': 40})
+    assert response.status_code == 200
+    data = client.get('/sensor-data?device=s1').get_json()
+    assert data['pH'] == 6.9 and data['nitrogen'] == 40
+
+
+@pytest.mark.parametrize('payload', [
+    {'device_id': 's2', 'temperature': 'nan'},
+    {'device_id': 's2', 'pH': 'inf'},
+    {'device_id': 's2', 'nitrogen': 1e12},
+])
+def test_single_reading_rejects_bad_values(client, payload):
+    assert client.post('/sensor-data', json=payload).status_code == 400
+    assert client.get('/sensor-data?device=s2').status_code == 404
+
+
+def test_batch_rejects_bad_records_individually(client):
+    now = time.time()
+    response = client.post('/sensor-data/batch', json=[
+        {'device_id': 'b1', 'timestamp': now - 10, 'pH': 6.1},
+        {'device_id': 'b1', 'timestamp': now - 5, 'pH': float('nan')},
+        {'device_id': 'b1', 'timestamp': now + 86400, 'pH': 6.2},
+        {'device_id': 'b1', 'pH': 6.3},
+    ])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['accepted'], body['rejected']) == (1, 3)
+    assert [r['accepted'] for r in body['results']] == [True, False, False, False]
+    assert 'future' in body['results'][2]['error']
+
+
+def test_backfilled_batch_keeps_the_current_reading(client):
+    now = time.time()
+    client.post('/sensor-data', json={'device_id': 'n1', 'pH': 7.0})
+    response = client.post('/sensor-data/batch', json=[
+        {'device_id': 'n1', 'timestamp': now - 1800 + i, 'pH': 5.0} for i in range(3)
+    ])
+    assert response.status_code == 200
+    assert client.get('/sensor-data?device=n1').get_json()['pH'] == 7.0
+    history = client.get('/sensor-data?device=n1&last=10').get_json()['readings']
+    timestamps = [r['timestamp'] for r in history]
+    assert timestamps == sorted(timestamps) and history[-1]['pH'] == 7.0
+
+
+def test_future_timestamps_do_not_reach_the_rollups(client, server):
+    now = time.time()
+    client.post('/sensor-data/batch', json=[{'device_id': 'r1', 'timestamp': now + 10 * 365 * 86400}])
+    client.post('/sensor-data/batch', json=[{'device_id': 'r1', 'timestamp': now - 60, 'pH': 6.6}])
+    response = client.get('/sensor-history?device=r1&bucket=1m')
+    assert response.status_code == 200
+    history = response.get_json()
+    assert history['channels']['pH']['mean'][-1] == 6.6
+
+
+def test_long_device_id_is_rejected(client):
+    assert client.post('/sensor-data', json={'device_id': 'x' * 65}).status_code == 400
+
+
+def test_history_accepts_epoch_query_parameters(client):
+    now = time.time()
+    client.post('/sensor-data/batch', json=[{'device_id': 'h1', 'timestamp': now - 120, 'pH': 6.4}])
+    response = client.get('/sensor-history?device=h1&from=%d&to=%d' % (now - 3600, now * 1000))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['from'] == int(now - 3600) and body['bucket'] == '1m'
+    assert body['channels']['pH']['mean'] == [6.4]
+    assert client.get('/sensor-history?device=h1&from=yesterday').status_code == 400
+
+
+def test_metrics_include_the_card_worker_file(client, server, tmp_path, monkeypatch):
+    path = tmp_path / 'health_card_metrics.prom'
+    monkeypatch.setattr(server, 'HEALTH_CARD_METRICS_FILE', str(path))
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total' in body and 'health_card_render_seconds' not in body
+    path.write_text('# TYPE health_card_render_seconds histogram\nhealth_card_render_seconds_count{format="png"} 2\n')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'health_card_render_seconds_count{format="png"} 2' in body
+
+
+def test_column_batch_rejects_values_that_overflow_int32(client):
+    now = time.time()
+    response = client.post('/sensor-data/batch', json={
+        'device_id': 'c1', 'timestamp': [now - 20, now - 10, now - 5],
+        'nitrogen': [40, 3e9, 45], 'pH': [6.5, 6.5, float('nan')],
+    })
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['accepted'], body['rejected']) == (1, 2)
+    assert body['results'] == [
+        {'index': 1, 'accepted': False, 'error': 'nitrogen out of range'},
+        {'index': 2, 'accepted': False, 'error': 'pH must be a finite number'},
+    ]
+    readings = client.get('/sensor-data?device=c1&last=10').get_json()['readings']
+    assert [r['nitrogen'] for r in readings] == [40]
+
+
+def test_single_columnar_reading_rejects_values_that_overflow_int32(client):
+    response = client.post('/sensor-data', json={'device_id': 'c2', 'timestamp': [time.time()], 'potassium': [-3e9]})
+    assert response.status_code == 400
+    assert 'potassium out of range' in response.get_json()['message']
+    assert client.get('/sensor-data?device=c2').status_code == 404
+
+
+def test_column_batch_with_non_numeric_cells_is_malformed(client):
+    response = client.post('/sensor-data/batch', json={'timestamp': [time.time()], 'pH': [{'a': 1}]})
+    assert response.status_code == 400
+    assert 'Malformed batch' in response.get_json()['message']
+
+
+def test_batch_rejects_timestamps_from_an_unset_device_clock(client):
+    now = time.time()
+    response = client.post('/sensor-data/batch', json=[
+        {'device_id': 'o1', 'timestamp': 1000, 'pH': 6.1},
+        {'device_id': 'o1', 'timestamp': now - 5, 'pH': 6.2},
+    ])
+    body = response.get_json()
+    assert (body['accepted'], body['rejected']) == (1, 1)
+    assert 'implausibly old' in body['results'][0]['error']
+    response = client.post('/sensor-data/batch', json={'device_id': 'o2', 'timestamp': [1000, now]})
+    assert response.get_json()['results'] == [
+        {'index': 0, 'accepted': False, 'error': 'timestamp is implausibly old (check the device clock)'}]
+
+
+def test_serve_flushes_log_and_heartbeats_on_sigterm(tmp_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    base = f'http://127.0.0.1:{port}'
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    with open(tmp_path / 'server.out', 'wb') as out:
+        process = subprocess.Popen([sys.executable, script, '--serve', '--host', '127.0.0.1', '--port', str(port)],
+                                   cwd=tmp_path, stdout=out, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(base + '/heartbeat-status', timeout=1).read()
+                break
+            except OSError:
+                assert process.poll() is None and time.time() < deadline, (tmp_path / 'server.out').read_text()
+                time.sleep(0.1)
+
+        def post(path, body):
+            request = urllib.request.Request(base + path, data=json.dumps(body).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            return json.loads(urllib.request.urlopen(request, timeout=5).read())
+
+        assert post('/sensor-data', {'device_id': 'term', 'pH': 6.8})['status'] == 'success'
+        assert post('/esp32-heartbeat', {'device_id': 'term'})['status'] == 'success'
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    output = (tmp_path / 'server.out').read_text()
+    assert 'Serving on' in output and 'Shutting down' in output
+    log = SensorLog(str(tmp_path / 'sensor_log'))
+    try:
+        records = np.concatenate(list(log.read(device_id='term')))
+    finally:
+        log.close()
+    assert records['pH'].tolist() == [6.8]
+    assert json.loads((tmp_path / 'esp32_heartbeat.json').read_text())['term']['count'] == 1
+
+
+@pytest.mark.parametrize('limit', ['0', '-5', 'ten'])
+def test_debug_events_reject_a_bad_limit(client, limit):
+    response = client.get(f'/debug/events?limit={limit}')
+    assert response.status_code == 400 and 'Bad query' in response.get_json()['message']
+
+
+def test_debug_events_limit(client):
+    client.post('/esp32-heartbeat', json={'device_id': 'ev'})
+    client.post('/esp32-heartbeat', json={'device_id': 'ev'})
+    assert len(client.get('/debug/events?limit=1').get_json()['events']) == 1
+
+
+def test_sensor_stats_default_to_the_last_reporting_device(client):
+    client.post('/sensor-data', json={'device_id': 'stats-a', 'pH': 6.0})
+    client.post('/sensor-data', json={'device_id': 'stats-b', 'pH': 7.0})
+    stats = client.get('/sensor-stats').get_json()
+    assert stats['device_id'] == 'stats-b'
+    assert client.get('/sensor-stats?device=stats-a').get_json()['device_id'] == 'stats-a'
+
+
+@pytest.mark.parametrize('limit', ['0', '-1'])
+def test_alerts_reject_a_non_positive_limit(client, limit):
+    assert client.get(f'/alerts?limit={limit}').status_code == 400
+    assert client.get('/alerts?limit=1').status_code == 200
@@ -0,0 +1,80 @@
+"""Tests for server_logging: sampling, the event ring and the queued writer"""
+
+import io
+import json
+import logging
+
+import pytest
+
+from server_logging import LoggingPipeline, SamplingFilter, level_number
+
+
+@pytest.fixture
+def pipeline_factory():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    pipelines = []
+
+    def make(**kwargs):
+        pipeline = LoggingPipeline(stream=io.StringIO(), **kwargs)
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield make
+    for pipeline in pipelines:
+        pipeline.stop()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def record(level, route=None):
+    entry = logging.LogRecord('test', level, __file__, 1, 'message', None, None)
+    if route:
+        entry.route = route
+    return entry
+
+
+def test_level_number():
+    assert level_number('info') == logging.INFO
+    assert level_number(logging.DEBUG) == logging.DEBUG
+    with pytest.raises(ValueError):
+        level_number('chatty')
+
+
+def test_sampling_keeps_one_in_n_per_route_and_all_warnings():
+    sampler = SamplingFilter(level_rates={'DEBUG': 0.0}, route_rates={'/busy': 0.25})
+    kept = [sampler.filter(record(logging.INFO, '/busy')) for _ in range(8)]
+    assert kept == [True, False, False, False] * 2
+    assert all(sampler.filter(record(logging.INFO, '/quiet')) for _ in range(3))
+    assert not sampler.filter(record(logging.DEBUG))
+    assert all(sampler.filter(record(logging.WARNING, '/busy')) for _ in range(3))
+    assert sampler.sampled_out == 7
+
+
+def test_ring_is_unsampled_and_output_is_sampled(pipeline_factory):
+    pipeline = pipeline_factory(level='DEBUG', fmt='json', route_rates={'/busy': 0.5})
+    log = logging.getLogger('server')
+    for i in range(4):
+        log.info('reading %d', i, extra={'route': '/busy', 'fields': {'device': 'a'}})
+    log.warning('disk slow', extra={'route': '/busy'})
+    pipeline.stop()
+
+    lines = [json.loads(line) for line in pipeline.output.stream.getvalue().splitlines()]
+    assert [event['msg'] for event in lines] == ['reading 0', 'reading 2', 'disk slow']
+    assert lines[0]['device'] == 'a' and lines[0]['route'] == '/busy'
+
+    events = pipeline.ring.recent(10)
+    assert [event['msg'] for event in events] == ['disk slow', 'reading 3', 'reading 2', 'reading 1', 'reading 0']
+    assert [event['msg'] for event in pipeline.ring.recent(10, level='warning')] == ['disk slow']
+    assert len(pipeline.ring.recent(2, route='/busy')) == 2
+    assert pipeline.stats()['sampled_out'] == 2
+
+
+def test_full_queue_drops_instead_of_blocking(pipeline_factory):
+    pipeline = pipeline_factory(queue_size=2)
+    pipeline.listener.stop()  # nobody drains the queue
+    log = logging.getLogger('server')
+    for i in range(5):
+        log.info('burst %d', i)
+    assert pipeline.stats()['dropped'] == 3
+    assert pipeline.stats()['ring_size'] == 5
@@ -0,0 +1,34 @@
+"""Tests for server_metrics: text exposition of counters, gauges and histograms"""
+
+from server_metrics import MetricsRegistry
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('route',))
+    registry.gauge('queue_depth', 'Queued items', lambda: 3)
+    registry.gauge('per_device', 'Per device', lambda: {('a',): 1.5}, ('device',))
+    requests.inc(1, '/x')
+    requests.inc(2, '/x')
+    requests.inc(1, 'say "hi"\n')
+    assert requests.value('/x') == 3
+    lines = registry.render().splitlines()
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{route="/x"} 3' in lines
+    assert 'requests_total{route="say \\"hi\\"\\n"} 1' in lines
+    assert 'queue_depth 3' in lines
+    assert 'per_device{device="a"} 1.5' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, '/x')
+    assert latency.count('/x') == 4 and latency.count('/y') == 0
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/x",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/x"} 3.65' in lines
+    assert 'latency_seconds_count{route="/x"} 4' in lines
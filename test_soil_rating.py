@@ -0,0 +1,82 @@
+"""Tests for soil_rating: the tables must rate exactly like the original if-chains"""
+
+import numpy as np
+import pytest
+
+from soil_rating import CROPS, rate, rate_readings, recommend, register_crop
+
+
+def reference_rating(param, value):
+    """The per-card rating logic soil_rating replaced"""
+    try:
+        val = float(value)
+    except (TypeError, ValueError):
+        return 'N/A'
+    if param == 'temperature':
+        return 'Optimal' if 20 <= val <= 30 else 'Good' if 15 <= val <= 35 else 'Poor'
+    if param == 'pH':
+        return 'Optimal' if 6.0 <= val <= 7.5 else 'Good' if 5.5 <= val <= 8.0 else 'Poor'
+    if param == 'moisture':
+        return 'Optimal' if 40 <= val <= 70 else 'Good' if 30 <= val <= 80 else 'Poor'
+    if param in ('nitrogen', 'phosphorus', 'potassium'):
+        return 'High' if val >= 50 else 'Medium' if val >= 25 else 'Low'
+    return 'Normal'
+
+
+def reference_recommendation(nitrogen, phosphorus, potassium):
+    if nitrogen < 30:
+        advice = 'High Nitrogen needed - Urea 300kg/ha'
+    elif nitrogen < 50:
+        advice = 'Medium Nitrogen - Urea 200kg/ha'
+    else:
+        advice = 'Low Nitrogen - Urea 100kg/ha'
+    return advice, f'NPK Complex based on N:{nitrogen:.0f} P:{phosphorus:.0f} K:{potassium:.0f}'
+
+
+def probe_values():
+    """Every threshold, just either side of it, plus a spread of ordinary values"""
+    edges = [5.5, 6.0, 7.5, 8.0, 15, 20, 25, 30, 35, 40, 50, 70, 80]
+    values = [edge + delta for edge in edges for delta in (-1e-9, 0, 1e-9)]
+    return values + list(np.linspace(-10, 120, 261))
+
+
+@pytest.mark.parametrize('param', ['temperature', 'pH', 'moisture', 'nitrogen', 'phosphorus', 'potassium', 'salinity'])
+def test_ratings_match_the_original_thresholds(param):
+    values = probe_values()
+    expected = [reference_rating(param, value) for value in values]
+    assert list(rate(param, values)) == expected
+    assert [rate(param, value) for value in values[:20]] == expected[:20]
+
+
+def test_text_values_and_aliases():
+    assert rate('ph', '6.8') == 'Optimal'
+    assert rate('soil_moisture', '25') == 'Poor'
+    assert rate('nitrogen', 'n/a') == 'N/A'
+    assert list(rate('nitrogen', ['10', None, 60])) == ['Low', 'N/A', 'High']
+    assert rate_readings({'pH': 6.8, 'potassium': [10, 60]})['potassium'].tolist() == ['Low', 'High']
+
+
+def test_crop_thresholds_override_the_defaults():
+    assert rate('pH', 7.0) == 'Optimal'
+    assert rate('pH', 7.0, crop='rice') == 'Good'
+    assert rate('pH', 7.0, crop='Unknown') == 'Optimal'
+    register_crop('Millet', 'Millet', '2.0 t/ha', {'pH': {'kind': 'band', 'optimal': (7.0, 8.0), 'good': (6.5, 8.5)}})
+    try:
+        assert rate('pH', 6.8, crop='millet') == 'Good'
+        assert recommend(crop='millet')['yield'] == '2.0 t/ha'
+    finally:
+        del CROPS['millet']
+
+
+@pytest.mark.parametrize('nitrogen', [0, 29.9, 30, 49.5, 50, 51, 200])
+def test_recommendation_matches_the_original(nitrogen):
+    result = recommend(nitrogen, 30, 80)
+    assert (result['fert_combo1'], result['fert_combo2']) == reference_recommendation(nitrogen, 30, 80)
+    assert (result['crop'], result['yield']) == ('Mixed Vegetables', '4.0 t/ha')
+
+
+def test_recommendation_defaults_and_arrays():
+    assert (recommend()['fert_combo1'], recommend()['fert_combo2']) == reference_recommendation(50, 30, 80)
+    result = recommend(nitrogen=[10, 40, 60], phosphorus=30, potassium=80)
+    assert list(result['fert_combo1']) == [reference_recommendation(n, 30, 80)[0] for n in (10, 40, 60)]
+    assert recommend(nitrogen='?')['fert_combo1'] == 'Nitrogen not measured'